@@ -0,0 +1,47 @@
+"""
+Throughput benchmark for batched decryption.
+Compares UserAuth.decrypt() called in a loop against UserAuth.decrypt_many(),
+on one thread and on the thread pool, for result sets of each size.
+
+Run from the repository root:
+    python -m benchmarks.bench_decrypt [-n COUNT [COUNT ...]] [--repeat REPEAT] [--workers WORKERS]
+"""
+import argparse, os
+
+from pypass.helpers import generate_key
+from pypass.masterauth import UserAuth
+from pypass.params import CRYPTO_CHUNK_SIZE
+from benchmarks.bench_generator import bench
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, nargs='+', default=[1000, 100000], help='Tokens decrypted per run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, best one is reported')
+    parser.add_argument('--workers', type=int, default=0, help='Threads of decrypt_many(), 0: one per CPU')
+    parser.add_argument('--chunk-size', type=int, default=CRYPTO_CHUNK_SIZE, help='Tokens per chunk')
+    args = parser.parse_args()
+
+    master_key, _ = generate_key('benchmark')
+    user_auth = UserAuth('benchmark', master_key, connect=False)
+    workers = args.workers or os.cpu_count() or 1
+    print(f"{workers} threads, chunks of {args.chunk_size}, best of {args.repeat} runs")
+
+    for n in args.count:
+        tokens = user_auth.encrypt_many([f'password{i:08d}' for i in range(n)], workers=workers)
+        expected = [user_auth.decrypt(token) for token in tokens]
+        if user_auth.decrypt_many(tokens, workers=workers, chunk_size=args.chunk_size) != expected:
+            raise SystemExit("decrypt_many() returned different results than decrypt().")
+
+        results = [
+            ('decrypt (loop)', bench(lambda: [user_auth.decrypt(token) for token in tokens], args.repeat)),
+            ('decrypt_many (1 thread)', bench(lambda: user_auth.decrypt_many(tokens, workers=1), args.repeat)),
+            (f'decrypt_many ({workers} threads)', bench(lambda: \
+                user_auth.decrypt_many(tokens, workers=workers, chunk_size=args.chunk_size), args.repeat)),
+        ]
+        baseline = results[0][1]
+        print(f"\n{n} tokens")
+        for name, elapsed in results:
+            print(f"{name:<28} {elapsed * 1000:10.1f} ms {n / elapsed:12.0f} tokens/s {baseline / elapsed:6.2f}x")
+
+if __name__ == "__main__":
+    main()
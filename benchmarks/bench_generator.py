@@ -0,0 +1,42 @@
+"""
+Throughput benchmark for the password generator.
+Compares generate_strong_random_pw() called in a loop against the batch generate_passwords().
+
+Run from the repository root:
+    python -m benchmarks.bench_generator [-n COUNT] [--repeat REPEAT]
+"""
+import argparse, time
+
+from pypass.generator import generate_strong_random_pw, generate_passwords, is_password_strong
+
+def bench(func, repeat:int)->float:
+    """Returns the best wall-clock time of func() over repeat runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=10000, help='Passwords generated per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, best one is reported')
+    args = parser.parse_args()
+    n = args.count
+
+    # Sanity check before timing
+    if not all(is_password_strong(pw) for pw in generate_passwords(n)):
+        raise SystemExit("generate_passwords() returned a password that is not strong.")
+
+    results = [
+        ('generate_strong_random_pw (loop)', bench(lambda: [generate_strong_random_pw() for _ in range(n)], args.repeat)),
+        ('generate_passwords (batch)', bench(lambda: generate_passwords(n), args.repeat)),
+    ]
+    baseline = results[0][1]
+    print(f"{n} passwords, best of {args.repeat} runs")
+    for name, elapsed in results:
+        print(f"{name:<34} {elapsed * 1000:10.1f} ms {n / elapsed:12.0f} pw/s {baseline / elapsed:6.2f}x")
+
+if __name__ == "__main__":
+    main()
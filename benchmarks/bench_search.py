@@ -0,0 +1,61 @@
+"""
+Latency benchmark for entry search.
+Compares the full-text index (FTS5 trigram, ranked by bm25) with LIKE '%query%' scans of the
+credentials table, on a throwaway vault of generated entries. Only names and URLs are filled in:
+search reads nothing else.
+
+Run from the repository root:
+    python -m benchmarks.bench_search [-n COUNT] [--repeat REPEAT] [--query QUERY ...]
+"""
+import os, time, random, argparse, tempfile
+
+from pypass.params import DB_TABLE
+from pypass.dbconn import get_connection, close_connection
+from pypass.migrations import VAULT_MIGRATIONS
+from pypass.helpers import search_index_available, search_sql
+from benchmarks.bench_generator import bench
+
+WORDS = ['mail', 'bank', 'cloud', 'shop', 'news', 'forum', 'games', 'music', 'photo', 'travel',
+    'work', 'school', 'health', 'energy', 'router', 'server', 'stream', 'social', 'crypto', 'store']
+
+def fill_vault(conn, n:int):
+    rng = random.Random(0)
+    def entry(i:int)->tuple:
+        first, second = rng.choice(WORDS), rng.choice(WORDS)
+        return (f'{first.title()} {second} {i}', f'https://{first}{i}.{second}.example.com/login')
+    with conn:
+        conn.executemany(f'INSERT INTO {DB_TABLE}(name, url) VALUES (?, ?)', [entry(i) for i in range(n)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=100000, help='Entries in the vault')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, best one is reported')
+    parser.add_argument('--query', nargs='+', default=['42424', 'router42', 'cloud stream', 'mail', 'ail'], \
+        help='Search queries')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.db')
+        conn = get_connection(path, migrations=VAULT_MIGRATIONS)
+        if not search_index_available(conn):
+            raise SystemExit("This SQLite has no FTS5 trigram tokenizer, searches use LIKE.")
+        start = time.perf_counter()
+        fill_vault(conn, args.count)
+        print(f"{args.count} entries added in {time.perf_counter() - start:.2f} s, including the index")
+        print(f"Best of {args.repeat} runs\n")
+
+        print(f"{'query':<16} {'results':>8} {'LIKE':>12} {'FTS5':>12} {'speedup':>8}")
+        for query in args.query:
+            like_sql, like_params = search_sql(query, use_index=False)
+            fts_sql, fts_params = search_sql(query)
+            like_rows = conn.execute(like_sql, like_params).fetchall()
+            fts_rows = conn.execute(fts_sql, fts_params).fetchall()
+            if sorted(fts_rows) != sorted(like_rows):
+                raise SystemExit(f"The index returned different entries than LIKE for {query!r}.")
+            like = bench(lambda: conn.execute(like_sql, like_params).fetchall(), args.repeat)
+            fts = bench(lambda: conn.execute(fts_sql, fts_params).fetchall(), args.repeat)
+            print(f"{query:<16} {len(fts_rows):>8} {like * 1000:9.2f} ms {fts * 1000:9.2f} ms {like / fts:7.1f}x")
+        close_connection(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Startup benchmark, based on python -X importtime.
+Runs the startup path of PyPass (the checks of run.py, then importing pypass.pypass) in a fresh
+interpreter, and reports the wall-clock time and the cumulative import time of each top-level module.
+
+Exits with a non-zero status if a module that is only needed by some commands is imported on
+startup, or if the import time exceeds --max-ms, so the startup gains are not lost again.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeat REPEAT] [--top TOP] [--max-ms MS]
+"""
+import argparse, subprocess, sys, time
+
+STARTUP_CODE = 'import run; run.need_setup(); import pypass.pypass'
+# Imported by the commands that need them, never on startup
+LAZY_MODULES = ['pyfiglet', 'rich', 'keyboard', 'pyperclip', 'webbrowser', 'multiprocessing', 'pypass.audit', 'PyInquirer']
+
+def measure_startup()->tuple[float, dict, set]:
+    """
+    (Returns)
+        (wall-clock seconds, {top-level module: cumulative import microseconds}, names of all imported modules)
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE], \
+        capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+
+    top_level = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue # Header
+        imported.add(name.strip())
+        # Nested imports are indented by two spaces per level
+        if len(name) - len(name.lstrip()) == 1:
+            top_level[name.strip()] = int(cumulative)
+    return elapsed, top_level, imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, best one is reported')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest modules to list')
+    parser.add_argument('--max-ms', type=float, default=0, help='Fail if imports take longer, 0: no limit')
+    args = parser.parse_args()
+
+    best_elapsed = float('inf')
+    best_modules = {}
+    imported = set()
+    for _ in range(args.repeat):
+        elapsed, top_level, imported = measure_startup()
+        best_elapsed = min(best_elapsed, elapsed)
+        for name, us in top_level.items():
+            best_modules[name] = min(best_modules.get(name, us), us)
+    import_ms = sum(best_modules.values()) / 1000
+
+    print(f"Startup, best of {args.repeat} runs: {best_elapsed * 1000:.1f} ms wall-clock, {import_ms:.1f} ms importing")
+    for name, us in sorted(best_modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40} {us / 1000:8.1f} ms")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        print(f"Imported on startup, but should be imported lazily: {', '.join(eager)}")
+        failed = True
+    if args.max_ms and import_ms > args.max_ms:
+        print(f"Imports took {import_ms:.1f} ms, more than the limit of {args.max_ms:.1f} ms")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
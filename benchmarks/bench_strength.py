@@ -0,0 +1,43 @@
+"""
+Per-call latency benchmark for the password strength estimator.
+The estimator runs on every keystroke of the password prompt, so calls should stay under 1 ms.
+
+Run from the repository root:
+    python -m benchmarks.bench_strength [-n COUNT]
+"""
+import argparse, time
+
+from pypass.generator import generate_passwords
+from pypass.strength import estimate_strength, load_dict_trie
+
+SAMPLE_PASSWORDS = [
+    'Password1!', 'p@ssw0rd', 'qwerty123', 'zaq1@WSX', 'john1990', '19900415',
+    'Tr0ub4dour&3', 'correcthorsebatterystaple', 'hello-world', 'aaaaaaaaaaaa'
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=2000, help='Number of random passwords to add to the samples')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    load_dict_trie()
+    print(f"Dictionary loaded in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    samples = SAMPLE_PASSWORDS + generate_passwords(args.count)
+    # Every prefix, as typed one key at a time
+    keystrokes = [pw[:i] for pw in samples for i in range(1, len(pw) + 1)]
+    latencies = []
+    for pw in keystrokes:
+        start = time.perf_counter()
+        estimate_strength(pw)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"{len(keystrokes)} calls: p50 {percentile(0.5):.3f} ms, p99 {percentile(0.99):.3f} ms, " + \
+        f"max {latencies[-1] * 1000:.3f} ms")
+
+if __name__ == "__main__":
+    main()
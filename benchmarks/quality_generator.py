@@ -0,0 +1,214 @@
+"""
+Statistical quality and throughput harness for the password generator.
+
+Generates passwords in batches through the pypass.generator API and streams them into
+incremental statistics, so memory use does not grow with the number of passwords:
+  * chi-square of the character class distribution at each position
+  * chi-square of the character distribution within each class
+  * run length distribution, checked against max_consecutive_same_characters()
+  * estimated entropy per character and per password
+Exits with a non-zero status if any check fails.
+
+Run from the repository root:
+    python -m benchmarks.quality_generator [-n COUNT] [--generator batch|legacy] [--policy POLICY]
+"""
+import argparse, math, re, time
+from collections import Counter
+
+from pypass.generator import *
+from pypass.policy import compile_policy
+
+# Character class of each character, as a single letter
+CLASS_NAMES = {'U': ALPHABET_UPPER, 'L': ALPHABET_LOWER, 'D': NUMBERS, 'S': SPECIAL_CHARS}
+CLASS_OF = str.maketrans({ch: name for name, charset in CLASS_NAMES.items() for ch in charset})
+
+RE_RUN = re.compile(r'(.)\1*', re.DOTALL)
+
+def chi_square_sf(x:float, df:int)->float:
+    """
+    Probability of a chi-square statistic of at least x with df degrees of freedom.
+    Uses the Wilson-Hilferty approximation, which is good enough to flag biased output.
+    """
+    if df <= 0:
+        return 1.0
+    if x <= 0:
+        return 1.0
+    h = 2 / (9 * df)
+    z = ((x / df) ** (1 / 3) - (1 - h)) / math.sqrt(h)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def chi_square(observed:list, expected:list)->float:
+    return sum((o - e) ** 2 / e for o, e in zip(observed, expected) if e > 0)
+
+class GeneratorStats:
+    """Incremental statistics over a stream of password batches"""
+    def __init__(self, max_run_allowed:int, *, check_strong:bool=True, check_every:int=97):
+        self.max_run_allowed = max_run_allowed
+        self.check_strong = check_strong
+        self.check_every = check_every
+        self.n_passwords = 0
+        self.n_chars = 0
+        self.lengths = Counter()
+        self.chars = Counter()
+        # length -> position -> Counter of class letters
+        # Kept per length, because the share of required characters depends on the length
+        self.position_classes = {}
+        self.max_runs = Counter() # longest run in a password -> number of passwords
+        self.run_mismatches = 0
+        self.not_strong = 0
+
+    def update(self, batch:list):
+        self.n_passwords += len(batch)
+        self.chars.update(''.join(batch))
+
+        # Group by length, so that each position is a strided slice of one joined string
+        by_length = {}
+        for pw in batch:
+            by_length.setdefault(len(pw), []).append(pw.translate(CLASS_OF))
+        for pw_len, class_strs in by_length.items():
+            self.lengths[pw_len] += len(class_strs)
+            self.n_chars += pw_len * len(class_strs)
+            if pw_len not in self.position_classes:
+                self.position_classes[pw_len] = [Counter() for _ in range(pw_len)]
+            joined = ''.join(class_strs)
+            for pos in range(pw_len):
+                column = joined[pos::pw_len]
+                counter = self.position_classes[pw_len][pos]
+                for name in CLASS_NAMES:
+                    counter[name] += column.count(name)
+
+        for i, pw in enumerate(batch):
+            max_run = max(len(m.group()) for m in RE_RUN.finditer(pw))
+            self.max_runs[max_run] += 1
+            # Cross-check a sample against the generator's own helpers
+            if (self.n_passwords + i) % self.check_every == 0:
+                if max_consecutive_same_characters(pw) != max_run:
+                    self.run_mismatches += 1
+                if self.check_strong and not is_password_strong(pw):
+                    self.not_strong += 1
+
+    def entropy_per_char(self)->float:
+        """Shannon entropy of the observed character distribution, in bits"""
+        return -sum(cnt / self.n_chars * math.log2(cnt / self.n_chars) for cnt in self.chars.values())
+
+    def report(self, alpha:float)->bool:
+        """Print the report. Returns True if all checks passed."""
+        passed = True
+
+        # Class distribution at each position, against the class distribution of passwords
+        # with the same length. Statistics of the different lengths are summed up per position.
+        n_positions = max(self.position_classes, default=0)
+        pos_stats = [[0.0, 0, Counter()] for _ in range(n_positions)] # chi2, df, class counts
+        for pw_len, counters in self.position_classes.items():
+            class_totals = Counter()
+            for counter in counters:
+                class_totals.update(counter)
+            for pos, counter in enumerate(counters):
+                observed = [counter[name] for name in CLASS_NAMES]
+                expected = [class_totals[name] / pw_len for name in CLASS_NAMES]
+                pos_stats[pos][0] += chi_square(observed, expected)
+                pos_stats[pos][1] += sum(e > 0 for e in expected) - 1
+                pos_stats[pos][2].update(counter)
+
+        # Bonferroni correction, since every position is a separate test
+        pos_alpha = alpha / max(n_positions, 1)
+        print("\nCharacter class distribution per position (U/L/D/S %):")
+        for pos, (stat, df, counter) in enumerate(pos_stats):
+            total = sum(counter.values())
+            observed = [counter[name] for name in CLASS_NAMES]
+            p = chi_square_sf(stat, df)
+            flag = ''
+            if p < pos_alpha:
+                flag = '  <-- BIASED'
+                passed = False
+            shares = ' '.join(f"{o / total * 100:5.1f}" for o in observed)
+            print(f"  pos {pos:3d}  n={total:<10d} {shares}  chi2={stat:8.2f} df={df:3d} p={p:.4f}{flag}")
+
+        # Character distribution within each class, against uniform
+        print("\nCharacter distribution within each class:")
+        for name, charset in CLASS_NAMES.items():
+            observed = [self.chars[ch] for ch in charset]
+            total = sum(observed)
+            if not total:
+                print(f"  {name}: not used")
+                continue
+            stat = chi_square(observed, [total / len(charset)] * len(charset))
+            p = chi_square_sf(stat, len(charset) - 1)
+            flag = ''
+            if p < alpha:
+                flag = '  <-- BIASED'
+                passed = False
+            print(f"  {name}: n={total:<10d} chi2={stat:8.2f} df={len(charset) - 1:3d} p={p:.4f}{flag}")
+
+        # Runs
+        print("\nLongest run of the same character per password:")
+        for run_len in sorted(self.max_runs):
+            flag = ''
+            if run_len > self.max_run_allowed:
+                flag = '  <-- NOT ALLOWED'
+                passed = False
+            print(f"  {run_len:3d}: {self.max_runs[run_len]}{flag}")
+        if self.run_mismatches:
+            print(f"  max_consecutive_same_characters() disagreed on {self.run_mismatches} sampled passwords")
+            passed = False
+        if self.not_strong:
+            print(f"  is_password_strong() rejected {self.not_strong} sampled passwords")
+            passed = False
+
+        # Entropy
+        used = sum(1 for cnt in self.chars.values() if cnt)
+        length_entropy = -sum(cnt / self.n_passwords * math.log2(cnt / self.n_passwords) \
+            for cnt in self.lengths.values())
+        avg_len = self.n_chars / self.n_passwords
+        h_char = self.entropy_per_char()
+        print("\nEntropy estimate:")
+        print(f"  {used} distinct characters, max {math.log2(used):.3f} bits/char")
+        print(f"  observed {h_char:.3f} bits/char, average length {avg_len:.2f}")
+        print(f"  ~{h_char * avg_len + length_entropy:.1f} bits/password (incl. {length_entropy:.2f} bits of length)")
+
+        return passed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=1000000, help='Number of passwords to generate')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Passwords generated per batch')
+    parser.add_argument('--generator', choices=['batch', 'legacy'], default='batch', \
+        help='batch: generate_passwords(), legacy: generate_strong_random_pw()')
+    parser.add_argument('--policy', default=None, help='Generate through a compiled password policy')
+    parser.add_argument('--alpha', type=float, default=0.001, help='Significance level of the chi-square tests')
+    args = parser.parse_args()
+
+    max_run_allowed = PARAM_STRONG_PW_MAX_CONS - 1
+    if args.policy is not None:
+        policy = compile_policy(args.policy)
+        generate = policy.generate
+        max_run_allowed = policy.max_run
+    elif args.generator == 'batch':
+        generate = generate_passwords
+    else:
+        generate = lambda n: [generate_strong_random_pw() for _ in range(n)]
+
+    # Passwords of a custom policy need not follow the default rules
+    stats = GeneratorStats(max_run_allowed, check_strong=args.policy is None)
+    gen_time = 0.0
+    stats_time = 0.0
+    remaining = args.count
+    while remaining > 0:
+        size = min(args.batch_size, remaining)
+        start = time.perf_counter()
+        batch = generate(size)
+        gen_time += time.perf_counter() - start
+        start = time.perf_counter()
+        stats.update(batch)
+        stats_time += time.perf_counter() - start
+        remaining -= size
+
+    print(f"Generated {stats.n_passwords} passwords in {gen_time:.2f} s " + \
+        f"({stats.n_passwords / gen_time:.0f} pw/s), statistics took {stats_time:.2f} s")
+    passed = stats.report(args.alpha)
+    print("\nPASSED" if passed else "\nFAILED")
+    if not passed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Multi-process stress test of concurrent edits to one vault.
+
+Several processes increment counters kept in the names of a few shared entries, as read-modify-write
+cycles: read the entry, then update it with the row_version that was read. An update that lost the
+race raises EntryConflictError, and the process reads the entry again and retries. At the end, every
+counter must equal the number of increments made to it, and every entry must pass its signature and
+Merkle checks. With --checked false, the same run shows the updates that blind overwrites lose.
+
+A throwaway vault is created in a temporary directory. Run from the repository root:
+    python -m benchmarks.stress_concurrency [--processes 8] [--increments 50] [--entries 2]
+"""
+import os, sys, time, random, argparse, tempfile, multiprocessing
+
+COUNTER_PREFIX = 'counter-'
+USERNAME = 'stress'
+
+def create_vault(n_entries:int)->bytes:
+    """Create a user and its counters in the data directory of the working directory. Returns the data key."""
+    from cryptography.fernet import Fernet
+    from pypass.params import DATA_DNAME
+    from pypass.helpers import generate_key, db_add_entry
+    from pypass import masterauth
+    os.makedirs(DATA_DNAME)
+    # Fast scrypt parameters: key derivation is not what is measured
+    kdf_params = (2 ** 10, 8, 1)
+    pw_key, salt = generate_key('stress', kdf_params=kdf_params)
+    data_key = Fernet.generate_key()
+    conn = masterauth.master_db_connect()
+    user_auth = masterauth.UserAuth(USERNAME, data_key)
+    masterauth.master_db_add_entry(user_auth, conn, USERNAME, salt, \
+        masterauth.wrap_data_key(pw_key, data_key, USERNAME), kdf_params)
+    user_auth.rebuild_merkle_tree()
+    for _ in range(n_entries):
+        db_add_entry(user_auth, COUNTER_PREFIX + '0', 'stress', 'Str3ss-test-pw!')
+    return data_key
+
+def worker(workdir:str, data_key:bytes, increments:int, checked:bool, seed:int)->tuple[list, int]:
+    """
+    Increment random counters. Returns ([increments made to each entry], number of conflicts).
+    """
+    os.chdir(workdir)
+    from pypass.params import DB_COLUMNS, DB_TABLE
+    from pypass.helpers import get_entry_by_id, db_update_entry, EntryConflictError
+    from pypass.masterauth import UserAuth
+    user_auth = UserAuth(USERNAME, data_key)
+    entry_ids = [row[0] for row in user_auth.conn.execute(f'SELECT entry_id FROM {DB_TABLE} ORDER BY entry_id')]
+    rng = random.Random(seed)
+    made = [0] * len(entry_ids)
+    conflicts = 0
+    for _ in range(increments):
+        idx = rng.randrange(len(entry_ids))
+        while True:
+            row = get_entry_by_id(user_auth, entry_ids[idx])
+            count = int(row[DB_COLUMNS['name']['index']][len(COUNTER_PREFIX):])
+            version = row[DB_COLUMNS['row_version']['index']] if checked else None
+            try:
+                if not db_update_entry(user_auth, entry_ids[idx], name=f'{COUNTER_PREFIX}{count + 1}', \
+                    expected_version=version):
+                    raise RuntimeError("Update failed.")
+                break
+            except EntryConflictError:
+                conflicts += 1
+        made[idx] += 1
+    return made, conflicts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--increments', type=int, default=50, help='Increments per process')
+    parser.add_argument('--entries', type=int, default=2, help='Shared counters, fewer means more contention')
+    parser.add_argument('--checked', type=lambda value: value.lower() != 'false', default=True, \
+        help="'false' to update without row_version checks")
+    args = parser.parse_args()
+
+    # Workers import pypass from here
+    sys.path.insert(0, os.getcwd())
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            data_key = create_vault(args.entries)
+            ctx = multiprocessing.get_context('spawn')
+            start = time.perf_counter()
+            with ctx.Pool(args.processes) as pool:
+                results = pool.starmap(worker, [(workdir, data_key, args.increments, args.checked, seed) \
+                    for seed in range(args.processes)])
+            elapsed = time.perf_counter() - start
+
+            from pypass.params import DB_COLUMNS, DB_TABLE
+            from pypass.masterauth import UserAuth
+            user_auth = UserAuth(USERNAME, data_key)
+            rows = user_auth.conn.execute(f'SELECT * FROM {DB_TABLE} ORDER BY entry_id').fetchall()
+            expected = [sum(made[idx] for made, _ in results) for idx in range(len(rows))]
+            counts = [int(row[DB_COLUMNS['name']['index']][len(COUNTER_PREFIX):]) for row in rows]
+            invalid = user_auth.verify_all(full=True)
+            root_valid = user_auth.check_merkle_root(full=True)
+            del user_auth
+        finally:
+            from pypass.dbconn import close_thread_connections
+            close_thread_connections()
+            os.chdir(cwd)
+
+    n_updates = args.processes * args.increments
+    n_conflicts = sum(conflicts for _, conflicts in results)
+    lost = sum(expected) - sum(counts)
+    print(f"{n_updates} updates by {args.processes} processes on {args.entries} entries in {elapsed:.2f} s "
+        f"({n_updates / elapsed:.0f} updates/s), {n_conflicts} conflicts retried")
+    print(f"Counters: {counts}, expected: {expected}, lost updates: {lost}")
+    print(f"Invalid signatures: {invalid}, Merkle root valid: {root_valid}")
+    if lost or invalid or not root_valid:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
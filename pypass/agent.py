@@ -0,0 +1,301 @@
+"""
+Unlock agent, in the manner of ssh-agent.
+
+The agent authenticates once, then keeps the unlocked vault in a background process and serves
+requests over a Unix domain socket that only the owner can open. Later invocations ask the agent
+instead of deriving the key again. The agent locks, wiping its keys, and exits after
+AGENT_IDLE_TIMEOUT seconds without a request, or when asked to.
+
+Protocol: one JSON object per line in each direction. A connection may send several requests.
+    {"op": "search", "query": "mail"}             -> {"ok": true, "result": [entry, ...]}
+    {"op": "get", "entry_id": 3}                   -> {"ok": true, "result": entry}
+    {"op": "decrypt", "entry_id": 3, "column": "user_pw"}
+    {"op": "ping"}, {"op": "lock"}
+Errors are returned as {"ok": false, "error": "..."}. Search results do not include passwords.
+
+The client side only needs the standard library, so it starts fast:
+    python -m pypass.agent start [--timeout SECONDS] [--foreground]
+    python -m pypass.agent search QUERY
+    python -m pypass.agent get ENTRY_ID
+    python -m pypass.agent decrypt ENTRY_ID [COLUMN]
+    python -m pypass.agent status | stop
+"""
+import os, sys, json, time, socket, struct, argparse, contextlib
+
+from pypass.params import *
+from pypass.consts import *
+
+class AgentError(Exception):
+    pass
+
+def agent_socket_path()->str:
+    return os.environ.get(AGENT_SOCKET_ENV) or os.path.join(DATA_DNAME, AGENT_SOCKET_FNAME)
+
+def agent_supported()->bool:
+    return hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork')
+
+# ######### CLIENT #########
+
+class AgentClient:
+    """A connection to a running agent"""
+    def __init__(self, path:str=''):
+        self.path = path or agent_socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.path)
+        except OSError:
+            self.sock.close()
+            raise AgentError(ERROR_AGENT_NOT_RUNNING.format(self.path))
+        self.file = self.sock.makefile('rwb')
+
+    def request(self, op:str, **args):
+        """Send a request, and return its result. Raises AgentError if the agent returns an error."""
+        self.file.write(json.dumps({'op': op, **args}).encode(HASH_ENCODING) + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise AgentError(ERROR_AGENT_NOT_RUNNING.format(self.path))
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise AgentError(response.get('error', ''))
+        return response.get('result')
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def agent_request(op:str, path:str='', **args):
+    """Send a single request to the agent"""
+    with AgentClient(path) as client:
+        return client.request(op, **args)
+
+def agent_running(path:str='')->bool:
+    try:
+        agent_request('ping', path)
+        return True
+    except (AgentError, OSError, ValueError):
+        return False
+
+# ######### SERVER #########
+
+def get_verified_row(user_auth, request:dict):
+    """The row of the requested entry, if its signature and Merkle membership check out"""
+    from pypass.helpers import get_verified_entry
+    entry_id = request.get('entry_id')
+    if type(entry_id) != int:
+        raise AgentError("'entry_id' must be an integer.")
+    return get_verified_entry(user_auth, entry_id)
+
+def op_ping(user_auth, request:dict):
+    return {'username': user_auth.username, 'pid': os.getpid()}
+
+def op_search(user_auth, request:dict):
+    from pypass.helpers import get_multiple_entries, decrypt_rows, entry_to_json
+    query = request.get('query')
+    if type(query) != str or not SEARCH_QUERY_MIN_LEN <= len(query) <= SEARCH_QUERY_MAX_LEN:
+        raise AgentError(f"'query' must be {SEARCH_QUERY_MIN_LEN} to {SEARCH_QUERY_MAX_LEN} characters long.")
+    rows = get_multiple_entries(user_auth, query)
+    return [entry_to_json(entry, ['user_pw']) for entry in decrypt_rows(rows, user_auth, to_dict=True)]
+
+def op_get(user_auth, request:dict):
+    from pypass.helpers import decrypt_row, entry_to_json
+    row = get_verified_row(user_auth, request)
+    return entry_to_json(decrypt_row(row, user_auth, decrypt_pw=True, to_dict=True))
+
+def op_decrypt(user_auth, request:dict):
+    column = request.get('column', 'user_pw')
+    if column not in DB_COLUMNS or not DB_COLUMNS[column]['encrypted']:
+        raise AgentError(f"'{column}' is not an encrypted column.")
+    row = get_verified_row(user_auth, request)
+    value = user_auth.decrypt_entry_value(row[DB_COLUMNS['entry_id']['index']], \
+        row[DB_COLUMNS['entry_hash']['index']], column, row[DB_COLUMNS[column]['index']])
+    return value.decode(HASH_ENCODING)
+
+AGENT_OPS = {
+    'ping': op_ping,
+    'search': op_search,
+    'get': op_get,
+    'decrypt': op_decrypt,
+}
+
+def peer_allowed(conn:socket.socket)->bool:
+    """Only processes of the same user may connect. Elsewhere, the socket file permissions apply."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+def handle_connection(conn:socket.socket, user_auth)->bool:
+    """Serve the requests of a connection. Returns False if the agent was asked to lock."""
+    import sqlite3
+    conn.settimeout(AGENT_CLIENT_TIMEOUT)
+    with conn.makefile('rwb') as f:
+        while True:
+            try:
+                line = f.readline(AGENT_MAX_REQUEST_SIZE + 1)
+            except OSError:
+                return True
+            if not line:
+                return True
+            response = {'ok': True}
+            running = True
+            try:
+                if len(line) > AGENT_MAX_REQUEST_SIZE:
+                    raise AgentError("Request too large.")
+                request = json.loads(line)
+                if type(request) != dict:
+                    raise AgentError("A request must be a JSON object.")
+                if request.get('op') == 'lock':
+                    running = False
+                elif request.get('op') in AGENT_OPS:
+                    response['result'] = AGENT_OPS[request['op']](user_auth, request)
+                else:
+                    raise AgentError(f"Unknown op {request.get('op')!r}.")
+            except (AgentError, ValueError) as e:
+                response = {'ok': False, 'error': str(e)}
+            except sqlite3.DatabaseError:
+                response = {'ok': False, 'error': ERROR_DATABASE_ERROR}
+            except Exception as e:
+                # A bad request must not take the agent down
+                response = {'ok': False, 'error': f"Internal error: {type(e).__name__}"}
+            try:
+                f.write(json.dumps(response).encode(HASH_ENCODING) + b'\n')
+                f.flush()
+            except (OSError, TypeError, ValueError):
+                return running
+            if not running:
+                return False
+
+def bind_agent_socket(path:str)->socket.socket:
+    """Listen on a socket that only the owner can open. Replaces the socket of an agent that is gone."""
+    if os.path.exists(path):
+        if agent_running(path):
+            raise AgentError(ERROR_AGENT_ALREADY_RUNNING.format(path))
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    server.listen()
+    return server
+
+def serve(server:socket.socket, path:str, username:str, data_key:bytes, idle_timeout:float):
+    """Serve requests until the agent is idle for idle_timeout seconds, or is asked to lock"""
+    from pypass.masterauth import UserAuth
+    user_auth = UserAuth(username, data_key, cache_size=ENTRY_CACHE_SIZE)
+    try:
+        running = True
+        deadline = time.monotonic() + idle_timeout
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            server.settimeout(remaining)
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+            with conn:
+                if peer_allowed(conn):
+                    running = handle_connection(conn, user_auth)
+            deadline = time.monotonic() + idle_timeout
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        # Overwrites the keys
+        del user_auth
+
+def start_agent(idle_timeout:float=AGENT_IDLE_TIMEOUT, *, foreground:bool=False, path:str='')->int:
+    """
+    Authenticate the user, and start an agent holding their unlocked vault.
+    Returns the process ID of the agent, after it stops if foreground is set.
+    """
+    if not agent_supported():
+        raise AgentError(ERROR_AGENT_UNSUPPORTED)
+    from pypass.masterauth import authenticate
+    path = path or agent_socket_path()
+    server = bind_agent_socket(path)
+    try:
+        # stdout only carries the export line, which the shell evaluates: prompts and messages go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            user_auth = authenticate()
+    except BaseException:
+        server.close()
+        os.unlink(path)
+        raise
+    if user_auth is None:
+        server.close()
+        os.unlink(path)
+        raise AgentError(ERROR_INIT_FAIL)
+    username, data_key = user_auth.username, user_auth.master_key
+    # SQLite connections must not be carried over fork(). The agent opens its own.
+    del user_auth
+
+    if foreground:
+        serve(server, path, username, data_key, idle_timeout)
+        return os.getpid()
+
+    pid = os.fork()
+    if pid:
+        server.close()
+        return pid
+    # Detach from the terminal
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in range(3):
+        os.dup2(devnull, fd)
+    try:
+        serve(server, path, username, data_key, idle_timeout)
+    finally:
+        os._exit(0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    start_parser = subparsers.add_parser('start', help='Authenticate and start the agent')
+    start_parser.add_argument('--timeout', type=float, default=AGENT_IDLE_TIMEOUT, help='Idle seconds before locking')
+    start_parser.add_argument('--foreground', action='store_true', help='Do not detach')
+    subparsers.add_parser('stop', help='Lock the agent')
+    subparsers.add_parser('status', help='Show the user of the running agent')
+    search_parser = subparsers.add_parser('search', help='Search entries by name and URL')
+    search_parser.add_argument('query')
+    get_parser = subparsers.add_parser('get', help='Print an entry, with its password')
+    get_parser.add_argument('entry_id', type=int)
+    decrypt_parser = subparsers.add_parser('decrypt', help='Print a single value of an entry')
+    decrypt_parser.add_argument('entry_id', type=int)
+    decrypt_parser.add_argument('column', nargs='?', default='user_pw')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'start':
+            pid = start_agent(args.timeout, foreground=args.foreground)
+            if not args.foreground:
+                print(PROMPT_AGENT_STARTED.format(pid, args.timeout), file=sys.stderr)
+                print(f"{AGENT_SOCKET_ENV}={os.path.abspath(agent_socket_path())}; export {AGENT_SOCKET_ENV};")
+        elif args.command == 'stop':
+            agent_request('lock')
+        elif args.command == 'status':
+            print(json.dumps(agent_request('ping')))
+        elif args.command == 'search':
+            for entry in agent_request('search', query=args.query):
+                print(json.dumps(entry))
+        elif args.command == 'get':
+            print(json.dumps(agent_request('get', entry_id=args.entry_id)))
+        elif args.command == 'decrypt':
+            print(agent_request('decrypt', entry_id=args.entry_id, column=args.column))
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,147 @@
+"""
+Asyncio API over a vault, for embedding PyPass in services. Nothing is prompted.
+
+SQLite and crypto work runs on a thread pool, so coroutines never block the event loop.
+SQLite connections belong to the thread that opened them, so each worker thread opens its own
+session from the data key on first use. At most max_pending operations are handed to the pool
+at a time, and the rest wait on the event loop.
+
+    vault = await AsyncVault.open('alice', master_pw)
+    async with vault:
+        entries = await vault.search('mail')
+        entry = await vault.get(entries[0]['entry_id'])
+
+Operations are the ones of the scripted CLI (see vaultops.py), and raise VaultError.
+"""
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pypass.params import *
+from pypass.helpers import generate_key
+from pypass.dbconn import close_thread_connections
+from pypass.vaultops import VaultError, open_session, run_op
+
+class AsyncVault:
+    def __init__(self, username:str, *, max_workers:int=ASYNC_VAULT_WORKERS, max_pending:int=ASYNC_VAULT_MAX_PENDING):
+        """Use AsyncVault.open() to create an unlocked vault"""
+        self.username = username
+        self.data_key = b''
+        self.closed = False
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pypass-vault')
+        self.pending = asyncio.Semaphore(max_pending)
+        # Session of each worker thread
+        self.local = threading.local()
+
+    @classmethod
+    async def open(cls, username:str, master_pw:str, *, derive_key=generate_key, **kwargs):
+        """
+        Unlock the vault of a user. Key derivation runs on the pool too,
+        or wherever derive_key (called like generate_key()) runs it.
+        """
+        vault = cls(username, **kwargs)
+        try:
+            await vault.run(vault.unlock, master_pw, derive_key)
+        except BaseException:
+            await vault.close()
+            raise
+        return vault
+
+    def unlock(self, master_pw:str, derive_key=generate_key):
+        user_auth = open_session(self.username, master_pw, derive_key=derive_key)
+        self.data_key = user_auth.master_key
+        self.local.user_auth = user_auth
+
+    def session(self):
+        """UserAuth object of the current worker thread"""
+        user_auth = getattr(self.local, 'user_auth', None)
+        if user_auth is None:
+            if not self.data_key:
+                raise VaultError("The vault is not unlocked.")
+            from pypass.masterauth import UserAuth
+            user_auth = UserAuth(self.username, self.data_key)
+            self.local.user_auth = user_auth
+        return user_auth
+
+    async def run(self, func, *args):
+        """Run func(*args) on the pool, once a slot is free"""
+        if self.closed:
+            raise VaultError("The vault is closed.")
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def run_op_sync(self, op:str, args:dict):
+        result = run_op(self.session(), op, {key: value for key, value in args.items() if value is not None})
+        # Iterators are consumed on the worker thread, which owns the connection
+        return list(result) if hasattr(result, '__next__') else result
+
+    async def op(self, op:str, **args):
+        return await self.run(self.run_op_sync, op, args)
+
+    # ######### OPERATIONS #########
+
+    async def search(self, query:str)->list:
+        """Entries whose name or URL contains the query, without passwords"""
+        return await self.op('search', query=query)
+
+    async def get(self, entry_id:int, *, password:bool=True)->dict:
+        """A decrypted entry. Raises VaultError if it fails its signature or integrity check."""
+        return await self.op('get', entry_id=entry_id, password=password)
+
+    async def add(self, name:str, user_id:str='', user_pw:str=None, *, url:str='', \
+        generate:bool=False, passphrase:bool=False, policy:str=None, allow_weak:bool=False)->dict:
+        """
+        Add an entry, with the given password, or a generated password or passphrase.
+        Returns {'entry_id', 'reused_by'}, and 'user_pw' if it was generated.
+        """
+        return await self.op('add', name=name, user_id=user_id, user_pw=user_pw, url=url, \
+            generate=generate, passphrase=passphrase, policy=policy, allow_weak=allow_weak)
+
+    async def update(self, entry_id:int, *, name:str=None, user_id:str=None, user_pw:str=None, url:str=None, \
+        generate:bool=None, passphrase:bool=None, policy:str=None, allow_weak:bool=False, row_version:int=None)->dict:
+        """
+        Update the given fields of an entry. With row_version (of the entry as it was read),
+        raises VaultError instead of overwriting changes made since.
+        """
+        return await self.op('update', entry_id=entry_id, name=name, user_id=user_id, user_pw=user_pw, url=url, \
+            generate=generate, passphrase=passphrase, policy=policy, allow_weak=allow_weak, row_version=row_version)
+
+    async def delete(self, entry_id:int, *, row_version:int=None)->dict:
+        return await self.op('delete', entry_id=entry_id, row_version=row_version)
+
+    async def verify(self, *, full:bool=False)->dict:
+        """Returns {'invalid': [entry IDs with invalid signatures], 'root_valid': bool}"""
+        return await self.op('verify', full=full)
+
+    # ######### CLEANUP #########
+
+    def close_session(self, barrier:threading.Barrier):
+        """Close the session of the current worker thread, in the thread that opened it"""
+        user_auth = getattr(self.local, 'user_auth', None)
+        self.local.user_auth = None
+        # Overwrites the keys
+        del user_auth
+        close_thread_connections()
+        # Hold the thread, so that every worker runs one of these
+        barrier.wait(ASYNC_VAULT_CLOSE_TIMEOUT)
+
+    async def close(self):
+        """Close the sessions of all worker threads, and forget the data key"""
+        if self.closed:
+            return
+        self.closed = True
+        self.data_key = b''
+        barrier = threading.Barrier(self.max_workers)
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[loop.run_in_executor(self.executor, self.close_session, barrier) \
+                for _ in range(self.max_workers)])
+        except threading.BrokenBarrierError:
+            pass
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
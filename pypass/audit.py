@@ -0,0 +1,140 @@
+# Python standard libraries
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Local
+from pypass.params import *
+from pypass.consts import *
+from pypass.helpers import *
+from pypass.generator import is_password_strong
+from pypass.strength import estimate_strength, strength_dict_path
+from pypass.breach import is_password_breached, breach_db_path
+from pypass.masterauth import UserAuth
+
+# ######### WORKERS #########
+
+# Decryption-only UserAuth of a worker process
+_worker_auth = None
+
+def audit_worker_init(username:str, master_key:bytes):
+    global _worker_auth
+    _worker_auth = UserAuth(username, master_key, connect=False)
+
+def audit_passwords(user_auth, rows:list)->list:
+    """
+    Decrypt and score the passwords of (entry_id, user_pw) rows.
+    Returns (entry_id, strong, score, breached) tuples. Plaintext never leaves this function.
+    """
+    results = []
+    for entry_id, user_pw_enc in rows:
+        user_pw = user_auth.decrypt(user_pw_enc, entry_id, 'user_pw').decode(HASH_ENCODING)
+        results.append((entry_id, is_password_strong(user_pw), \
+            estimate_strength(user_pw)['score'], is_password_breached(user_pw)))
+        user_pw = ''
+    return results
+
+def audit_worker(rows:list)->list:
+    return audit_passwords(_worker_auth, rows)
+
+# ######### AUDIT #########
+
+def audit_data_id()->str:
+    """
+    Identifies the breached password corpus and the strength dictionary, by the size and modification
+    time of their files. Cached results scored with other ones are out of date.
+    """
+    parts = []
+    for path in [breach_db_path(), strength_dict_path()]:
+        try:
+            stat = os.stat(path)
+            parts.append(f'{stat.st_size}:{stat.st_mtime_ns}')
+        except OSError:
+            parts.append('none')
+    return ','.join(parts)
+
+def db_prune_audit_cache(user_auth):
+    """Drop cached results of deleted entries"""
+    sql = f'DELETE FROM {AUDIT_DB_TABLE} WHERE entry_id NOT IN (SELECT entry_id FROM {DB_TABLE})'
+    with user_auth.conn as conn:
+        conn.execute(sql)
+
+def save_audit_chunks(user_auth, chunks:list, results, data_id:str):
+    """Save the audit results of each chunk, along with the entry versions and the data they belong to"""
+    sql = f'INSERT OR REPLACE INTO {AUDIT_DB_TABLE}'
+    sql += '(entry_id, date_modified, entry_hash, strong, score, breached, data_id) VALUES(?, ?, ?, ?, ?, ?, ?)'
+    for chunk, chunk_results in zip(chunks, results):
+        versions = {entry_id: (date_modified, entry_hash) for entry_id, date_modified, entry_hash, _ in chunk}
+        with user_auth.conn as conn:
+            conn.executemany(sql, [(entry_id, *versions[entry_id], strong, score, breached, data_id) \
+                for entry_id, strong, score, breached in chunk_results])
+
+def get_changed_entries(user_auth, data_id:str)->list:
+    """
+    Returns (entry_id, date_modified, entry_hash, user_pw) rows
+    whose cached audit result is missing or out of date.
+    """
+    sql = f'SELECT c.entry_id, c.date_modified, c.entry_hash, c.user_pw FROM {DB_TABLE} c '
+    sql += f'LEFT JOIN {AUDIT_DB_TABLE} a ON a.entry_id = c.entry_id '
+    sql += 'WHERE a.entry_id IS NULL OR a.date_modified IS NOT c.date_modified '
+    sql += 'OR a.entry_hash IS NOT c.entry_hash OR a.data_id IS NOT ?'
+    with user_auth.conn as conn:
+        cur = conn.cursor()
+        cur.execute(sql, [data_id])
+        rows = cur.fetchall()
+        cur.close()
+    return rows
+
+def find_reused_passwords(user_auth)->list:
+    """Groups of entry IDs sharing the same password, from the fingerprint index"""
+    sql = f'SELECT group_concat(entry_id) FROM {FINGERPRINT_DB_TABLE} '
+    sql += 'GROUP BY fingerprint HAVING count(*) > 1'
+    with user_auth.conn as conn:
+        rows = conn.execute(sql).fetchall()
+    return [[int(entry_id) for entry_id in row[0].split(',')] for row in rows]
+
+def run_vault_audit(user_auth, *, workers:int=AUDIT_WORKERS, stale_days:int=AUDIT_STALE_DAYS)->dict:
+    """
+    Audit every entry of the vault for weak, reused and stale passwords.
+    Only entries that changed since the last audit are decrypted and scored;
+    the rest are read from the audit cache. Large audits are spread over a process pool.
+
+    (Returns)
+        A dictionary with lists of entry IDs for 'weak', 'breached' and 'stale',
+        a list of entry ID groups for 'reused', and a 'names' dictionary of entry ID -> name.
+        'n_audited' is the number of entries that had to be scored.
+    """
+    db_prune_audit_cache(user_auth)
+    db_backfill_fingerprints(user_auth)
+
+    # Score entries that changed since the last audit, or all of them if the corpus or dictionary changed
+    data_id = audit_data_id()
+    rows = get_changed_entries(user_auth, data_id)
+    chunks = [rows[i:i + AUDIT_CHUNK_SIZE] for i in range(0, len(rows), AUDIT_CHUNK_SIZE)]
+    pw_chunks = [[(entry_id, user_pw) for entry_id, _, _, user_pw in chunk] for chunk in chunks]
+    if len(rows) < AUDIT_PARALLEL_MIN_ENTRIES:
+        # Few changes. Not worth starting worker processes.
+        results = [audit_passwords(user_auth, pw_chunk) for pw_chunk in pw_chunks]
+        save_audit_chunks(user_auth, chunks, results, data_id)
+    else:
+        max_workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=audit_worker_init, \
+            initargs=(user_auth.username, user_auth.master_key)) as executor:
+            # Results come back in order, and are saved as they arrive
+            save_audit_chunks(user_auth, chunks, executor.map(audit_worker, pw_chunks), data_id)
+
+    # Collect the report from the cache
+    stale_before = get_current_ts() - stale_days * 24 * 60 * 60
+    sql = f'SELECT c.entry_id, c.name, c.date_modified, a.strong, a.score, a.breached FROM {DB_TABLE} c '
+    sql += f'JOIN {AUDIT_DB_TABLE} a ON a.entry_id = c.entry_id'
+    report = {'weak': [], 'breached': [], 'stale': [], 'reused': [], 'names': {}, 'n_audited': len(rows)}
+    with user_auth.conn as conn:
+        for entry_id, name, date_modified, strong, score, breached in conn.execute(sql):
+            report['names'][entry_id] = name
+            if not strong or score < USER_PW_MIN_STRENGTH_SCORE:
+                report['weak'].append(entry_id)
+            if breached:
+                report['breached'].append(entry_id)
+            if date_modified is not None and date_modified < stale_before:
+                report['stale'].append(entry_id)
+    report['reused'] = find_reused_passwords(user_auth)
+    return report
@@ -0,0 +1,248 @@
+"""
+Offline check against a local copy of a breached password corpus.
+
+The corpus is stored as a sorted array of fixed-width SHA-1 prefixes, which is
+memory-mapped and binary-searched. An optional Bloom filter, loaded into memory,
+answers most lookups of passwords that are not in the corpus without touching the file.
+
+Build the files from a corpus with one SHA-1 hash per line (e.g. 'HASH:count' lines),
+or with one password per line using --plaintext:
+    python -m pypass.breach <corpus.txt> [--plaintext] [--bloom] [--prefix-len N]
+The corpus is processed as a stream with an external merge sort, so it can be larger than memory.
+"""
+import os, re, mmap, math, heapq, struct, hashlib, argparse, tempfile
+
+from pypass.params import *
+from pypass.consts import *
+
+BREACH_MAGIC = b'PPBR'
+BREACH_BLOOM_MAGIC = b'PPBF'
+BREACH_VERSION = 1
+BREACH_BLOOM_VERSION = 2
+BREACH_HEADER = struct.Struct('<4sIIQ') # magic, version, record width, record count
+# magic, version, number of hashes, number of bits, ID of the database the filter was built for
+BREACH_BLOOM_HEADER = struct.Struct('<4sIIQ16s')
+BREACH_ID_SAMPLES = 64 # Records hashed into the ID of a database
+BREACH_SORT_CHUNK = 2 ** 22 # Records sorted in memory at once while building
+
+RE_SHA1_HEX = re.compile(r'[0-9A-Fa-f]{40}')
+
+def password_digest(pw:str)->bytes:
+    return hashlib.sha1(pw.encode(HASH_ENCODING)).digest()
+
+def bloom_positions(digest:bytes, n_hashes:int, n_bits:int):
+    """Bit positions of a SHA-1 digest in the Bloom filter, by double hashing"""
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little') | 1
+    return [(h1 + i * h2) % n_bits for i in range(n_hashes)]
+
+def breach_db_id(mm, width:int, count:int)->bytes:
+    """Identifies a database file: a hash of its header and of records sampled across it"""
+    h = hashlib.sha256(mm[:BREACH_HEADER.size])
+    for i in range(min(count, BREACH_ID_SAMPLES)):
+        pos = BREACH_HEADER.size + (i * count // min(count, BREACH_ID_SAMPLES)) * width
+        h.update(mm[pos:pos + width])
+    return h.digest()[:16]
+
+class BreachDB:
+    """Memory-mapped sorted SHA-1 prefixes, with an optional in-memory Bloom filter"""
+    def __init__(self, path:str, bloom_path:str=''):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.count = BREACH_HEADER.unpack_from(self.mm, 0)
+        if magic != BREACH_MAGIC or version != BREACH_VERSION or \
+            len(self.mm) < BREACH_HEADER.size + self.width * self.count:
+            self.mm.close()
+            raise ValueError(f"breach.BreachDB: '{path}' is not a valid version {BREACH_VERSION} file.")
+
+        self.bloom = None
+        if bloom_path and os.path.isfile(bloom_path):
+            with open(bloom_path, 'rb') as f:
+                header = f.read(BREACH_BLOOM_HEADER.size)
+                if len(header) < BREACH_BLOOM_HEADER.size:
+                    return
+                magic, version, self.n_hashes, self.n_bits, db_id = BREACH_BLOOM_HEADER.unpack(header)
+                # A filter built for another database would hide the passwords that only this one has
+                if magic == BREACH_BLOOM_MAGIC and version == BREACH_BLOOM_VERSION and \
+                    db_id == breach_db_id(self.mm, self.width, self.count):
+                    bloom = f.read()
+                    # A truncated filter would fail lookups. Without a filter, lookups use the database only.
+                    if self.n_hashes > 0 and self.n_bits > 0 and len(bloom) == (self.n_bits + 7) // 8:
+                        self.bloom = bloom
+
+    def bloom_contains(self, digest:bytes)->bool:
+        bloom = self.bloom
+        return all(bloom[pos >> 3] & (1 << (pos & 7)) \
+            for pos in bloom_positions(digest, self.n_hashes, self.n_bits))
+
+    def contains_digest(self, digest:bytes)->bool:
+        if self.bloom is not None and not self.bloom_contains(digest):
+            return False
+        # Binary search over the fixed-width records
+        prefix = digest[:self.width]
+        width = self.width
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = BREACH_HEADER.size + mid * width
+            record = self.mm[pos:pos + width]
+            if record < prefix:
+                lo = mid + 1
+            elif record > prefix:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def contains(self, pw:str)->bool:
+        return self.contains_digest(password_digest(pw))
+
+    def close(self):
+        self.mm.close()
+
+# ######### BUILD #########
+
+def corpus_digests(corpus_path:str, plaintext:bool):
+    """Stream SHA-1 digests from a corpus file"""
+    with open(corpus_path, 'r', encoding='utf-8', errors='replace') as corpus:
+        for line in corpus:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            if plaintext:
+                yield password_digest(line)
+            else:
+                sha1_hex = line.split(':', 1)[0].strip()
+                if RE_SHA1_HEX.fullmatch(sha1_hex):
+                    yield bytes.fromhex(sha1_hex)
+
+def write_sorted_run(records:list, tmp_dir:str)->str:
+    records.sort()
+    fd, path = tempfile.mkstemp(dir=tmp_dir, suffix='.run')
+    with os.fdopen(fd, 'wb') as run:
+        run.write(b''.join(records))
+    return path
+
+def read_run(path:str, width:int):
+    with open(path, 'rb') as run:
+        while True:
+            chunk = run.read(width * 4096)
+            if not chunk:
+                break
+            for pos in range(0, len(chunk), width):
+                yield chunk[pos:pos + width]
+
+def build_breach_db(corpus_path:str, dst_path:str, *, plaintext:bool=False, \
+    prefix_len:int=BREACH_PREFIX_LEN, bloom_path:str='', bloom_bits_per_entry:int=BREACH_BLOOM_BITS_PER_ENTRY)->int:
+    """
+    Convert a corpus into the sorted binary format, and optionally a Bloom filter.
+    Returns the number of unique records written.
+    """
+    if not 4 <= prefix_len <= 20:
+        raise ValueError("breach.build_breach_db(): prefix_len must be in range 4 ~ 20.")
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(dst_path)))
+    tmp_path = dst_path + '.tmp'
+    run_paths = []
+    total = 0
+    try:
+        # Pass 1: sort chunks of full digests into temporary runs
+        records = []
+        for digest in corpus_digests(corpus_path, plaintext):
+            records.append(digest)
+            if len(records) >= BREACH_SORT_CHUNK:
+                run_paths.append(write_sorted_run(records, tmp_dir))
+                total += len(records)
+                records = []
+        if records:
+            run_paths.append(write_sorted_run(records, tmp_dir))
+            total += len(records)
+
+        # Bloom filter sized for the number of records, optimal number of hashes
+        bloom = None
+        if bloom_path:
+            n_bits = max(64, total * bloom_bits_per_entry)
+            n_hashes = max(1, round(bloom_bits_per_entry * math.log(2)))
+            bloom = bytearray((n_bits + 7) // 8)
+
+        # Pass 2: merge the runs, drop duplicates and keep the prefixes
+        count = 0
+        with open(tmp_path, 'w+b') as dst:
+            dst.write(BREACH_HEADER.pack(BREACH_MAGIC, BREACH_VERSION, prefix_len, 0))
+            last_prefix = None
+            out = []
+            for digest in heapq.merge(*[read_run(path, 20) for path in run_paths]):
+                if bloom is not None:
+                    for pos in bloom_positions(digest, n_hashes, n_bits):
+                        bloom[pos >> 3] |= 1 << (pos & 7)
+                prefix = digest[:prefix_len]
+                if prefix == last_prefix:
+                    continue
+                last_prefix = prefix
+                out.append(prefix)
+                count += 1
+                if len(out) >= 65536:
+                    dst.write(b''.join(out))
+                    out = []
+            dst.write(b''.join(out))
+            # Record the final count
+            dst.seek(0)
+            dst.write(BREACH_HEADER.pack(BREACH_MAGIC, BREACH_VERSION, prefix_len, count))
+            dst.flush()
+            with mmap.mmap(dst.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                db_id = breach_db_id(mm, prefix_len, count)
+        os.replace(tmp_path, dst_path)
+
+        if bloom is not None:
+            with open(bloom_path + '.tmp', 'wb') as bloom_file:
+                bloom_file.write(BREACH_BLOOM_HEADER.pack(BREACH_BLOOM_MAGIC, BREACH_BLOOM_VERSION, n_hashes, n_bits, db_id))
+                bloom_file.write(bloom)
+            os.replace(bloom_path + '.tmp', bloom_path)
+    finally:
+        for path in run_paths:
+            os.remove(path)
+        os.rmdir(tmp_dir)
+        # Left over by an error
+        for path in [tmp_path, bloom_path + '.tmp' if bloom_path else '']:
+            if path and os.path.exists(path):
+                os.remove(path)
+    return count
+
+# ######### LOOKUP #########
+
+# Opened on first use and kept open
+_breach_db = None
+
+def breach_db_path()->str:
+    return os.path.join(DATA_DNAME, BREACH_DB_FNAME)
+
+def breach_bloom_path()->str:
+    return os.path.join(DATA_DNAME, BREACH_BLOOM_FNAME)
+
+def load_breach_db():
+    """Returns the breached password database, or None if there is none in the data directory"""
+    global _breach_db
+    if _breach_db is None and os.path.isfile(breach_db_path()):
+        bloom_path = breach_bloom_path() if BREACH_USE_BLOOM else ''
+        _breach_db = BreachDB(breach_db_path(), bloom_path)
+    return _breach_db
+
+def is_password_breached(pw:str)->bool:
+    """Check if a password appears in the local breached password corpus"""
+    breach_db = load_breach_db()
+    if breach_db is None:
+        return False
+    return breach_db.contains(pw)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help='Corpus text file')
+    parser.add_argument('--plaintext', action='store_true', help='The corpus has one password per line')
+    parser.add_argument('--bloom', action='store_true', help='Also build a Bloom filter')
+    parser.add_argument('--prefix-len', type=int, default=BREACH_PREFIX_LEN, help='Bytes of SHA-1 kept per record')
+    args = parser.parse_args()
+    n_written = build_breach_db(args.corpus, breach_db_path(), plaintext=args.plaintext, \
+        prefix_len=args.prefix_len, bloom_path=breach_bloom_path() if args.bloom else '')
+    if not args.bloom and os.path.isfile(breach_bloom_path()):
+        # Built for the previous database
+        os.remove(breach_bloom_path())
+    print(f"Wrote {n_written} records to '{breach_db_path()}'.")
@@ -0,0 +1,135 @@
+"""
+Non-interactive command line interface, for scripts and automation.
+
+Nothing is prompted. The master password is read from a file descriptor (--password-fd),
+or from the environment variable CLI_PASSWORD_ENV. Results are printed as JSON lines,
+errors go to stderr, and the exit status is non-zero if an operation failed.
+
+    python -m pypass.cli [--username USER] [--password-fd FD] COMMAND ...
+    COMMAND: get ENTRY_ID | search QUERY | add NAME ... | update ENTRY_ID ... | delete ENTRY_ID
+             export | verify [--full] | batch
+
+'batch' reads one JSON operation per line from stdin, and prints one response per line,
+so the key is derived once for any number of operations:
+    {"op": "add", "name": "mail", "user_id": "me", "generate": true, "url": "https://mail.example.com"}
+    {"op": "update", "entry_id": 3, "user_pw": "..."}
+    {"op": "get", "entry_id": 3}
+    -> {"ok": true, "result": ...} or {"ok": false, "error": "..."}
+"""
+import os, sys, json, argparse, sqlite3
+
+from pypass.params import *
+from pypass.consts import *
+from pypass.vaultops import VaultError, open_session, run_op
+
+# ######### SESSION #########
+
+def read_master_pw(password_fd:int=-1)->str:
+    """The master password, from the first line of a file descriptor, or from the environment"""
+    if password_fd >= 0:
+        with open(password_fd, 'r', closefd=False) as f:
+            return f.readline().rstrip('\r\n')
+    master_pw = os.environ.get(CLI_PASSWORD_ENV, '')
+    if not master_pw:
+        raise VaultError(ERROR_CLI_NO_MASTER_PW.format(CLI_PASSWORD_ENV))
+    return master_pw
+
+def print_json(obj):
+    print(json.dumps(obj), flush=True)
+
+def run_batch(user_auth, lines)->bool:
+    """Run one JSON operation per line. Returns False if any operation failed."""
+    all_ok = True
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if type(request) != dict:
+                raise VaultError("An operation must be a JSON object.")
+            result = run_op(user_auth, request.pop('op', None), request)
+            if hasattr(result, '__next__'):
+                result = list(result)
+            response = {'ok': True, 'result': result}
+        except (VaultError, ValueError) as e:
+            response = {'ok': False, 'error': str(e)}
+            all_ok = False
+        print_json(response)
+    return all_ok
+
+# ######### ARGUMENTS #########
+
+def add_entry_args(parser:argparse.ArgumentParser):
+    parser.add_argument('--user-id', help='ID or email')
+    parser.add_argument('--url')
+    pw_group = parser.add_mutually_exclusive_group()
+    pw_group.add_argument('--password-stdin', action='store_true', help='Read the password from stdin')
+    pw_group.add_argument('--generate', action='store_true', help='Generate a password')
+    pw_group.add_argument('--passphrase', action='store_true', help='Generate a passphrase')
+    parser.add_argument('--policy', help='Password policy of --generate')
+    parser.add_argument('--allow-weak', action='store_true', help='Skip the strength and breach checks')
+
+def args_to_op(args:argparse.Namespace)->dict:
+    """Arguments of a subcommand, as the arguments of its operation"""
+    op_args = {key: value for key, value in vars(args).items() \
+        if key not in ['command', 'username', 'password_fd', 'password_stdin'] \
+            and value is not None and value is not False}
+    if getattr(args, 'password_stdin', False):
+        op_args['user_pw'] = sys.stdin.readline().rstrip('\r\n')
+    if args.command == 'get' and args.no_password:
+        op_args['password'] = False
+    op_args.pop('no_password', None)
+    return op_args
+
+def main(argv:list=None)->int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default=os.environ.get(CLI_USERNAME_ENV, ''), \
+        help=f'PyPass username, defaults to ${CLI_USERNAME_ENV}')
+    parser.add_argument('--password-fd', type=int, default=-1, \
+        help=f'Read the master password from this file descriptor, instead of ${CLI_PASSWORD_ENV}')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    get_parser = subparsers.add_parser('get', help='Print an entry')
+    get_parser.add_argument('entry_id', type=int)
+    get_parser.add_argument('--no-password', action='store_true')
+    search_parser = subparsers.add_parser('search', help='Search entries by name and URL')
+    search_parser.add_argument('query')
+    add_parser = subparsers.add_parser('add', help='Add an entry')
+    add_parser.add_argument('name')
+    add_entry_args(add_parser)
+    update_parser = subparsers.add_parser('update', help='Update the given fields of an entry')
+    update_parser.add_argument('entry_id', type=int)
+    update_parser.add_argument('--name')
+    add_entry_args(update_parser)
+    delete_parser = subparsers.add_parser('delete', help='Delete an entry')
+    delete_parser.add_argument('entry_id', type=int)
+    for version_parser in [update_parser, delete_parser]:
+        version_parser.add_argument('--row-version', type=int, \
+            help='Fail, instead of overwriting, if the entry changed since it was read with this row_version')
+    subparsers.add_parser('export', help='Print all entries, with their passwords')
+    verify_parser = subparsers.add_parser('verify', help='Verify the signatures and the integrity root')
+    verify_parser.add_argument('--full', action='store_true', help='Ignore the verification watermark')
+    subparsers.add_parser('batch', help='Run JSON operations from stdin, one per line')
+    args = parser.parse_args(argv)
+
+    try:
+        if not args.username:
+            raise VaultError(ERROR_CLI_NO_USERNAME.format(CLI_USERNAME_ENV))
+        if args.password_fd == 0 and (args.command == 'batch' or getattr(args, 'password_stdin', False)):
+            raise VaultError("stdin is already used by the command. Pass the master password on another descriptor.")
+        user_auth = open_session(args.username, read_master_pw(args.password_fd))
+        if args.command == 'batch':
+            return 0 if run_batch(user_auth, sys.stdin) else 1
+        result = run_op(user_auth, args.command, args_to_op(args))
+        for item in result if hasattr(result, '__next__') else [result]:
+            print_json(item)
+    except VaultError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
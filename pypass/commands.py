@@ -1,17 +1,15 @@
 # Python standard libraries
-import platform, webbrowser, time, os
+import platform, time, os
 
 # 3rd parties
-import pyperclip as pc
-import keyboard as kb
-
-from PyInquirer import prompt, Separator
+# pyperclip, keyboard, webbrowser and PyInquirer (see helpers.prompt()) are imported by the commands that use them
 
 # Locals
 from pypass.helpers import *
 from pypass.consts import *
-from pypass.generator import generate_strong_random_pw
-from pypass.masterauth import master_db_connect
+from pypass.policy import compile_policy, generate_new_pw
+from pypass.wordlist import wordlist_available
+from pypass.masterauth import change_master_password
 from pypass.viewer import *
 from pypass.validators import *
 
@@ -36,6 +34,33 @@ def parse_cmd_args(cmd_str):
 
     return cmd, pos_args, flags
 
+def new_pw_option_choices():
+    """Choices for how to create a new password"""
+    choices = [
+        {
+            'name': 'Generate a strong new password',
+            'value': 'generate'
+        }
+    ]
+    # Passphrases need a wordlist in the data directory
+    if wordlist_available():
+        choices.append({
+            'name': 'Generate a passphrase',
+            'value': 'passphrase'
+        })
+    choices.append({
+        'name': 'Manually create one',
+        'value': 'manual'
+    })
+    return choices
+
+def warn_pw_reuse(user_auth, user_pw:str, entry_id:int=0):
+    """Print a warning if the password is already used by other entries"""
+    reused_by = db_find_pw_reuse(user_auth, user_pw, exclude_entry_id=entry_id)
+    if reused_by:
+        names = ', '.join(f"'{name}'" for _, name in reused_by)
+        print(WARNING_PW_REUSED.format(names))
+
 def prompt_search_query():
     """
     Prompt user for a search query
@@ -65,14 +90,19 @@ def run_login_wizard(user_auth, query:str='', *, entry_id:int=0):
         # Stop if not found
         return True
     
-    user_id = user_auth.decrypt(credential['user_id']).decode(HASH_ENCODING)
-    user_pw = user_auth.decrypt(credential['user_pw']).decode(HASH_ENCODING)
+    user_id = user_auth.decrypt_entry_value(credential['entry_id'], credential['entry_hash'], \
+        'user_id', credential['user_id']).decode(HASH_ENCODING)
+    user_pw = user_auth.decrypt_entry_value(credential['entry_id'], credential['entry_hash'], \
+        'user_pw', credential['user_pw']).decode(HASH_ENCODING)
     url = credential['url']
+    import pyperclip as pc
+    import keyboard as kb
     
     if url:
         # Copy URL, wait for user to paste it in
         print(PROMPT_LOGIN_WIZARD_1_URL, end="")
         time.sleep(1)
+        import webbrowser
         webbrowser.open(url)
         input()
     
@@ -103,7 +133,7 @@ def run_view(user_auth):
         'Copy password',
         'View password',
         'Login Wizard',
-        Separator(),
+        separator(),
         'Done'
     ]
     action_question = [
@@ -118,7 +148,9 @@ def run_view(user_auth):
     chosen_action = answer['chosen_action']
 
     if chosen_action == 'Copy password':
-        user_pw = user_auth.decrypt(credential['user_pw']).decode(HASH_ENCODING)
+        user_pw = user_auth.decrypt_entry_value(credential['entry_id'], credential['entry_hash'], \
+            'user_pw', credential['user_pw']).decode(HASH_ENCODING)
+        import pyperclip as pc
         pc.copy(user_pw)
         print(PROMPT_PASSWORD_COPIED)
     elif chosen_action == 'View password':
@@ -142,6 +174,7 @@ def run_edit(user_auth):
     # if show_pw:
     #     d_user_pw = " (" + user_auth.decrypt(credential["user_pw"]).decode(HASH_ENCODING) + ")"
     url = credential["url"]
+    stored_policy = db_get_entry_policy(user_auth, credential['entry_id'])
     edit_choices.append({
         'name': f"Name ({name})",
         'value': 'name'
@@ -169,6 +202,10 @@ def run_edit(user_auth):
         return edit_confirmed(answers) and 'user_pw' in answers['field_to_edit']
     def edit_pw_generate(answers):
         return edit_pw(answers) and answers['new_pw_options'] == 'generate'
+    def edit_pw_passphrase(answers):
+        return edit_pw(answers) and answers['new_pw_options'] == 'passphrase'
+    def edit_pw_policy(answers):
+        return edit_pw_generate(answers)
     def edit_pw_manual(answers):
         return edit_pw(answers) and answers['new_pw_options'] == 'manual'
     def edit_url(answers):
@@ -210,23 +247,22 @@ def run_edit(user_auth):
             'name': 'new_pw_options',
             'message': 'New password options:',
             'when': edit_pw,
-            'choices': [
-                {
-                    'name': 'Generate a strong new password',
-                    'value': 'generate'
-                },
-                {
-                    'name': 'Manually create one',
-                    'value': 'manual'
-                }
-            ]
+            'choices': new_pw_option_choices()
+        },
+        {
+            'type': 'input',
+            'name': 'new_pw_policy',
+            'message': PROMPT_PW_POLICY,
+            'default': stored_policy,
+            'when': edit_pw_policy,
+            'validate': validate_pw_policy
         },
         {
             'type': 'password',
             'name': 'new_pw',
             'message': 'Enter a new password:',
             'when': edit_pw_manual,
-            'validate': validate_user_pw,
+            'validate': validate_user_pw_strict,
         },
         {
             'type': 'password',
@@ -258,9 +294,18 @@ def run_edit(user_auth):
         print("Edit cancelled by user. Changes are not saved.")
         return False
 
-    # Auto generate if needed
-    if edit_pw_generate(answers):
-        answers['new_pw'] = generate_strong_random_pw()
+    # Auto generate if needed, following the entry's password policy
+    new_policy = None
+    try:
+        if edit_pw_generate(answers):
+            new_policy = answers['new_pw_policy'].strip()
+            answers['new_pw'] = generate_new_pw('generate', new_policy)
+        elif edit_pw_passphrase(answers):
+            answers['new_pw'] = generate_new_pw('passphrase')
+    except ValueError as e:
+        print(e)
+        print("Edit cancelled. Changes are not saved.")
+        return False
 
     # Deep copy
     new_credential = {}
@@ -291,6 +336,8 @@ def run_edit(user_auth):
         answers['new_url'] = ''
     
     print_credential(user_auth, new_credential, show_pw=True)
+    if edit_pw(answers):
+        warn_pw_reuse(user_auth, answers['new_pw'], credential['entry_id'])
 
     edit_confirm_question = [
         {
@@ -307,10 +354,15 @@ def run_edit(user_auth):
         print("Edit cancelled by user. Changes are not saved.")
         return False
 
-    # Update DB
-    db_update_entry(user_auth, entry_id=credential['entry_id'],\
-        name=answers['new_name'], user_id=answers['new_id'], \
-            user_pw=answers['new_pw'], url=answers['new_url'])
+    # Update DB, unless another process changed the entry while it was being edited
+    try:
+        db_update_entry(user_auth, entry_id=credential['entry_id'],\
+            name=answers['new_name'], user_id=answers['new_id'], \
+                user_pw=answers['new_pw'], url=answers['new_url'], policy=new_policy, \
+                    expected_version=credential['row_version'])
+    except EntryConflictError as e:
+        print(e)
+        return False
     return True
 
 def run_new(user_auth):
@@ -332,22 +384,20 @@ def run_new(user_auth):
             'type': 'list',
             'name': 'new_pw_options',
             'message': 'New password options:',
-            'choices': [
-                {
-                    'name': 'Generate a strong new password',
-                    'value': 'generate'
-                },
-                {
-                    'name': 'Manually create one',
-                    'value': 'manual'
-                }
-            ]
+            'choices': new_pw_option_choices()
+        },
+        {
+            'type': 'input',
+            'name': 'new_pw_policy',
+            'message': PROMPT_PW_POLICY,
+            'validate': validate_pw_policy,
+            'when': lambda answers: answers['new_pw_options'] == 'generate'
         },
         {
             'type': 'password',
             'name': 'new_pw',
             'message': 'Enter a new password:',
-            'validate': validate_user_pw,
+            'validate': validate_user_pw_strict,
             'when': lambda answers: answers['new_pw_options'] == 'manual'
         },
         {
@@ -371,13 +421,23 @@ def run_new(user_auth):
         raise KeyboardInterrupt
     
     print("Saving changes...")
-    # Generate password if necessary
-    if new_answers['new_pw_options'] == 'generate':
-        new_answers['new_pw'] = generate_strong_random_pw()
+    # Generate password if necessary, following the password policy
+    new_policy = ''
+    try:
+        if new_answers['new_pw_options'] == 'generate':
+            new_policy = new_answers['new_pw_policy'].strip()
+            new_answers['new_pw'] = generate_new_pw('generate', new_policy)
+        elif new_answers['new_pw_options'] == 'passphrase':
+            new_answers['new_pw'] = generate_new_pw('passphrase')
+        else:
+            warn_pw_reuse(user_auth, new_answers['new_pw'])
+    except ValueError as e:
+        print(e)
+        return False
     
     # Insert to DB
     add_result = db_add_entry(user_auth, new_answers['new_name'], new_answers['new_id'],\
-        new_answers['new_pw'], new_answers['new_url'])
+        new_answers['new_pw'], new_answers['new_url'], policy=new_policy)
     
     if add_result:
         print("All changes successfully saved.")
@@ -402,10 +462,47 @@ def run_delete(user_auth):
     del_confirm = prompt(delete_confirm_question)['delete_confirm']
     
     if not del_confirm: return False
-    result = db_delete_entry(user_auth, credential['entry_id'])
+    try:
+        result = db_delete_entry(user_auth, credential['entry_id'], expected_version=credential['row_version'])
+    except EntryConflictError as e:
+        print(e)
+        return False
     
     return result
 
+def run_audit(user_auth):
+    # Loads the process pool
+    from pypass.audit import run_vault_audit
+    print("Auditing passwords...")
+    try:
+        report = run_vault_audit(user_auth)
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+        return False
+    print_audit_report(report)
+    return True
+
+def run_verify(user_auth):
+    print("Verifying entry signatures...")
+    try:
+        invalid_ids = user_auth.verify_all()
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+        return False
+    invalid_rows = [get_entry_by_id(user_auth, entry_id, to_dict=True) for entry_id in invalid_ids]
+    root_valid = user_auth.check_merkle_root(full=True)
+    print_verify_report(invalid_rows, root_valid)
+    if not root_valid and ask_yn(PROMPT_MERKLE_REBUILD):
+        user_auth.rebuild_merkle_tree()
+    return True
+
+def run_change_master_pw(user_auth):
+    try:
+        return change_master_password(user_auth)
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+        return False
+
 def run_delete_user(user_auth):
     question_confirm = [
         {
@@ -427,17 +524,14 @@ def run_delete_user(user_auth):
         return True
 
     username = user_auth.username
-    # Delete from master databse
-    master_conn = master_db_connect()
-    sql = f'DELETE FROM {MASTER_DB_TABLE} WHERE username=?'
-    with master_conn:
-        cur = master_conn.cursor()
+    # Delete from master databse, through the connection of the vault
+    sql = f'DELETE FROM {MASTER_DB_ALIAS}.{MASTER_DB_TABLE} WHERE username=?'
+    with user_auth.conn as conn:
+        cur = conn.cursor()
         cur.execute(sql, [username])
-    master_conn.close()
-    # Close DB connection
-    user_auth.conn.close()
-    # Delete the database file
-    os.remove(os.path.join(DATA_DNAME, f"{username}{DB_FILE_EXT}"))
+        cur.close()
+    # Close DB connection, and delete the database files
+    db_remove(username)
     return True
     
 
@@ -447,7 +541,10 @@ def prompt_commands():
         'Add new entry',
         'Edit entry',
         'Delete entry',
-        Separator(),
+        'Audit vault',
+        'Verify vault',
+        separator(),
+        'Change master password',
         'Delete user',
         'Quit'
     ]
@@ -481,6 +578,12 @@ def run_commands(user_auth):
             result = run_edit(user_auth)
         elif command == 'Delete entry':
             result = run_delete(user_auth)
+        elif command == 'Audit vault':
+            result = run_audit(user_auth)
+        elif command == 'Verify vault':
+            result = run_verify(user_auth)
+        elif command == 'Change master password':
+            result = run_change_master_pw(user_auth)
         elif command == 'Delete user':
             result = run_delete_user(user_auth)
             if result:
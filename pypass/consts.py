@@ -4,17 +4,27 @@ SPLASH_WELCOME = "PyPass - An interactive password manager. Welcome, {}"
 # USER PROMPTS
 PROMPT_MASTER_PW = "Enter master password: "
 PROMPT_NEW_MASTER_PW = "Enter new master password: "
+PROMPT_CURRENT_MASTER_PW = "Enter current master password: "
 PROMPT_CONFIRM_PW = "Re-enter password: "
 PROMPT_MASTER_USERNAME = "Enter PyPass username: "
 PROMPT_MASTER_USER_CREATE = "Create a new PyPass user?"
 
 PROMPT_SEARCH_QUERY = "Search database by service name: "
 
+PROMPT_PW_POLICY = "Password policy (leave empty for the default rules):"
+
 PROMPT_PASSWORD_COPIED = 'The password was copied to your clipboard!'
 
 PROMPT_LOGIN_WIZARD_1_URL = "Hit ENTER after reaching the login page. Opening URL..."
 PROMPT_LOGIN_WIZARD_2_ID = "Place your cursor in the ID field of the login page and press the 'tab' key."
 
+PROMPT_FINGERPRINT_BACKFILL = "Indexed passwords of {} entries for reuse checks."
+PROMPT_MERKLE_BUILT = "Computed the integrity root of the vault over {} entries."
+PROMPT_MASTER_PW_CHANGED = "The master password was changed."
+PROMPT_AGENT_STARTED = "Unlock agent started (pid {}), locks after {} seconds of inactivity."
+PROMPT_SERVER_STARTED = "Credential server listening on '{}' (pid {})."
+PROMPT_MERKLE_REBUILD = "Accept the vault as it is now, and compute a new integrity root? (UNSAFE)"
+
 # SUCCESS MESSAGES
 
 # ERROR MESSAGES
@@ -25,6 +35,12 @@ ERROR_PW_TOO_SHORT = "A password needs to be at least {} characters long. Please
 ERROR_PW_TOO_LONG = "A password needs to be shorter than {} characters long. Please try again."
 ERROR_ID_UNSUPPORTED_CHARS = "Your ID contains unsupported character({}). Please try again."
 ERROR_PW_UNSUPPORTED_CHARS = "Your password contains unsupported character({}). Please try again."
+ERROR_PW_TOO_WEAK = "This password is too easy to guess (about {:.0f} bits). Avoid common words, keyboard patterns and dates."
+ERROR_PW_BREACHED = "This password appears in a known data breach. Please choose another one."
+ERROR_PWGEN_ALL_BREACHED = "Every password generated in {} attempts appears in a known data breach. \
+The password policy is too weak: allow more characters or longer passwords."
+ERROR_PASSPHRASE_TOO_LONG = "Could not fit a passphrase of {} bits into {} characters. Use a wordlist with shorter words."
+ERROR_PW_POLICY_INVALID = "Invalid password policy: {}. Please try again."
 
 ERROR_MASTER_USERNAME_EMPTY = "A username cannot be empty."
 ERROR_MASTER_USERNAME_ALREADY_EXISTS = "The username '{}' already exists. Please choose another one."
@@ -35,6 +51,7 @@ ERROR_CREATE_PYPASS_USER_DATABASEERROR = "A DatabaseError occured while trying t
 ERROR_CREATE_PYPASS_USER_FAIL = "Failed to create a new PyPass user due to an error."
 ERROR_MASTER_AUTH_KEYBOARD_INTERRUPT = "Master authentication aborted by user. Exit program."
 ERROR_WRONG_MASTER_PASSWORD = "Wrong master password. Please re-launch the program to try again."
+ERROR_WRONG_CURRENT_MASTER_PASSWORD = "Wrong master password. The master password was not changed."
 
 ERROR_NEW_ENTRY_NAME_EMPTY = "You must enter a non-empty service/domain name."
 ERROR_NEW_ENTRY_NAME_TOO_LONG = "A service/domain name must be shorter than 512 characters. Please try again."
@@ -44,6 +61,25 @@ ERROR_VIEW_QUERY_TOO_SHORT = "Search query is too short. Search with at least {}
 
 ERROR_DATABASE_ERROR = "A database error occured while carrying out the operation."
 
+WARNING_PW_REUSED = "WARNING: This password is already used by {}. Reusing passwords is not recommended."
+
+WARNING_MERKLE_ROOT_MISMATCH = """WARNING: The vault does not match its integrity root.
+Entries may have been added or deleted outside of PyPass, or the vault file may have been \
+replaced with an older copy. Run 'Verify vault' for details."""
+
+ERROR_AGENT_UNSUPPORTED = "The unlock agent needs Unix domain sockets and fork(), which this platform does not have."
+ERROR_AGENT_ALREADY_RUNNING = "An unlock agent is already running on '{}'."
+ERROR_AGENT_NOT_RUNNING = "No unlock agent is running on '{}'."
+ERROR_SERVER_UNSUPPORTED = "The credential server needs Unix domain sockets, which this platform does not have."
+ERROR_SERVER_BUSY = "Too many logins in progress. Try again later."
+ERROR_SERVER_NOT_LOGGED_IN = "Not logged in, or the session expired."
+
+ERROR_ENTRY_CONFLICT = "Entry {} was changed or deleted by another PyPass process. Reload it and try again."
+ERROR_ENTRY_CHECK_FAILED = "Entry {} failed its signature or integrity check. Open PyPass to review it."
+ERROR_CLI_NO_MASTER_PW = "No master password given. Pass --password-fd, or set ${}."
+ERROR_CLI_NO_USERNAME = "No username given. Pass --username, or set ${}."
+ERROR_VAULT_WRONG_MASTER_PASSWORD = "Wrong master password."
+
 ERROR_USER_ABORT = "Command execution was cancelled by user. Aborting..."
 
 ERROR_INVALID_SIGNATURE = """WARNING: Entry signature is invalid.\n
@@ -0,0 +1,127 @@
+"""
+Background conversion of entries encrypted by older versions, from Fernet tokens to AEAD envelopes.
+
+The job runs on a thread with its own database connection, and converts a small batch of entries
+per transaction. Converted entries are no longer selected, so the job can be stopped at any point
+and carries on where it left off the next time it is started.
+"""
+import threading, sqlite3
+
+from pypass.params import *
+from pypass.consts import *
+from pypass.helpers import *
+from pypass.envelope import ENVELOPE_VERSION, is_envelope
+from pypass.masterauth import UserAuth
+from pypass.dbconn import close_thread_connections
+
+ENCRYPTED_COLUMNS = [col_name for col_name in DB_COLUMN_NAMES if DB_COLUMNS[col_name]['encrypted']]
+# Entries with at least one value that is not an envelope
+SQL_NOT_CONVERTED = ' OR '.join(f"substr({col_name}, 1, 1) != x'{ENVELOPE_VERSION:02x}'" for col_name in ENCRYPTED_COLUMNS)
+
+def count_unconverted_entries(user_auth)->int:
+    with user_auth.conn as conn:
+        return conn.execute(f'SELECT count(*) FROM {DB_TABLE} WHERE {SQL_NOT_CONVERTED}').fetchone()[0]
+
+def convert_entries(user_auth, after_id:int=0, batch_size:int=ENVELOPE_CONVERT_BATCH_SIZE)->tuple[int, int, int]:
+    """
+    Convert the next batch of entries with an entry ID greater than after_id, in one transaction.
+    Entries with an invalid signature are skipped, so that a tampered entry is never signed again.
+
+    (Returns)
+        (last entry ID of the batch, number of converted entries, number of skipped entries).
+        The last entry ID is 0 when there are no entries left.
+    """
+    conn = user_auth.conn
+    n_converted = 0
+    n_skipped = 0
+    last_id = 0
+    # Take the write lock before reading, so no entry changes between reading and converting it
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.cursor()
+        sql = f'SELECT * FROM {DB_TABLE} WHERE entry_id > ? AND ({SQL_NOT_CONVERTED}) ORDER BY entry_id LIMIT ?'
+        cur.execute(sql, [after_id, batch_size])
+        for row in cur.fetchall():
+            entry_id = row[DB_COLUMNS['entry_id']['index']]
+            last_id = entry_id
+            if not user_auth.verify_entry(row):
+                n_skipped += 1
+                continue
+            new_row = list(row)
+            for col_name in ENCRYPTED_COLUMNS:
+                idx = DB_COLUMNS[col_name]['index']
+                if row[idx] is None or is_envelope(row[idx]):
+                    continue
+                value = user_auth.decrypt(row[idx], entry_id, col_name, failed=None)
+                # An empty value is encrypted too, as db_add_entry() does
+                new_row[idx] = user_auth.encrypt(value, entry_id, col_name) if value is not None else None
+                value = b''
+            if None in [new_row[DB_COLUMNS[col_name]['index']] for col_name in ENCRYPTED_COLUMNS]:
+                # Could not decrypt
+                n_skipped += 1
+                continue
+            sql_cols = ', '.join(f'{col_name}=?' for col_name in ENCRYPTED_COLUMNS)
+            cur.execute(f'UPDATE {DB_TABLE} SET {sql_cols} WHERE entry_id=?', \
+                [new_row[DB_COLUMNS[col_name]['index']] for col_name in ENCRYPTED_COLUMNS] + [entry_id])
+            user_auth.resign_entry(cur, new_row)
+            n_converted += 1
+        cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return last_id, n_converted, n_skipped
+
+class EnvelopeConversion(threading.Thread):
+    """Converts all entries of a user in the background. See convert_entries()."""
+    def __init__(self, username:str, master_key:bytes, batch_size:int=ENVELOPE_CONVERT_BATCH_SIZE):
+        super().__init__(name='pypass-envelope-conversion', daemon=True)
+        self.username = username
+        self.master_key = master_key
+        self.batch_size = batch_size
+        self.stop_event = threading.Event()
+        self.n_converted = 0
+        self.n_skipped = 0
+        self.error = None
+
+    def run(self):
+        # SQLite connections belong to the thread that opened them
+        user_auth = UserAuth(self.username, self.master_key)
+        try:
+            last_id = 0
+            while not self.stop_event.is_set():
+                last_id, n_converted, n_skipped = convert_entries(user_auth, last_id, self.batch_size)
+                self.n_converted += n_converted
+                self.n_skipped += n_skipped
+                if not last_id:
+                    break
+        except sqlite3.DatabaseError as e:
+            # Left for the next start
+            self.error = e
+        finally:
+            del user_auth
+            close_thread_connections()
+            self.master_key = b''
+
+    def stop(self):
+        """Stop after the current batch, and wait for the thread to finish"""
+        self.stop_event.set()
+        self.join()
+
+# Job of this process, if any
+_conversion = None
+
+def start_envelope_conversion(user_auth)->EnvelopeConversion:
+    """Start converting the entries of a user in the background, if any are left. Returns the job or None."""
+    global _conversion
+    if count_unconverted_entries(user_auth) == 0:
+        return None
+    _conversion = EnvelopeConversion(user_auth.username, user_auth.master_key)
+    _conversion.start()
+    return _conversion
+
+def stop_envelope_conversion():
+    global _conversion
+    if _conversion is not None:
+        _conversion.stop()
+        _conversion = None
@@ -0,0 +1,128 @@
+"""
+Connection manager of the SQLite databases.
+
+Each database is opened once per thread (SQLite connections belong to the thread that opened them)
+and kept open, so repeated lookups reuse the connection and its statement cache. On opening, the
+connection is tuned with the DB_* pragmas, and the pending schema migrations of the database are run
+(see migrations.py), so schema changes cost nothing on later connections.
+
+Connections are not carried over fork(): a child process opens its own.
+Writes that other processes may race with go through run_transaction().
+"""
+import os, time, random, threading, sqlite3
+
+from pypass.params import *
+
+_local = threading.local()
+
+def thread_connections()->dict:
+    """Open connections of the current thread, by database path"""
+    if getattr(_local, 'pid', None) != os.getpid():
+        # Inherited from the parent process. Never used, nor closed, since the parent still owns them.
+        _local.pid = os.getpid()
+        _local.conns = {}
+    return _local.conns
+
+def tune_connection(conn:sqlite3.Connection, schema:str='main'):
+    conn.execute(f'PRAGMA {schema}.journal_mode={DB_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA {schema}.synchronous={DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA {schema}.cache_size={DB_CACHE_SIZE}')
+    conn.execute(f'PRAGMA {schema}.mmap_size={DB_MMAP_SIZE}')
+
+def get_schema_version(conn:sqlite3.Connection)->int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn:sqlite3.Connection, migrations:list):
+    """
+    Run the migrations that the database did not have yet. Migration i (from 1) is migrations[i - 1](cur),
+    and runs in one transaction with setting the schema version to i.
+    """
+    if get_schema_version(conn) > len(migrations):
+        raise sqlite3.DatabaseError(f"The schema version of the database is {get_schema_version(conn)}, \
+which is newer than this version of PyPass.")
+    def apply(cur:sqlite3.Cursor, version:int):
+        # Another process may have applied it while this one waited for the lock
+        if get_schema_version(conn) < version:
+            migrations[version - 1](cur)
+            cur.execute(f'PRAGMA user_version={int(version)}')
+    for version in range(get_schema_version(conn) + 1, len(migrations) + 1):
+        run_transaction(conn, apply, version)
+
+def get_connection(path:str, *, migrations:list=[], attach:dict={})->sqlite3.Connection:
+    """
+    The connection of the current thread to a database, opened on first use.
+
+    migrations
+        Schema migrations of the database, run when it is opened if it does not have them yet
+
+    attach
+        {schema name: path} of databases to attach, when the connection is opened
+    """
+    conns = thread_connections()
+    conn = conns.get(path)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+    try:
+        tune_connection(conn)
+        migrate(conn, migrations)
+        for schema, attach_path in attach.items():
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', [attach_path])
+            tune_connection(conn, schema)
+    except BaseException:
+        conn.close()
+        raise
+    conns[path] = conn
+    return conn
+
+def close_connection(path:str):
+    """Close the connection of the current thread to a database, e.g. before deleting its file"""
+    conn = thread_connections().pop(path, None)
+    if conn is not None:
+        conn.close()
+
+def close_thread_connections():
+    """Close all connections of the current thread. Threads that end without calling this leave them to the GC."""
+    conns = thread_connections()
+    while conns:
+        _, conn = conns.popitem()
+        conn.close()
+
+def is_busy_error(e:sqlite3.OperationalError)->bool:
+    """The database was locked by another connection"""
+    errorcode = getattr(e, 'sqlite_errorcode', None) # Python 3.11+
+    if errorcode is not None:
+        return errorcode in [sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED]
+    return 'locked' in str(e) or 'busy' in str(e)
+
+def run_transaction(conn:sqlite3.Connection, func, *args, attempts:int=DB_RETRY_ATTEMPTS):
+    """
+    Run func(cur, *args) in a write transaction, and commit. Returns what func returns.
+
+    The write lock is taken before func reads anything (BEGIN IMMEDIATE), so nothing it read can
+    change before it commits. If the database stays locked by another process for longer than
+    DB_BUSY_TIMEOUT, the transaction is rolled back and run again after an exponential backoff.
+    func must only change the database, so that it can run again.
+    """
+    delay = DB_RETRY_DELAY
+    for attempt in range(attempts):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cur = conn.cursor()
+            try:
+                result = func(cur, *args)
+            finally:
+                cur.close()
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        time.sleep(delay * (1 + random.random()))
+        delay *= 2
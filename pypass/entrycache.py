@@ -0,0 +1,75 @@
+"""
+Session-scoped cache of decrypted entry values.
+
+Entries are keyed by (entry_id, entry_hash), so a cached value is never served for an entry
+that changed since. Plaintext is kept in bytearrays, which are overwritten when an entry expires,
+is evicted, invalidated or cleared. Copies handed out to callers are not covered by this.
+"""
+import threading, time
+from collections import OrderedDict
+
+def wipe(buf:bytearray):
+    """Overwrite a buffer with zeros, in place"""
+    buf[:] = bytes(len(buf))
+
+class EntryCache:
+    """Bounded LRU cache of decrypted columns of entries, with a time to live"""
+    def __init__(self, max_entries:int, ttl:float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # entry_id -> [entry_hash, expiry time, {col_name: bytearray}], least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def drop(self, entry_id:int):
+        """Remove an entry and overwrite its plaintext. The lock must be held."""
+        entry = self.entries.pop(entry_id, None)
+        if entry is not None:
+            for buf in entry[2].values():
+                wipe(buf)
+
+    def get(self, entry_id:int, entry_hash:bytes, col_name:str)->bytes:
+        """Returns the cached plaintext of a column, or None"""
+        with self.lock:
+            entry = self.entries.get(entry_id)
+            if entry is not None and (entry[0] != entry_hash or entry[1] < time.monotonic()):
+                # Changed or expired
+                self.drop(entry_id)
+                entry = None
+            if entry is None or col_name not in entry[2]:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            return bytes(entry[2][col_name])
+
+    def put(self, entry_id:int, entry_hash:bytes, col_name:str, plaintext:bytes):
+        with self.lock:
+            entry = self.entries.get(entry_id)
+            if entry is None or entry[0] != entry_hash:
+                self.drop(entry_id)
+                entry = [entry_hash, time.monotonic() + self.ttl, {}]
+                self.entries[entry_id] = entry
+            else:
+                self.entries.move_to_end(entry_id)
+            if col_name in entry[2]:
+                wipe(entry[2][col_name])
+            entry[2][col_name] = bytearray(plaintext)
+            # Evict the least recently used entries
+            while len(self.entries) > self.max_entries:
+                self.drop(next(iter(self.entries)))
+
+    def invalidate(self, entry_id:int):
+        with self.lock:
+            self.drop(entry_id)
+
+    def clear(self):
+        with self.lock:
+            for entry_id in list(self.entries):
+                self.drop(entry_id)
+
+    def stats(self)->dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
@@ -0,0 +1,34 @@
+"""
+Raw binary AEAD envelope for encrypted values.
+
+Layout: version byte, 12-byte random nonce, AES-256-GCM ciphertext with a 16-byte tag.
+The associated data binds a value to the entry and column it is stored in, so a ciphertext
+copied into another entry or column fails to decrypt.
+
+Values encrypted by older versions are base64 Fernet tokens. They always start with 'g'
+(the 0x80 version byte of Fernet), so they are never mistaken for an envelope.
+"""
+import os, struct
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+ENVELOPE_VERSION = 1
+ENVELOPE_NONCE_SIZE = 12
+ENVELOPE_TAG_SIZE = 16
+ENVELOPE_AD = struct.Struct('<Bq') # version, entry_id, followed by the column name
+
+def envelope_ad(entry_id:int, col_name:str)->bytes:
+    return ENVELOPE_AD.pack(ENVELOPE_VERSION, entry_id) + col_name.encode('utf-8')
+
+def is_envelope(data:bytes)->bool:
+    return type(data) == bytes and len(data) > 0 and data[0] == ENVELOPE_VERSION
+
+def seal(aead:AESGCM, data:bytes, ad:bytes)->bytes:
+    nonce = os.urandom(ENVELOPE_NONCE_SIZE)
+    return bytes([ENVELOPE_VERSION]) + nonce + aead.encrypt(nonce, data, ad)
+
+def open_envelope(aead:AESGCM, data:bytes, ad:bytes)->bytes:
+    """Raises cryptography.exceptions.InvalidTag if the envelope was tampered with or the key or ad is wrong"""
+    if len(data) < 1 + ENVELOPE_NONCE_SIZE + ENVELOPE_TAG_SIZE:
+        raise ValueError("envelope.open_envelope(): Envelope is truncated.")
+    return aead.decrypt(data[1:1 + ENVELOPE_NONCE_SIZE], data[1 + ENVELOPE_NONCE_SIZE:], ad)
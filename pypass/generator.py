@@ -1,4 +1,4 @@
-import random
+import os, re, random
 
 from pypass.params import *
 from pypass.consts import *
@@ -37,6 +37,9 @@ PARAM_STRONG_PW_ALPHABET_LOWER_MIN_CNT = 1
 PARAM_STRONG_PW_NUMBER_MIN_CNT = 1
 PARAM_STRONG_PW_SPECIAL_CHARS_MIN_CNT = 1
 
+# Number of bytes read from the OS CSPRNG at once by the batch generator
+PARAM_PWGEN_RANDOM_CHUNK_SIZE = 2 ** 16
+
 # Randomly select one element from an iterable or string
 def select_one_random(iter):
     return iter[generate_random_int(0, len(iter))]
@@ -54,7 +57,8 @@ def max_consecutive_same_characters(text:str)->int:
                 max_consecutive = current_consecutive
             current_consecutive = 1
         previous_ch = current_ch
-    return max_consecutive
+    # The last run is not compared inside the loop
+    return max(max_consecutive, current_consecutive)
 
 # Generates strong new password
 def generate_random_pw():
@@ -126,4 +130,161 @@ def generate_strong_random_pw():
     gen = generate_random_pw()
     while not is_password_strong(gen):
         gen = generate_random_pw()
-    return gen
\ No newline at end of file
+    return gen
+
+# ######### BATCH GENERATOR #########
+
+def build_sampling_table(values:bytes)->tuple[bytes, bytes]:
+    """
+    Build a table for bytes.translate() that maps a random byte onto one of the given values.
+    Bytes above the largest multiple of len(values) are returned separately as bytes to delete,
+    so that every value stays equally likely.
+    """
+    n_values = len(values)
+    if not 0 < n_values <= 256:
+        raise ValueError("generator.build_sampling_table(): 1 to 256 values are required.")
+    usable = 256 - 256 % n_values
+    table = bytes(values[b % n_values] if b < usable else 0 for b in range(256))
+    return table, bytes(range(usable, 256))
+
+class RandomBuffer:
+    """
+    Hands out random bytes read from the OS CSPRNG in large chunks,
+    so that generating many passwords only costs a few system calls.
+    """
+    def __init__(self, chunk_size:int=PARAM_PWGEN_RANDOM_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.buf = b''
+        self.pos = 0
+
+    def read(self, size:int)->bytes:
+        """Read size random bytes"""
+        if self.pos + size > len(self.buf):
+            # Refill, keeping what is left of the current chunk
+            self.buf = self.buf[self.pos:] + os.urandom(max(size, self.chunk_size))
+            self.pos = 0
+        data = self.buf[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def sample(self, table:tuple[bytes, bytes], size:int)->bytes:
+        """
+        Draw size values through a table built by build_sampling_table().
+        Mapping and rejection of random bytes both run inside bytes.translate().
+        """
+        trans, reject = table
+        out = b''
+        while len(out) < size:
+            need = size - len(out)
+            # Over-draw a little, so that one read is almost always enough
+            out += self.read(need + need // 4 + 16).translate(trans, reject)
+        return out[:size]
+
+    def randbelow_many(self, count:int)->memoryview:
+        """
+        Returns count random unsigned 32-bit integers.
+        Scale each one to the range 0 ~ (m - 1) with (value * m) >> 32.
+        """
+        return memoryview(self.read(4 * count)).cast('I')
+
+    def randbelow(self, m:int)->int:
+        """Random integer in range 0 ~ (m - 1)"""
+        return (self.randbelow_many(1)[0] * m) >> 32
+
+PWGEN_CHARSETS = [ALPHABET_UPPER, ALPHABET_LOWER, NUMBERS, SPECIAL_CHARS]
+PWGEN_CHARSETS_MIN_CNT = [
+    PARAM_STRONG_PW_ALPHABET_UPPER_MIN_CNT,
+    PARAM_STRONG_PW_ALPHABET_LOWER_MIN_CNT,
+    PARAM_STRONG_PW_NUMBER_MIN_CNT,
+    PARAM_STRONG_PW_SPECIAL_CHARS_MIN_CNT
+]
+
+# Precomputed sampling tables for the default password rules
+PWGEN_POOL_TABLE = build_sampling_table(''.join(PWGEN_CHARSETS).encode())
+PWGEN_CHARSET_TABLES = [build_sampling_table(charset.encode()) for charset in PWGEN_CHARSETS]
+
+# Same character repeated PARAM_STRONG_PW_MAX_CONS times in a row
+RE_FORBIDDEN_RUN = re.compile(rb'(.)\1{%d}' % (PARAM_STRONG_PW_MAX_CONS - 1), re.DOTALL)
+
+def break_forbidden_runs(pw:bytearray, charset_of:dict, rbuf:RandomBuffer, re_run=RE_FORBIDDEN_RUN):
+    """
+    Replace the last character of every forbidden run with another character
+    of the same character set. The number of characters in each set is kept as is.
+    """
+    match = re_run.search(pw)
+    while match:
+        pos = match.end() - 1
+        charset = charset_of[pw[pos]]
+        # Avoid starting a new run with the next character if possible
+        candidates = bytes(ch for ch in charset if ch not in pw[pos:pos + 2]) or \
+            bytes(ch for ch in charset if ch != pw[pos])
+        if not candidates:
+            raise ValueError("generator.break_forbidden_runs(): Character set is too small.")
+        pw[pos] = candidates[rbuf.randbelow(len(candidates))]
+        match = re_run.search(pw)
+
+def generate_passwords(n:int, min_len:int=PARAM_PWGEN_MIN_LENGTH, max_len:int=PARAM_PWGEN_MAX_LENGTH, \
+    *, rbuf:RandomBuffer=None)->list[str]:
+    """
+    Generate n strong random passwords at once.
+
+    All randomness is drawn in bulk from a CSPRNG buffer. The required number of characters
+    from each character set is placed at random positions, and the rest is drawn uniformly
+    from all character sets, so every password passes is_password_strong() without
+    regenerating.
+
+    min_len, max_len
+        Password length is chosen uniformly in range min_len ~ (max_len - 1),
+        the same as generate_random_pw().
+    
+    rbuf
+        A RandomBuffer to draw randomness from. A new one is used if not provided.
+    """
+    return generate_passwords_from_tables(n, min_len, max_len, PWGEN_POOL_TABLE, \
+        PWGEN_CHARSETS, PWGEN_CHARSET_TABLES, PWGEN_CHARSETS_MIN_CNT, rbuf=rbuf)
+
+def generate_passwords_from_tables(n:int, min_len:int, max_len:int, pool_table:tuple, \
+    charsets:list, charset_tables:list, charsets_min_cnt:list, *, \
+    rbuf:RandomBuffer=None, re_run=RE_FORBIDDEN_RUN)->list[str]:
+    """
+    Batch password generation from precomputed sampling tables.
+    See generate_passwords() for the default rules.
+    """
+    n_required = sum(charsets_min_cnt)
+    if min_len < n_required or max_len <= min_len or max_len - min_len > 256:
+        raise ValueError(f"generator.generate_passwords(): Invalid length range {min_len} ~ {max_len}.")
+    if n <= 0:
+        return []
+    if rbuf is None:
+        rbuf = RandomBuffer()
+
+    # Draw every random value for the whole batch up front
+    len_table = build_sampling_table(bytes(range(max_len - min_len)))
+    lengths = [min_len + offset for offset in rbuf.sample(len_table, n)]
+    fill = rbuf.sample(pool_table, sum(lengths) - n * n_required)
+    required = [rbuf.sample(table, n * cnt) if cnt else b'' \
+        for table, cnt in zip(charset_tables, charsets_min_cnt)]
+    positions = rbuf.randbelow_many(n * n_required)
+
+    charset_of = {}
+    for charset in charsets:
+        charset_bytes = charset.encode()
+        for ch in charset_bytes:
+            charset_of[ch] = charset_bytes
+
+    passwords = []
+    fill_pos = 0
+    rand_pos = 0
+    for i, pw_len in enumerate(lengths):
+        fill_len = pw_len - n_required
+        pw = bytearray(fill[fill_pos:fill_pos + fill_len])
+        fill_pos += fill_len
+        # Insert required characters at uniformly random positions
+        for chars, cnt in zip(required, charsets_min_cnt):
+            for ch in chars[i * cnt:(i + 1) * cnt]:
+                pw.insert((positions[rand_pos] * (len(pw) + 1)) >> 32, ch)
+                rand_pos += 1
+        break_forbidden_runs(pw, charset_of, rbuf, re_run)
+        passwords.append(pw.decode())
+    
+    return passwords
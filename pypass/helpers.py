@@ -1,25 +1,32 @@
 # Python standard Libraries
-import os, hashlib, base64, datetime, sqlite3
-
-# 3rd parties
-from PyInquirer import prompt
+import os, struct, hashlib, base64, datetime, sqlite3
+from functools import lru_cache
 
 # Local
 from pypass.params import *
-from pypass.consts import ERROR_USER_ABORT, ERROR_DATABASE_ERROR, ERROR_INVALID_SIGNATURE
+from pypass.consts import ERROR_USER_ABORT, ERROR_DATABASE_ERROR, ERROR_INVALID_SIGNATURE, ERROR_ENTRY_CHECK_FAILED, \
+    ERROR_ENTRY_CONFLICT
+from pypass.dbconn import get_connection, close_connection, run_transaction
+from pypass.migrations import VAULT_MIGRATIONS, db_create_search_index
+
+def scrypt_memory(n:int, r:int, p:int)->int:
+    """Bytes of memory used by scrypt with the given parameters"""
+    return 128 * r * (n + p + 2)
 
-def generate_key(pw:str, salt=None)->tuple[bytes, bytes]:
+def generate_key(pw:str, salt=None, kdf_params:tuple=(SCRYPT_N, SCRYPT_R, SCRYPT_P))->tuple[bytes, bytes]:
     """
     Generate a key to initialize Fernet
     If the optional salt argument is provided, use the provided salt.
     If not, generate a random salt.
+    kdf_params are the (n, r, p) parameters of scrypt, see kdf.py.
     """
     pw_bytes = pw.encode()
     pw_salt = salt
     if not pw_salt:
         pw_salt = os.urandom(16) # Generate random new salt
-    pw_hashed = hashlib.scrypt(pw_bytes, salt=pw_salt, n=SCRYPT_N, \
-        r=SCRYPT_R, p=SCRYPT_P, maxmem=SCRYPT_MAX_MEM, dklen=SCRYPT_DKLEN)
+    n, r, p = kdf_params
+    pw_hashed = hashlib.scrypt(pw_bytes, salt=pw_salt, n=n, r=r, p=p, \
+        maxmem=max(SCRYPT_MAX_MEM, scrypt_memory(n, r, p)), dklen=SCRYPT_DKLEN)
     key = base64.urlsafe_b64encode(pw_hashed)
     return key, pw_salt
 
@@ -36,6 +43,19 @@ def format_date_from_ts(ts:int)->str:
     dt = datetime.datetime.fromtimestamp(ts)
     return dt.strftime(date_format)
 
+def prompt(questions:list)->dict:
+    """
+    PyInquirer prompt. PyInquirer is imported on first use,
+    so code paths that never prompt do not pay for loading it.
+    """
+    from PyInquirer import prompt as inquirer_prompt
+    return inquirer_prompt(questions)
+
+def separator():
+    """Separator of the choices of a PyInquirer list prompt, see prompt()"""
+    from PyInquirer import Separator
+    return Separator()
+
 def ask_yn(prompt_msg:str, default_ans=False)->bool:
     """
     Ask a yes/no question to the user, return answer as boolean value
@@ -57,83 +77,177 @@ def handle_keyboard_interrupt():
 
 # ######### DB HELPERS #########
 
-def db_create_table(conn:sqlite3.Connection, table_name:str, cols:dict, if_not_exists:bool=True):
-    # Construct SQL query
-    sql = 'CREATE TABLE '
-    if if_not_exists:
-        sql += 'IF NOT EXISTS '
-    sql += table_name
-    sql += '('
-    sql_cols = ''
-    for col_name in cols:
-        sql_cols += col_name + ' '
-        sql_cols += cols[col_name]['type']
-        sql_cols += ', '
-    # Remove the last trailing comma
-    sql += sql_cols[:-2]
-    sql += ')'
-    # and execute
-    with conn:
+def db_filepath(username:str)->str:
+    return os.path.join(DATA_DNAME, username + DB_FILE_EXT)
+
+def db_connect(username:str, *, attach:dict={})->sqlite3.Connection:
+    """The connection of the current thread to the vault of a user, see dbconn.py"""
+    return get_connection(db_filepath(username), migrations=VAULT_MIGRATIONS, attach=attach)
+
+def db_remove(username:str):
+    """Close the connection of the current thread to the vault of a user, and delete its files"""
+    close_connection(db_filepath(username))
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(db_filepath(username) + suffix):
+            os.remove(db_filepath(username) + suffix)
+
+def db_get_entry_policy(user_auth, entry_id:int)->str:
+    """
+    Returns the password policy stored for an entry, or an empty string if there is none.
+    """
+    sql = f'SELECT policy FROM {POLICY_DB_TABLE} WHERE entry_id=?'
+    try:
+        with user_auth.conn as conn:
+            cur = conn.cursor()
+            cur.execute(sql, [entry_id])
+            row = cur.fetchone()
+            cur.close()
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+        return ''
+    return row[0] if row else ''
+
+def db_set_entry_policy(cur:sqlite3.Cursor, entry_id:int, policy:str):
+    """
+    Store the password policy of an entry using the given cursor.
+    An empty policy removes the stored one.
+    """
+    if policy:
+        sql = f'INSERT OR REPLACE INTO {POLICY_DB_TABLE}(entry_id, policy) VALUES(?, ?)'
+        cur.execute(sql, [entry_id, policy])
+    else:
+        cur.execute(f'DELETE FROM {POLICY_DB_TABLE} WHERE entry_id=?', [entry_id])
+
+def db_set_entry_fingerprint(cur:sqlite3.Cursor, entry_id:int, fingerprint:bytes):
+    """Store the password fingerprint of an entry using the given cursor"""
+    sql = f'INSERT OR REPLACE INTO {FINGERPRINT_DB_TABLE}(entry_id, fingerprint) VALUES(?, ?)'
+    cur.execute(sql, [entry_id, fingerprint])
+
+def db_find_pw_reuse(user_auth, user_pw:str, exclude_entry_id:int=0)->list:
+    """
+    Find other entries that use the same password, with a single indexed lookup.
+    Returns a list of (entry_id, name) tuples.
+    """
+    sql = f'SELECT c.entry_id, c.name FROM {FINGERPRINT_DB_TABLE} f '
+    sql += f'JOIN {DB_TABLE} c ON c.entry_id = f.entry_id '
+    sql += 'WHERE f.fingerprint=? AND f.entry_id!=?'
+    try:
+        with user_auth.conn as conn:
+            cur = conn.cursor()
+            cur.execute(sql, [user_auth.fingerprint(user_pw), exclude_entry_id])
+            rows = cur.fetchall()
+            cur.close()
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+        return []
+    return rows
+
+def db_backfill_fingerprints(user_auth)->int:
+    """
+    Compute password fingerprints for entries that do not have one yet.
+    Entries whose password cannot be decrypted are skipped, so they are not reported as reusing a password.
+    Returns the number of entries updated.
+    """
+    sql = f'SELECT c.entry_id, c.user_pw FROM {DB_TABLE} c '
+    sql += f'LEFT JOIN {FINGERPRINT_DB_TABLE} f ON f.entry_id = c.entry_id '
+    sql += 'WHERE f.entry_id IS NULL'
+    with user_auth.conn as conn:
         cur = conn.cursor()
         cur.execute(sql)
+        n_updated = 0
+        for entry_id, user_pw_enc in cur.fetchall():
+            user_pw = user_auth.decrypt(user_pw_enc, entry_id, 'user_pw', failed=None)
+            if user_pw is None:
+                continue
+            db_set_entry_fingerprint(cur, entry_id, user_auth.fingerprint(user_pw))
+            n_updated += 1
         cur.close()
+    return n_updated
 
-def db_connect(username, *, init=False):
-    db_filename = username + DB_FILE_EXT
-    db_filepath = os.path.join(DATA_DNAME, db_filename)
-    conn = sqlite3.connect(db_filepath)
-    if init:
-        db_create_table(conn, DB_TABLE, DB_COLUMNS)
-    return conn
+def db_count_entries(user_auth)->int:
+    with user_auth.conn as conn:
+        return conn.execute(f'SELECT count(*) FROM {DB_TABLE}').fetchone()[0]
 
 def db_add_entry(user_auth,\
-     name:str, user_id:str, user_pw:str, url:str=''):
+     name:str, user_id:str, user_pw:str, url:str='', policy:str=''):
     """
-    Add an entry into the credentials database, and returns the inserted row.
-    If insertion fails, return None.
+    Add an entry into the credentials database, and returns the entry ID of the inserted row.
+    If insertion fails, return False.
+    If a password policy is given, it is stored along with the entry.
     """
     # SQL Query
     sql = f'INSERT INTO {DB_TABLE}'
-    sql += '(name, user_id, user_pw, url, date_created, date_modified) '
-    sql += 'VALUES(?, ?, ?, ?, ?, ?)'
+    sql += '(name, url, date_created, date_modified) '
+    sql += 'VALUES(?, ?, ?, ?)'
 
     # Params
-    user_id_enc = user_auth.encrypt(user_id)
-    user_pw_enc = user_auth.encrypt(user_pw)
     current_ts = get_current_ts()
-    sql_params = [name, user_id_enc, user_pw_enc, url, current_ts, current_ts]
+    sql_params = [name, url, current_ts, current_ts]
+
+    def add(cur:sqlite3.Cursor)->int:
+        cur.execute(sql, sql_params)
+        entry_id = cur.lastrowid
+        # Encrypted values are bound to the entry ID, which is known only now
+        cur.execute(f'UPDATE {DB_TABLE} SET user_id=?, user_pw=? WHERE entry_id=?', \
+            [user_auth.encrypt(user_id, entry_id, 'user_id'), user_auth.encrypt(user_pw, entry_id, 'user_pw'), entry_id])
+        if policy:
+            db_set_entry_policy(cur, entry_id, policy)
+        db_set_entry_fingerprint(cur, entry_id, user_auth.fingerprint(user_pw))
+        # Sign the entry, in the same transaction
+        db_resign_entry(user_auth, cur, entry_id)
+        return entry_id
 
-    entry_id = -1
     # Run SQL
     try:
-        with user_auth.conn as conn:
-            cur = conn.cursor()
-            cur.execute(sql, sql_params)
-            entry_id = cur.lastrowid
-            cur.close()
+        return run_transaction(user_auth.conn, add)
     except sqlite3.DatabaseError:
         return False
-    
-    # Sign the entry
-    user_auth.sign_entry(entry_id, update_db=True)
 
-    return True
+class EntryConflictError(Exception):
+    """The entry was changed or deleted by another process since it was read"""
+    def __init__(self, entry_id:int):
+        super().__init__(ERROR_ENTRY_CONFLICT.format(entry_id))
+        self.entry_id = entry_id
 
-def db_update_entry(user_auth, entry_id:int, name:str='', user_id:str='', user_pw:str='', url:str=''):
+def db_resign_entry(user_auth, cur:sqlite3.Cursor, entry_id:int):
+    """Sign an entry as it is in the transaction of the cursor"""
+    cur.execute(f'SELECT * FROM {DB_TABLE} WHERE entry_id=?', [entry_id])
+    user_auth.resign_entry(cur, cur.fetchone())
+
+def db_update_entry(user_auth, entry_id:int, name:str='', user_id:str='', user_pw:str='', url:str='', \
+    policy:str=None, *, expected_version:int=None):
+    """
+    Update the given fields of an entry and re-sign it, in one transaction.
+    If policy is not None, the stored password policy is replaced (or removed, if empty).
+    If expected_version is given, the entry is only updated if its row_version is still the one
+    that was read, and EntryConflictError is raised otherwise. Every update increments row_version.
+    """
     to_update = {}
     if name: to_update['name'] = name
     if user_id: 
         if type(user_id) != bytes:
-            user_id = user_auth.encrypt(user_id)
+            user_id = user_auth.encrypt(user_id, entry_id, 'user_id')
         to_update['user_id'] = user_id
+    new_fingerprint = b''
     if user_pw: 
         if type(user_pw) != bytes:
-            user_pw = user_auth.encrypt(user_id)
+            new_fingerprint = user_auth.fingerprint(user_pw)
+            user_pw = user_auth.encrypt(user_pw, entry_id, 'user_pw')
+        else:
+            decrypted_pw = user_auth.decrypt(user_pw, entry_id, 'user_pw', failed=None)
+            new_fingerprint = user_auth.fingerprint(decrypted_pw) if decrypted_pw is not None else b''
+            decrypted_pw = b''
         to_update['user_pw'] = user_pw
     if url: to_update['url'] = url
-    
+
     # Quit if nothing to update
-    if len(to_update) == 0: return False
+    if len(to_update) == 0 and policy is None: return False
+
+    # Only the password policy changes: the entry itself, and its signature, stay the same
+    policy_only = len(to_update) == 0
+    if not policy_only:
+        user_auth.invalidate_entry(entry_id)
+        to_update['date_modified'] = get_current_ts()
 
     # Construct query
     sql = f'UPDATE {DB_TABLE} SET '
@@ -141,37 +255,56 @@ def db_update_entry(user_auth, entry_id:int, name:str='', user_id:str='', user_p
     for k, v in to_update.items():
         sql += f"{k}=?, "
         sql_params.append(v)
-    sql = sql[:-2] # Drop last trailing comma
-    sql += ' WHERE entry_id=?'
+    sql += 'row_version=row_version+1 WHERE entry_id=?'
     sql_params.append(entry_id)
+    if expected_version is not None:
+        # Compare and set: not if another process updated the entry since it was read
+        sql += ' AND row_version=?'
+        sql_params.append(expected_version)
+
+    def update(cur:sqlite3.Cursor):
+        cur.execute(sql, sql_params)
+        if cur.rowcount != 1:
+            raise EntryConflictError(entry_id)
+        if policy is not None:
+            db_set_entry_policy(cur, entry_id, policy)
+        if new_fingerprint:
+            db_set_entry_fingerprint(cur, entry_id, new_fingerprint)
+        # Re-sign the updated entry, in the same transaction
+        if not policy_only:
+            db_resign_entry(user_auth, cur, entry_id)
 
     # Execute query
-    conn = user_auth.conn
-    try:
-        with conn:
-            cur = conn.cursor()
-            cur.execute(sql, sql_params)
-            cur.close()
-    except sqlite3.DatabaseError:
-        print(ERROR_DATABASE_ERROR)
-        return False
-    
-    # Re-sign the updated entry
     try:
-        user_auth.sign_entry(entry_id, update_db=True)
+        run_transaction(user_auth.conn, update)
     except sqlite3.DatabaseError:
         print(ERROR_DATABASE_ERROR)
         return False
 
     return True
 
-def db_delete_entry(user_auth, entry_id:int):
+def db_delete_entry(user_auth, entry_id:int, *, expected_version:int=None):
+    """
+    Delete an entry. If expected_version is given, the entry is only deleted if its row_version
+    is still the one that was read, and EntryConflictError is raised otherwise.
+    """
+    user_auth.invalidate_entry(entry_id)
     sql = f'DELETE FROM {DB_TABLE} WHERE entry_id=?'
+    sql_params = [entry_id]
+    if expected_version is not None:
+        sql += ' AND row_version=?'
+        sql_params.append(expected_version)
+
+    def delete(cur:sqlite3.Cursor):
+        cur.execute(sql, sql_params)
+        if cur.rowcount != 1 and expected_version is not None:
+            raise EntryConflictError(entry_id)
+        db_set_entry_policy(cur, entry_id, '')
+        cur.execute(f'DELETE FROM {FINGERPRINT_DB_TABLE} WHERE entry_id=?', [entry_id])
+        user_auth.update_merkle_root(cur, entry_id)
+
     try:
-        with user_auth.conn as conn:
-            cur = conn.cursor()
-            cur.execute(sql, [entry_id])
-            cur.close()
+        run_transaction(user_auth.conn, delete)
     except sqlite3.DatabaseError:
         print(ERROR_DATABASE_ERROR)
         raise # DEBUG
@@ -200,23 +333,96 @@ def row_to_dict(row:list, cols=DB_COLUMNS)->dict:
 
     return row_dict
 
-def decrypt_row(row, user_auth, decrypt_pw=False, to_dict=False):
+# Canonical row encoding for signatures: the number of values, a (type tag, length) pair
+# for each value, then the values themselves. Integers take 8 bytes, and text is encoded.
+ROW_TYPE_NULL, ROW_TYPE_INT, ROW_TYPE_TEXT, ROW_TYPE_BLOB = range(4)
+ROW_INT_SIZE = 8
+
+@lru_cache
+def row_header(n_values:int)->struct.Struct:
+    return struct.Struct('<I' + 'BI' * n_values)
+
+# Column types of a signed credentials row, encoded without the generic loop
+SIGNED_ROW_TYPES = (int, str, bytes, bytes, str, int, int)
+SIGNED_ROW_HEADER = row_header(len(SIGNED_ROW_TYPES))
+
+def serialize_row(row)->bytes:
     """
-    Decrypts a row of credentials database.
+    Canonical binary encoding of the values of a row, for signing.
+    BLOBs are used as they are, and values cannot run into their neighbours.
     """
-    row = row_to_dict(row)
-    d_row = [] # decrypted row
-    for col_name, col_value in row.items():
-        decrypt_needed = DB_COLUMNS[col_name]['encrypted'] and \
-                            (decrypt_pw or col_name != 'user_pw') and \
-                                type(col_value) == bytes
-        if decrypt_needed:
-            d_row.append(user_auth.decrypt(col_value).decode(HASH_ENCODING))
+    if tuple(map(type, row)) == SIGNED_ROW_TYPES:
+        entry_id, name, user_id, user_pw, url, date_created, date_modified = row
+        name = name.encode(HASH_ENCODING)
+        url = url.encode(HASH_ENCODING)
+        return b''.join((SIGNED_ROW_HEADER.pack(7, ROW_TYPE_INT, ROW_INT_SIZE, ROW_TYPE_TEXT, len(name), \
+            ROW_TYPE_BLOB, len(user_id), ROW_TYPE_BLOB, len(user_pw), ROW_TYPE_TEXT, len(url), \
+            ROW_TYPE_INT, ROW_INT_SIZE, ROW_TYPE_INT, ROW_INT_SIZE), \
+            entry_id.to_bytes(ROW_INT_SIZE, 'little', signed=True), name, user_id, user_pw, url, \
+            date_created.to_bytes(ROW_INT_SIZE, 'little', signed=True), \
+            date_modified.to_bytes(ROW_INT_SIZE, 'little', signed=True)))
+
+    header = []
+    values = []
+    for value in row:
+        value_type = type(value)
+        if value_type == bytes:
+            header += [ROW_TYPE_BLOB, len(value)]
+        elif value_type == str:
+            value = value.encode(HASH_ENCODING)
+            header += [ROW_TYPE_TEXT, len(value)]
+        elif value_type == int:
+            value = value.to_bytes(ROW_INT_SIZE, 'little', signed=True)
+            header += [ROW_TYPE_INT, ROW_INT_SIZE]
+        elif value is None:
+            value = b''
+            header += [ROW_TYPE_NULL, 0]
         else:
-            d_row.append(col_value)
+            raise ValueError(f"helpers.serialize_row(): Unsupported value type '{value_type.__name__}'.")
+        values.append(value)
+    return row_header(len(row)).pack(len(row), *header) + b''.join(values)
+
+def entry_hash_version(entry_hash)->int:
+    """
+    Signature format version of an entry_hash. Signatures made before versioning are
+    hexadecimal strings, and their first byte is never a valid version number.
+    """
+    if not entry_hash or type(entry_hash) != bytes:
+        return -1
+    if entry_hash[0] >= SIGNATURE_VERSION_MAX:
+        return SIGNATURE_VERSION_LEGACY
+    return entry_hash[0]
+
+def decrypt_rows(rows:list, user_auth, decrypt_pw=False, to_dict=False)->list:
+    """
+    Decrypts rows of credentials database.
+    The values of all rows are decrypted in one batch, see UserAuth.decrypt_many().
+    """
+    rows = [row_to_dict(row) for row in rows]
+    # Encrypted values to decrypt, and where they go
+    values = []
+    positions = []
+    for row_idx, row in enumerate(rows):
+        for col_idx, (col_name, col_value) in enumerate(row.items()):
+            decrypt_needed = DB_COLUMNS[col_name]['encrypted'] and \
+                                (decrypt_pw or col_name != 'user_pw') and \
+                                    type(col_value) == bytes
+            if decrypt_needed:
+                values.append((row['entry_id'], row['entry_hash'], col_name, col_value))
+                positions.append((row_idx, col_idx))
+
+    d_rows = [list(row.values()) for row in rows] # decrypted rows
+    for (row_idx, col_idx), decrypted in zip(positions, user_auth.decrypt_entry_values(values)):
+        d_rows[row_idx][col_idx] = decrypted.decode(HASH_ENCODING)
     if to_dict:
-        d_row = row_to_dict(d_row)
-    return d_row
+        d_rows = [row_to_dict(d_row) for d_row in d_rows]
+    return d_rows
+
+def decrypt_row(row, user_auth, decrypt_pw=False, to_dict=False):
+    """
+    Decrypts a row of credentials database.
+    """
+    return decrypt_rows([row], user_auth, decrypt_pw, to_dict)[0]
 
 def prompt_choose_one_entry(rows:list, user_auth, *, return_entry_id_only=False)->sqlite3.Row:
     """
@@ -228,10 +434,12 @@ def prompt_choose_one_entry(rows:list, user_auth, *, return_entry_id_only=False)
     # Key: Text to display in PyInquirer prompt, Value: Entry ID
     prompt_choices = []
 
-    for row in rows:
-        row_dict = row_to_dict(row)
+    row_dicts = [row_to_dict(row) for row in rows]
+    user_ids = user_auth.decrypt_entry_values([(row_dict['entry_id'], row_dict['entry_hash'], \
+        'user_id', row_dict['user_id']) for row_dict in row_dicts])
+    for row_dict, user_id in zip(row_dicts, user_ids):
         # e.g. Github (userid001)
-        row_txt = f"{row_dict['name']} ({user_auth.decrypt(row_dict['user_id']).decode()})"
+        row_txt = f"{row_dict['name']} ({user_id.decode()})"
         try:
             # If there is duplicate
             duplicate_idx = prompt_choices.index(row_txt)
@@ -311,6 +519,38 @@ def prompt_invalid_entry_action():
     return chosen_action
 
 
+# SQLite of this process has no FTS5 or trigram tokenizer
+_search_index_unsupported = False
+
+def search_index_available(conn:sqlite3.Connection)->bool:
+    """
+    The vault has the full-text index. A vault migrated by a SQLite without FTS5 gets it here,
+    once SQLite has it, see migrations.py.
+    """
+    global _search_index_unsupported
+    sql = 'SELECT 1 FROM main.sqlite_master WHERE type = ? AND name = ?'
+    if conn.execute(sql, ['table', SEARCH_DB_TABLE]).fetchone() is not None:
+        return True
+    if _search_index_unsupported:
+        return False
+    _search_index_unsupported = not run_transaction(conn, db_create_search_index)
+    return not _search_index_unsupported
+
+def search_sql(query:str, query_by:str='', *, use_index:bool=True)->tuple[str, list]:
+    """
+    SQL query and parameters of the entries whose name or url (or query_by) contains query.
+    With use_index, the full-text index is searched, and the results are ranked by bm25.
+    """
+    cols = [query_by] if query_by else SEARCH_DB_COLUMNS
+    if use_index and len(query) >= SEARCH_INDEX_MIN_QUERY_LEN and all(col in SEARCH_DB_COLUMNS for col in cols):
+        # A quoted phrase of trigrams matches any substring, and its characters have no special meaning
+        match = f'{{{" ".join(cols)}}} : "' + query.replace('"', '""') + '"'
+        sql = f'SELECT {DB_TABLE}.* FROM {SEARCH_DB_TABLE} JOIN {DB_TABLE} ON {DB_TABLE}.entry_id = {SEARCH_DB_TABLE}.rowid'
+        sql += f' WHERE {SEARCH_DB_TABLE} MATCH ? ORDER BY {SEARCH_DB_TABLE}.rank'
+        return sql, [match]
+    sql = f'SELECT * FROM {DB_TABLE} WHERE ' + ' OR '.join(f'({col} LIKE ?)' for col in cols)
+    return sql, [f'%{query}%'] * len(cols)
+
 def get_multiple_entries(user_auth, query:str='', *, query_by:str='', decrypt=False):
     # If no query is supplied, ask.
     if not query:
@@ -325,32 +565,17 @@ def get_multiple_entries(user_auth, query:str='', *, query_by:str='', decrypt=Fa
         query = prompt(search_query_question)['query']
 
     # Construct SQL query
-    sql = f'SELECT * FROM {DB_TABLE}'
-    sql_params = []
-    if query:
-        if not query_by:
-            # Search by name and url
-            sql += ' WHERE (name LIKE ?) OR (url LIKE ?)'
-            sql_params.append(f'%{query}%')
-            sql_params.append(f'%{query}%')
-        else:
-            if query in DB_COLUMN_NAMES:
-                sql += f' WHERE {query_by} LIKE ?'
-                sql_params.append(f'%{query}%')
-            else:
-                raise ValueError(f"helpers.get_multiple_entries(): \
-                    Invalid query_by '{query_by}'.")
-    else:
+    if not query:
         raise ValueError("helpers.get_multiple_entries(): Empty query")
+    if query_by and query_by not in DB_COLUMN_NAMES:
+        raise ValueError(f"helpers.get_multiple_entries(): Invalid query_by '{query_by}'.")
+    sql, sql_params = search_sql(query, query_by, use_index=search_index_available(user_auth.conn))
     
     # Execute the query
     try:
         with user_auth.conn as conn:
             cur = conn.cursor()
-            if sql_params:
-                cur.execute(sql, sql_params)
-            else:
-                cur.execute(sql)
+            cur.execute(sql, sql_params)
     except sqlite3.DatabaseError as dbe:
         print(f"helpers.get_multiple_entries(): {query=}, {query_by=}")
         raise dbe
@@ -359,12 +584,9 @@ def get_multiple_entries(user_auth, query:str='', *, query_by:str='', decrypt=Fa
     rows = cur.fetchall()
     cur.close()
 
-    # Decrypt row before returning
+    # Decrypt rows before returning
     if decrypt:
-        decrypted_rows = []
-        for row in rows:
-            decrypted_rows.append(decrypt_row(row, user_auth))
-        return decrypted_rows
+        return decrypt_rows(rows, user_auth)
 
     return rows
 
@@ -389,8 +611,8 @@ def get_one_entry(user_auth, query:str, *, \
         print(f"Found no entry for search '{query}'.")
         return row
     
-    # Verify the entry
-    verified = user_auth.verify_entry(row)
+    # Verify the entry, and that it is the entry the vault's Merkle root was computed over
+    verified = user_auth.verify_entry(row) and user_auth.verify_membership(row)
     if not verified:
         invalid_row= row_to_dict(row)
         # Invalid signature. Ask user what to do
@@ -410,6 +632,14 @@ def get_one_entry(user_auth, query:str, *, \
 
         return row
 
+    # Entries signed with an old signature format are signed again as they are read
+    if entry_hash_version(row[DB_COLUMNS['entry_hash']['index']]) != SIGNATURE_VERSION:
+        try:
+            user_auth.resign_entries([row])
+            row = get_entry_by_id(user_auth, row[DB_COLUMNS['entry_id']['index']])
+        except sqlite3.DatabaseError:
+            print(ERROR_DATABASE_ERROR)
+
     if return_entry_id_only:
         return row[DB_COLUMNS['entry_id']['index']]
     
@@ -441,4 +671,21 @@ def get_entry_by_id(user_auth, entry_id:int, *, \
     elif to_dict:
         row = row_to_dict(row)
     
-    return row
\ No newline at end of file
+    return row
+
+def get_verified_entry(user_auth, entry_id:int):
+    """
+    Returns the row of an entry, after checking its signature and that it is the entry
+    the vault's Merkle root was computed over. Raises ValueError if it is not found or fails a check.
+    """
+    row = get_entry_by_id(user_auth, entry_id)
+    if not row:
+        raise ValueError(f"No entry with ID {entry_id}.")
+    if not (user_auth.verify_entry(row) and user_auth.verify_membership(row)):
+        raise ValueError(ERROR_ENTRY_CHECK_FAILED.format(entry_id))
+    return row
+
+def entry_to_json(entry:dict, exclude:list=[])->dict:
+    """Decrypted entry (see decrypt_rows()) as a dictionary for JSON output, without the signature"""
+    exclude = ['entry_hash', 'entry_salt'] + exclude
+    return {col_name: value for col_name, value in entry.items() if col_name not in exclude}
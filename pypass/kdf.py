@@ -0,0 +1,95 @@
+"""
+Calibration of the scrypt parameters used to derive keys from master passwords.
+
+The parameters are picked for this machine: the largest n (a power of two) that derives a key
+within a target time and memory budget, and never below KDF_MIN_N. They are saved in the data
+directory, and used for new master passwords. Each user keeps the parameters their password was
+hashed with in the master database, and is rehashed with the calibrated ones on the next login.
+
+Calibrate for a target unlock time (seconds) and memory budget (MiB):
+    python -m pypass.kdf [--time SECONDS] [--memory MIB]
+"""
+import os, json, time, hashlib, argparse
+
+from pypass.params import *
+from pypass.helpers import scrypt_memory
+
+def kdf_params_path()->str:
+    return os.path.join(DATA_DNAME, KDF_PARAMS_FNAME)
+
+def time_scrypt(n:int, r:int, p:int, repeat:int=2)->float:
+    """Seconds to derive one key, best of repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hashlib.scrypt(b'pypass-calibration', salt=os.urandom(16), n=n, r=r, p=p, \
+            maxmem=max(SCRYPT_MAX_MEM, scrypt_memory(n, r, p)), dklen=SCRYPT_DKLEN)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def calibrate(target_time:float=KDF_TARGET_TIME, max_mem:int=KDF_MAX_MEM, \
+    r:int=SCRYPT_R, p:int=SCRYPT_P)->tuple[tuple[int, int, int], float]:
+    """
+    Find the largest n within the target time and memory budget on this machine.
+    The time of scrypt grows linearly with n, so n is doubled until the next step would not fit.
+
+    (Returns)
+        ((n, r, p), seconds to derive a key with them)
+    """
+    n = KDF_MIN_N
+    elapsed = time_scrypt(n, r, p)
+    while elapsed * 2 <= target_time and scrypt_memory(n * 2, r, p) <= max_mem:
+        n *= 2
+        elapsed = time_scrypt(n, r, p)
+    return (n, r, p), elapsed
+
+def save_kdf_params(kdf_params:tuple, path:str=''):
+    path = path or kdf_params_path()
+    n, r, p = kdf_params
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'n': n, 'r': r, 'p': p}, f)
+    os.replace(path + '.tmp', path)
+
+def valid_kdf_params(kdf_params:tuple)->bool:
+    """n is a power of two, no less than KDF_MIN_N, and scrypt stays within KDF_MAX_MEM"""
+    n, r, p = kdf_params
+    return n >= KDF_MIN_N and n & (n - 1) == 0 and r >= 1 and p >= 1 and scrypt_memory(n, r, p) <= KDF_MAX_MEM
+
+# Loaded on first use
+_kdf_params = None
+
+def get_kdf_params()->tuple[int, int, int]:
+    """
+    scrypt parameters (n, r, p) for new master passwords on this machine.
+    Without a valid calibration, the defaults SCRYPT_N, SCRYPT_R, SCRYPT_P are used.
+    """
+    global _kdf_params
+    if _kdf_params is None:
+        _kdf_params = (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        try:
+            with open(kdf_params_path()) as f:
+                params = json.load(f)
+            kdf_params = (int(params['n']), int(params['r']), int(params['p']))
+            if valid_kdf_params(kdf_params):
+                _kdf_params = kdf_params
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    return _kdf_params
+
+def user_kdf_params(user:dict)->tuple[int, int, int]:
+    """scrypt parameters of a user (row of the master database, as a dictionary)"""
+    return (user.get('kdf_n') or SCRYPT_N, user.get('kdf_r') or SCRYPT_R, user.get('kdf_p') or SCRYPT_P)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--time', type=float, default=KDF_TARGET_TIME, help='Target seconds to unlock')
+    parser.add_argument('--memory', type=int, default=KDF_MAX_MEM // 2 ** 20, help='Memory budget in MiB')
+    parser.add_argument('--dry-run', action='store_true', help='Print the parameters without saving them')
+    args = parser.parse_args()
+    if args.memory * 2 ** 20 > KDF_MAX_MEM:
+        parser.error(f"--memory must be at most {KDF_MAX_MEM // 2 ** 20} MiB.")
+    (n, r, p), elapsed = calibrate(args.time, args.memory * 2 ** 20)
+    print(f"n=2**{n.bit_length() - 1}, r={r}, p={p}: {elapsed:.3f} s, {scrypt_memory(n, r, p) / 2 ** 20:.0f} MiB")
+    if not args.dry_run:
+        save_kdf_params((n, r, p))
+        print(f"Saved to '{kdf_params_path()}'. Users are rehashed on their next login.")
@@ -1,63 +1,263 @@
 # Python standard libraries
-import os, sqlite3
+import os, hmac, sqlite3, base64
+from collections import deque
 from hashlib import blake2b
 from getpass import getpass
 
 # 3rd parties
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 # Local
 from pypass.consts import *
 from pypass.params import *
 from pypass.helpers import *
+from pypass.merkle import MerkleTree
+from pypass.entrycache import EntryCache
+from pypass.envelope import envelope_ad, is_envelope, seal, open_envelope
+from pypass.kdf import get_kdf_params, user_kdf_params, valid_kdf_params
+from pypass.migrations import MASTER_MIGRATIONS
 
 class UserAuth:
-    def __init__(self, username, master_key):
+    def __init__(self, username, master_key, *, connect=True, \
+        cache_size:int=ENTRY_CACHE_SIZE, cache_ttl:float=ENTRY_CACHE_TTL):
+        """
+        connect
+            If False, no database connection is opened. Used by worker processes
+            that only encrypt and decrypt data.
+
+        cache_size, cache_ttl
+            Number of entries whose decrypted values are cached, and for how many seconds.
+            The cache is disabled if cache_size is 0.
+        """
         if username and master_key:
             self.username = username
             self.master_key = master_key
-            self.frn = Fernet(master_key)
-            self.conn = db_connect(self.username, init=True)
+            self.frn = Fernet(master_key) # Values encrypted by older versions
+            self.aead = AESGCM(blake2b(ENVELOPE_KEY_CONTEXT, digest_size=32, key=master_key).digest())
+            # Separate key for password fingerprints, so they reveal nothing about the master key
+            self.fp_key = blake2b(FINGERPRINT_KEY_CONTEXT, key=master_key).digest()
+            # Key of the MAC over the Merkle root of the vault
+            self.merkle_key = blake2b(MERKLE_KEY_CONTEXT, key=master_key).digest()
+            self.merkle = MerkleTree(self.merkle_key)
+            self.entry_cache = EntryCache(cache_size, cache_ttl) if cache_size > 0 else None
+            # Thread pool of encrypt_many() and decrypt_many(), started on first use
+            self.executor = None
+            self.conn = None
+            if connect:
+                # The Merkle root in the master database changes in the same transactions as the vault
+                self.conn = db_connect(self.username, attach={MASTER_DB_ALIAS: master_db_filepath()})
         else:
             raise ValueError("<masterauth.UserAuth> Username and master key not provided.")
 
-    def encrypt(self, data:bytes)->bytes:
+    def encrypt(self, data:bytes, entry_id:int=0, col_name:str='')->bytes:
         """
-        Encrypts the given data using the user's key
+        Encrypts the given data using the user's key, into an AEAD envelope (see envelope.py)
 
         data
             The data to encrypt. Data must either be a string or a correctly encoded bytes type.
+
+        entry_id, col_name
+            Where the encrypted data is stored. The data can only be decrypted with the same values,
+            so it cannot be moved to another entry or column.
         
         (Returns)
             The encrypted data in bytes type.
         """
         if type(data) != bytes:
             data = data.encode(HASH_ENCODING)
-        return self.frn.encrypt(data)
+        return seal(self.aead, data, envelope_ad(entry_id, col_name))
     
-    def decrypt(self, data:bytes)->bytes:
+    def decrypt(self, data:bytes, entry_id:int=0, col_name:str='', *, failed=b'')->bytes:
         """
-        Decrypts the given data using the user's key.
-        Returns an empty bytes object when decryption fails.
+        Decrypts the given data using the user's key. Both AEAD envelopes and
+        Fernet tokens of older versions (which are not bound to an entry) are accepted.
+        Returns failed (an empty bytes object by default) when decryption fails,
+        e.g. failed=None to tell a failure from an empty value.
         """
-        decrypted = b''
         try:
-            decrypted = self.frn.decrypt(data)
-        except InvalidToken:
-            decrypted = b''
-        return decrypted
+            if is_envelope(data):
+                return open_envelope(self.aead, data, envelope_ad(entry_id, col_name))
+            return self.frn.decrypt(data)
+        except (InvalidToken, InvalidTag, ValueError, TypeError):
+            return failed
+
+    def map_chunks(self, func, items, workers:int, chunk_size:int)->list:
+        """Apply func to every item, in chunks on the thread pool, and return the results in order"""
+        items = list(items)
+        if len(items) <= chunk_size or workers == 1:
+            return [func(item) for item in items]
+        workers = workers or os.cpu_count() or 1
+        if self.executor is None or self.executor._max_workers != workers:
+            if self.executor is not None:
+                self.executor.shutdown()
+            from concurrent.futures import ThreadPoolExecutor # Slow to import, and only needed for large batches
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        results = []
+        for chunk_results in self.executor.map(lambda chunk: [func(item) for item in chunk], chunks):
+            results += chunk_results
+        return results
+
+    def encrypt_many(self, data, locations=None, *, \
+        workers:int=CRYPTO_WORKERS, chunk_size:int=CRYPTO_CHUNK_SIZE)->list:
+        """
+        Encrypts a sequence of data like encrypt(). Returns the encrypted data in order.
+        locations is an optional sequence of (entry_id, col_name), one for each item of data.
+        """
+        if locations is None:
+            return self.map_chunks(self.encrypt, data, workers, chunk_size)
+        return self.map_chunks(lambda item: self.encrypt(item[0], *item[1]), zip(data, locations), \
+            workers, chunk_size)
+
+    def decrypt_many(self, tokens, locations=None, *, \
+        workers:int=CRYPTO_WORKERS, chunk_size:int=CRYPTO_CHUNK_SIZE)->list:
+        """
+        Decrypts a sequence of encrypted data like decrypt(). Returns the decrypted data in order.
+        locations is an optional sequence of (entry_id, col_name), one for each token.
+        """
+        if locations is None:
+            return self.map_chunks(self.decrypt, tokens, workers, chunk_size)
+        return self.map_chunks(lambda item: self.decrypt(item[0], *item[1]), zip(tokens, locations), \
+            workers, chunk_size)
+
+    def decrypt_entry_values(self, values:list)->list:
+        """
+        Decrypts (entry_id, entry_hash, col_name, data) values of entries in a batch.
+        Cached values are taken from the entry cache, if it is enabled, and the rest are decrypted with decrypt_many().
+        """
+        if self.entry_cache is None:
+            return self.decrypt_many([data for _, _, _, data in values], \
+                [(entry_id, col_name) for entry_id, _, col_name, _ in values])
+        results = [self.entry_cache.get(entry_id, entry_hash, col_name) for entry_id, entry_hash, col_name, _ in values]
+        missed = [i for i, result in enumerate(results) if result is None]
+        decrypted_missed = self.decrypt_many([values[i][3] for i in missed], \
+            [(values[i][0], values[i][2]) for i in missed])
+        for i, decrypted in zip(missed, decrypted_missed):
+            results[i] = decrypted
+            if decrypted:
+                self.entry_cache.put(*values[i][:3], decrypted)
+        return results
+
+    def decrypt_entry_value(self, entry_id:int, entry_hash:bytes, col_name:str, data:bytes)->bytes:
+        """Decrypts a column of an entry, through the entry cache if it is enabled"""
+        return self.decrypt_entry_values([(entry_id, entry_hash, col_name, data)])[0]
+
+    def invalidate_entry(self, entry_id:int):
+        """Drop the cached values of an entry"""
+        if self.entry_cache is not None:
+            self.entry_cache.invalidate(entry_id)
+
+    def cache_stats(self)->dict:
+        """Hit and miss counters of the entry cache"""
+        if self.entry_cache is None:
+            return {'hits': 0, 'misses': 0, 'size': 0}
+        return self.entry_cache.stats()
     
+    def fingerprint(self, user_pw)->bytes:
+        """
+        Keyed hash of a password. Equal passwords have equal fingerprints,
+        so reuse can be found without decrypting other entries.
+        """
+        if type(user_pw) != bytes:
+            user_pw = user_pw.encode(HASH_ENCODING)
+        return blake2b(user_pw, digest_size=FINGERPRINT_DIGEST_SIZE, key=self.fp_key).digest()
+
     def update_entry_hash(self, entry_id, entry_hash:bytes, entry_salt:bytes):
         sql = f'UPDATE {DB_TABLE} SET entry_hash=?, entry_salt=? WHERE entry_id=?'
         sql_params = [entry_hash, entry_salt, entry_id]
+        def update(cur:sqlite3.Cursor):
+            cur.execute(sql, sql_params)
+            self.update_merkle_root(cur, entry_id, entry_hash)
+        run_transaction(self.conn, update)
+
+    def get_merkle_change(self, cur:sqlite3.Cursor)->tuple[int, bytes]:
+        """(number of the last change, root MAC) saved in the master database"""
+        sql = f'SELECT merkle_seq, merkle_root FROM {MASTER_DB_ALIAS}.{MASTER_DB_TABLE} WHERE username=?'
+        cur.execute(sql, [self.username])
+        row = cur.fetchone()
+        return (row[0] or 0, row[1]) if row else (0, None)
+
+    def save_merkle_root(self, cur:sqlite3.Cursor, root_mac:bytes, seq:int=None):
+        """Save a new root in the master database, as the next change, and link it to the previous one in the vault"""
+        prev_seq, prev_root_mac = self.get_merkle_change(cur)
+        if seq is None:
+            seq = prev_seq + 1
+            self.merkle.set_link(cur, seq, prev_root_mac, root_mac)
+        sql = f'UPDATE {MASTER_DB_ALIAS}.{MASTER_DB_TABLE} SET merkle_root=?, merkle_seq=? WHERE username=?'
+        cur.execute(sql, [root_mac, seq, self.username])
+
+    def update_merkle_root(self, cur:sqlite3.Cursor, entry_id:int, entry_hash:bytes=None):
+        """
+        Update the leaf of an entry in the Merkle tree, or remove it if entry_hash is None,
+        and save the new root in the master database. Runs in the transaction of the cursor.
+        """
+        self.save_merkle_root(cur, self.merkle.update(cur, entry_id, entry_hash))
+
+    def get_merkle_root(self)->bytes:
+        """The Merkle root MAC saved in the master database, or None if there is none yet"""
+        sql = f'SELECT merkle_root FROM {MASTER_DB_ALIAS}.{MASTER_DB_TABLE} WHERE username=?'
+        with self.conn as conn:
+            row = conn.execute(sql, [self.username]).fetchone()
+        return row[0] if row else None
+
+    def rebuild_merkle_tree(self):
+        """Build the Merkle tree over the entries as they are now, and save its root"""
+        def rebuild(cur:sqlite3.Cursor):
+            cur.execute(f'SELECT entry_id, entry_hash FROM {DB_TABLE}')
+            self.save_merkle_root(cur, self.merkle.rebuild(cur, dict(cur.fetchall())))
+        run_transaction(self.conn, rebuild)
+
+    def repair_merkle_root(self, *, full:bool=False)->bool:
+        """
+        If the vault is one change ahead of the master database, as a crash between the commits of
+        the two files leaves them, save the root of the vault. Returns True if it was repaired.
+        A vault rolled back to an older copy is never one change ahead: changes are numbered, and MACed.
+        """
+        def repair(cur:sqlite3.Cursor)->bool:
+            seq, root_mac = self.get_merkle_change(cur)
+            link = self.merkle.get_link(cur)
+            if root_mac is None or link is None or link[:2] != (seq + 1, root_mac) \
+                or not self.merkle.check(cur, link[2], full=full):
+                return False
+            self.save_merkle_root(cur, link[2], link[0])
+            return True
+        return run_transaction(self.conn, repair)
+
+    def check_merkle_root(self, *, full:bool=False)->bool:
+        """
+        Check that no entry was added, deleted or rolled back since PyPass last changed the vault.
+        With full, the root is recomputed from every entry instead of trusting the stored tree.
+        """
+        root_mac = self.get_merkle_root()
+        if root_mac is None:
+            return False
         with self.conn as conn:
             cur = conn.cursor()
-            cur.execute(sql, sql_params)
+            result = self.merkle.check(cur, root_mac, full=full)
             cur.close()
+        return result or self.repair_merkle_root(full=full)
 
-    def sign_entry(self, entry_id:int=0, *, row:list=[], update_db:bool=False, entry_salt:bytes=b''):
+    def verify_membership(self, row)->bool:
+        """Check a single entry against the Merkle root with a membership proof"""
+        row_d = row_to_dict(row)
+        root_mac = self.get_merkle_root()
+        with self.conn as conn:
+            cur = conn.cursor()
+            proof = self.merkle.proof(cur, row_d['entry_id'])
+            result = root_mac is not None and \
+                self.merkle.verify_proof(cur, row_d['entry_id'], row_d['entry_hash'], proof, root_mac)
+            cur.close()
+        if not result and self.repair_merkle_root():
+            return self.verify_membership(row)
+        return result
+
+    def sign_entry(self, entry_id:int=0, *, row:list=[], update_db:bool=False, entry_salt:bytes=b'', \
+        version:int=SIGNATURE_VERSION):
         """
-        Sign an entry (row of a sqlite database) using BLAKE2, and return the signature
+        Sign an entry (row of a sqlite database) using BLAKE2, and return the signature.
+        The signature starts with the version byte of its format, see entry_hash_version().
         """
         # If salt not provided, randomly generate one
         return_salt = False
@@ -78,25 +278,30 @@ class UserAuth:
                 except sqlite3.DatabaseError:
                     row = []
         
-        # Initialize hash object
-        h = blake2b(digest_size=64, key=self.master_key, salt=entry_salt)
-
-        # hash except hash and salt columns
-        if len(row) == 9:
-            row = row[:-2]
+        # hash the columns before entry_hash
+        n_signed = DB_COLUMNS['entry_hash']['index']
+        if len(row) == len(DB_COLUMNS):
+            row = row[:n_signed]
         
         # Validate row
-        if len(row) != 7:
-            raise ValueError("pypass.UserAuth.sign_entry(): row length must be either 9 or 7.")
+        if len(row) != n_signed:
+            raise ValueError(f"pypass.UserAuth.sign_entry(): row length must be either {len(DB_COLUMNS)} or {n_signed}.")
         
         # Hash row
-        for column in row:
-            if type(column) != bytes:
-                if type(column != str):
-                    column = str(column)
-                column = column.encode(HASH_ENCODING)
-            h.update(column)
-        entry_hash = h.hexdigest().encode(HASH_ENCODING)
+        h = blake2b(digest_size=64, key=self.master_key, salt=entry_salt)
+        if version == SIGNATURE_VERSION_LEGACY:
+            # Columns as strings, without any separation. Only used to verify old entries.
+            for column in row:
+                if type(column) != bytes:
+                    column = str(column).encode(HASH_ENCODING)
+                h.update(column)
+            entry_hash = h.hexdigest().encode(HASH_ENCODING)
+        elif version == SIGNATURE_VERSION:
+            h.update(bytes([version]))
+            h.update(serialize_row(row))
+            entry_hash = bytes([version]) + h.digest()
+        else:
+            raise ValueError(f"pypass.UserAuth.sign_entry(): Unknown signature version {version}.")
 
         # Update the DB if necessary
         if update_db:
@@ -122,20 +327,120 @@ class UserAuth:
         Verify that the signature of a credential entry is valid. 
         Returns True if signature is valid, and False otherwise.
         """
-        row_d = row_to_dict(row)
-        good_entry_hash = self.sign_entry(row=row, entry_salt=row_d['entry_salt'])
-        return row_d['entry_hash'] == good_entry_hash
+        entry_hash = row[DB_COLUMNS['entry_hash']['index']]
+        entry_salt = row[DB_COLUMNS['entry_salt']['index']]
+        version = entry_hash_version(entry_hash)
+        if not entry_salt or version not in [SIGNATURE_VERSION, SIGNATURE_VERSION_LEGACY]:
+            return False
+        good_entry_hash = self.sign_entry(row=row, entry_salt=entry_salt, version=version)
+        return hmac.compare_digest(entry_hash, good_entry_hash)
+
+    def verify_rows(self, rows:list)->list:
+        """Returns the entry IDs of the rows with invalid signatures"""
+        return [row[DB_COLUMNS['entry_id']['index']] for row in rows if not self.verify_entry(row)]
+
+    def resign_entry(self, cur:sqlite3.Cursor, row)->bytes:
+        """
+        Sign an entry again with the current signature format, in the transaction of the cursor.
+        Only pass rows that were verified. Returns the new entry_hash.
+        """
+        entry_id = row[DB_COLUMNS['entry_id']['index']]
+        entry_hash, entry_salt = self.sign_entry(row=row)
+        cur.execute(f'UPDATE {DB_TABLE} SET entry_hash=?, entry_salt=? WHERE entry_id=?', [entry_hash, entry_salt, entry_id])
+        self.update_merkle_root(cur, entry_id, entry_hash)
+        return entry_hash
+
+    def resign_entries(self, rows:list)->dict:
+        """
+        Sign entries again with the current signature format, in a single transaction.
+        Only pass rows that were verified. Returns a dictionary of entry ID -> new entry_hash.
+        """
+        def resign(cur:sqlite3.Cursor)->dict:
+            return {row[DB_COLUMNS['entry_id']['index']]: self.resign_entry(cur, row) for row in rows}
+        return run_transaction(self.conn, resign)
+
+    def verify_all(self, *, full:bool=False, workers:int=VERIFY_WORKERS, batch_size:int=VERIFY_BATCH_SIZE)->list:
+        """
+        Verify the signatures of all entries, and return the entry IDs of the invalid ones.
+        Rows are streamed from the database and verified in batches on worker threads.
+
+        Valid entries are recorded in the verification watermark along with their entry_hash,
+        and are skipped by later scans until they change. The watermark is invalidated by
+        triggers, so it does not protect against someone who can also drop the triggers.
+        Use full=True to verify every entry regardless of the watermark.
+        Valid entries with an old signature format are signed again with the current one.
+        """
+        entry_id_idx = DB_COLUMNS['entry_id']['index']
+        entry_hash_idx = DB_COLUMNS['entry_hash']['index']
+        sql = f'SELECT c.* FROM {DB_TABLE} c'
+        if not full:
+            sql += f' LEFT JOIN {VERIFY_DB_TABLE} w ON w.entry_id = c.entry_id'
+            sql += ' WHERE w.entry_hash IS NOT c.entry_hash'
+
+        invalid = []
+        verified = []
+        legacy_rows = []
+        def collect(rows, future):
+            invalid_ids = future.result()
+            invalid.extend(invalid_ids)
+            invalid_ids = set(invalid_ids)
+            for row in rows:
+                if row[entry_id_idx] in invalid_ids:
+                    continue
+                if entry_hash_version(row[entry_hash_idx]) != SIGNATURE_VERSION:
+                    legacy_rows.append(row)
+                else:
+                    verified.append((row[entry_id_idx], row[entry_hash_idx]))
+
+        from concurrent.futures import ThreadPoolExecutor
+        max_workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            cur = self.conn.cursor()
+            cur.execute(sql)
+            # Keep a bounded number of batches in flight, so the whole table is never in memory
+            pending = deque()
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                pending.append((rows, executor.submit(self.verify_rows, rows)))
+                if len(pending) > 2 * max_workers:
+                    collect(*pending.popleft())
+            cur.close()
+            while pending:
+                collect(*pending.popleft())
+
+        # Valid entries with an old signature format are signed again
+        verified.extend(self.resign_entries(legacy_rows).items())
+
+        # Move the watermark
+        with self.conn as conn:
+            cur = conn.cursor()
+            cur.executemany(f'INSERT OR REPLACE INTO {VERIFY_DB_TABLE}(entry_id, entry_hash) VALUES(?, ?)', verified)
+            cur.executemany(f'DELETE FROM {VERIFY_DB_TABLE} WHERE entry_id=?', [(entry_id,) for entry_id in invalid])
+            cur.close()
+        return sorted(invalid)
     
     def __del__(self):
-        # Connection
-        if type(self.conn) == sqlite3.Connection:
-            self.conn.close()
+        # Connection, shared by the thread and kept open by dbconn.py
         del self.conn
-        # Fernet
-        del self.frn
+        # Threads and Fernet
+        if self.executor is not None:
+            self.executor.shutdown()
+        del self.executor
+        del self.frn, self.aead
+        # Cached plaintext overwrite and delete
+        if self.entry_cache is not None:
+            self.entry_cache.clear()
+        del self.entry_cache
         # Username
         self.username == ''
         del self.username
+        # Fingerprint and Merkle keys overwrite and delete
+        self.fp_key = os.urandom(len(self.fp_key))
+        del self.fp_key
+        self.merkle_key = os.urandom(len(self.merkle_key))
+        del self.merkle, self.merkle_key
         # Master key overwrite and delete
         master_key_len = len(self.master_key)
         self.master_key = os.urandom(master_key_len)
@@ -143,14 +448,12 @@ class UserAuth:
 
 # ######## DB HELPERS #########
 
-def master_db_create_table(conn:sqlite3.Connection):
-    db_create_table(conn, MASTER_DB_TABLE, MASTER_DB_COLUMNS)
+def master_db_filepath()->str:
+    return os.path.join(DATA_DNAME, MASTER_DB_FNAME)
 
 def master_db_connect()->sqlite3.Connection:
-    """Connect to database for master authentication"""
-    conn = sqlite3.connect(os.path.join(DATA_DNAME, MASTER_DB_FNAME))
-    master_db_create_table(conn)
-    return conn
+    """Connection of the current thread to the database for master authentication, see dbconn.py"""
+    return get_connection(master_db_filepath(), migrations=MASTER_MIGRATIONS)
 
 def get_user_if_exists(username:str, conn:sqlite3.Connection)->list:
     """
@@ -169,7 +472,7 @@ def get_user_if_exists(username:str, conn:sqlite3.Connection)->list:
     return []
 
 def master_db_add_entry(user_auth:UserAuth, \
-    master_conn:sqlite3.Connection, username:str, auth_salt:bytes):
+    master_conn:sqlite3.Connection, username:str, auth_salt:bytes, data_key_enc:bytes, kdf_params:tuple):
     """
     Adds a new entry to the Pypass user database.
 
@@ -184,12 +487,18 @@ def master_db_add_entry(user_auth:UserAuth, \
     
     auth_salt
         Salt for hashing the user's master password
+
+    data_key_enc
+        The data key of the user, wrapped with the key derived from the master password
+
+    kdf_params
+        scrypt parameters (n, r, p) the master password was hashed with
     """
-    username_enc = user_auth.encrypt(username)
+    username_enc = user_auth.encrypt(username, col_name='username_enc')
     current_ts = get_current_ts()
     sql = f'INSERT INTO {MASTER_DB_TABLE}(username, username_enc, auth_salt, \
-        date_created, date_pw_change) VALUES (?, ?, ?, ?, ?)'
-    sql_params = [username, username_enc, auth_salt, current_ts, current_ts]
+        date_created, date_pw_change, data_key_enc, kdf_n, kdf_r, kdf_p) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    sql_params = [username, username_enc, auth_salt, current_ts, current_ts, data_key_enc, *kdf_params]
     try:
         with master_conn:
             cur = master_conn.cursor()
@@ -198,6 +507,97 @@ def master_db_add_entry(user_auth:UserAuth, \
         print(ERROR_CREATE_PYPASS_USER_DATABASEERROR)
         raise
 
+# ######### DATA KEY #########
+# The vault is encrypted with a random data key. The key derived from the master password
+# only wraps the data key, so changing the master password rewraps a single value.
+
+def data_key_ad(username:str)->bytes:
+    return envelope_ad(0, 'data_key_enc') + username.encode(HASH_ENCODING)
+
+def wrap_data_key(pw_key:bytes, data_key:bytes, username:str)->bytes:
+    """Encrypt a data key with a key from generate_key(), into an AEAD envelope"""
+    return seal(AESGCM(base64.urlsafe_b64decode(pw_key)), data_key, data_key_ad(username))
+
+def unwrap_data_key(pw_key:bytes, data_key_enc:bytes, username:str)->bytes:
+    """Decrypt a wrapped data key. Returns an empty bytes object if the master password is wrong."""
+    try:
+        return open_envelope(AESGCM(base64.urlsafe_b64decode(pw_key)), data_key_enc, data_key_ad(username))
+    except (InvalidTag, ValueError, TypeError):
+        return b''
+
+def check_username_enc(data_key:bytes, user:dict)->bool:
+    """Check that username_enc of a user (row of the master database, as a dictionary) decrypts with a data key"""
+    user_auth = UserAuth(user['username'], data_key, connect=False)
+    username_dec = user_auth.decrypt(user['username_enc'], col_name='username_enc')
+    return username_dec.decode(HASH_ENCODING, errors='replace') == user['username']
+
+def unlock_data_key(conn:sqlite3.Connection, user:dict, pw_key:bytes)->bytes:
+    """
+    Returns the data key of a user, given the key derived from the master password,
+    or an empty bytes object if the master password is wrong.
+
+    Users created before data keys were introduced have their vault encrypted with the key
+    derived from the master password. That key becomes their data key, and is wrapped and saved here.
+    """
+    if user['data_key_enc']:
+        data_key = unwrap_data_key(pw_key, user['data_key_enc'], user['username'])
+    else:
+        data_key = pw_key
+        if check_username_enc(data_key, user):
+            sql = f'UPDATE {MASTER_DB_TABLE} SET data_key_enc=? WHERE username=? AND data_key_enc IS NULL'
+            with conn:
+                conn.execute(sql, [wrap_data_key(pw_key, data_key, user['username']), user['username']])
+    if not data_key or not check_username_enc(data_key, user):
+        return b''
+    return data_key
+
+def change_master_password(user_auth:UserAuth)->bool:
+    """
+    Prompt for the current and the new master password, and rewrap the data key of the user.
+    No entry is encrypted again, so this takes the same time for any size of vault.
+    Returns False if the current master password is wrong.
+    """
+    conn = master_db_connect()
+    user = row_to_dict(row=get_user_if_exists(user_auth.username, conn), cols=MASTER_DB_COLUMNS)
+    pw = ''
+    while not pw:
+        pw = getpass(PROMPT_CURRENT_MASTER_PW)
+    pw_key, _ = generate_key(pw, user['auth_salt'], user_kdf_params(user))
+    data_key = unwrap_data_key(pw_key, user['data_key_enc'], user['username'])
+    if not data_key or not hmac.compare_digest(data_key, user_auth.master_key):
+        print(ERROR_WRONG_CURRENT_MASTER_PASSWORD)
+        return False
+
+    kdf_params = get_kdf_params()
+    new_pw_key, new_salt = prompt_new_master_pw(kdf_params)
+    sql = f'UPDATE {MASTER_DB_TABLE} SET auth_salt=?, data_key_enc=?, date_pw_change=?, \
+        kdf_n=?, kdf_r=?, kdf_p=? WHERE username=?'
+    sql_params = [new_salt, wrap_data_key(new_pw_key, data_key, user['username']), get_current_ts(), \
+        *kdf_params, user['username']]
+    with conn:
+        conn.execute(sql, sql_params)
+    print(PROMPT_MASTER_PW_CHANGED)
+    return True
+
+def rehash_master_pw(conn:sqlite3.Connection, user:dict, pw:str, data_key:bytes, *, derive_key=generate_key)->bool:
+    """
+    Hash the master password of a user again with the calibrated scrypt parameters of this machine,
+    if they differ from the ones of the user, and rewrap the data key with the new key.
+    Only call this with a master password that was just verified. Returns True if the user was rehashed.
+    derive_key is called like generate_key().
+    """
+    kdf_params = get_kdf_params()
+    if user_kdf_params(user) == kdf_params or not valid_kdf_params(kdf_params):
+        return False
+    pw_key, salt = derive_key(pw, None, kdf_params)
+    # Not if the password was changed by another process in the meantime
+    sql = f'UPDATE {MASTER_DB_TABLE} SET auth_salt=?, data_key_enc=?, kdf_n=?, kdf_r=?, kdf_p=? \
+        WHERE username=? AND auth_salt=?'
+    sql_params = [salt, wrap_data_key(pw_key, data_key, user['username']), *kdf_params, user['username'], user['auth_salt']]
+    with conn:
+        conn.execute(sql, sql_params)
+    return True
+
 # ######### Validators #########
 
 def validate_master_username(master_username, *, new_user=False, verbose=False)->bool:
@@ -262,15 +662,15 @@ def prompt_master_pw()->str:
         entered_pw = getpass(PROMPT_MASTER_PW)
     return entered_pw
 
-def prompt_new_master_pw()->tuple[bytes, bytes]:
-    """Create or change master password"""
+def prompt_new_master_pw(kdf_params:tuple=(SCRYPT_N, SCRYPT_R, SCRYPT_P))->tuple[bytes, bytes]:
+    """Create or change master password, hashed with the given scrypt parameters"""
     pw = ''
     validated = False
     while not validated:
         pw = getpass(PROMPT_NEW_MASTER_PW)
         pw_confirm = getpass(PROMPT_CONFIRM_PW)
         validated = validate_master_pw(pw, pw_confirm)
-    key, salt = generate_key(pw)
+    key, salt = generate_key(pw, kdf_params=kdf_params)
     return key, salt
 
 def create_pypass_user(master_conn:sqlite3.Connection, username:str):
@@ -281,15 +681,42 @@ def create_pypass_user(master_conn:sqlite3.Connection, username:str):
         Username of the new user. A user must supply this username
         along with the password to login to Pypass.
     """
-    master_key, master_salt = prompt_new_master_pw()
-    user_auth = UserAuth(username, master_key)
+    kdf_params = get_kdf_params()
+    pw_key, master_salt = prompt_new_master_pw(kdf_params)
+    # Random key of the vault, see unlock_data_key()
+    data_key = Fernet.generate_key()
+    user_auth = UserAuth(username, data_key)
     try:
-        master_db_add_entry(user_auth, master_conn, username, master_salt)
+        master_db_add_entry(user_auth, master_conn, username, master_salt, \
+            wrap_data_key(pw_key, data_key, username), kdf_params)
         return user_auth
     except sqlite3.DatabaseError:
         print(ERROR_CREATE_PYPASS_USER_FAIL)
         raise
 
+def unlock_user_key(conn:sqlite3.Connection, user:dict, master_pw:str, *, derive_key=generate_key)->bytes:
+    """
+    Returns the data key of a user (row of the master database, as a dictionary), given the master password,
+    or an empty bytes object if the master password is wrong. Nothing is prompted.
+    derive_key is called like generate_key(), and may run scrypt elsewhere, e.g. in a process pool.
+    """
+    master_key, _ = derive_key(master_pw, user['auth_salt'], user_kdf_params(user))
+    data_key = unlock_data_key(conn, user, master_key)
+    if data_key:
+        # Move to the scrypt parameters of this machine, if they changed
+        rehash_master_pw(conn, user, master_pw, data_key, derive_key=derive_key)
+    return data_key
+
+def unlock_user(conn:sqlite3.Connection, user:dict, master_pw:str)->UserAuth:
+    """
+    Unlock the vault of a user (row of the master database, as a dictionary) with the master password,
+    without prompting. Returns None if the master password is wrong.
+    """
+    data_key = unlock_user_key(conn, user, master_pw)
+    if not data_key:
+        return None
+    return UserAuth(user['username'], data_key)
+
 def authenticate():
     """
     Performs the master authentication, and returns a Fernet object if authentication succeeded.
@@ -298,7 +725,6 @@ def authenticate():
     """
     conn = master_db_connect()
     username = ''
-    master_key = b''
     user_auth = None # return value
 
     try:
@@ -307,22 +733,13 @@ def authenticate():
         if user:
             # Returning user. Load user information from DB
             user = row_to_dict(row=user, cols=MASTER_DB_COLUMNS)
-            master_salt = user['auth_salt']
             # Ask user for the master password,
             master_pw = prompt_master_pw()
-            # and initialize a Fernet object with it
-            master_key, master_salt = generate_key(master_pw, master_salt)
-            user_auth = UserAuth(username, master_key)
-            # Attempt to decrypt
-            username_dec = user_auth.decrypt(user['username_enc'])
-            if username_dec:
+            # and unwrap the data key of the vault with it
+            user_auth = unlock_user(conn, user, master_pw)
+            if user_auth is None:
                 # If decryption fails, return None and fail initialization
-                if username_dec.decode(HASH_ENCODING) != username:
-                    print(ERROR_WRONG_MASTER_PASSWORD)
-                    user_auth = None
-            else:
                 print(ERROR_WRONG_MASTER_PASSWORD)
-                user_auth = None
         else:
             # User not found
             print(ERROR_MASTER_USERNAME_DOES_NOT_EXIST.format(username))
@@ -343,9 +760,6 @@ def authenticate():
         print(ERROR_MASTER_AUTH_KEYBOARD_INTERRUPT)
         raise KeyboardInterrupt
     finally:
-        # Cleanup
-        if type(conn) == sqlite3.Connection:
-            conn.close()
         if not username:
             return None
         return user_auth
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Merkle tree over the (entry_id, entry_hash) pairs of a vault.
+
+Each entry is a leaf at position entry_id of a sparse binary tree that is just deep enough
+for the largest entry_id. Only non-empty nodes are stored, in a table of the vault database.
+Level 0 holds the entry_hash of each leaf, so it can be compared with the credentials table in SQL.
+The root, the depth and the number of leaves are MACed with a key derived from the master key.
+The MAC is stored in the master database, next to the user, with the number of changes made so far.
+The vault keeps a MACed link of its last change: its number, and the root MACs before and after it.
+A master database left one change behind by a crash is told apart from a vault rolled back to an
+older copy by the number, which never repeats, unlike a root that was changed and changed back.
+
+    - Adding, editing or deleting an entry rehashes one path of the tree, O(log n).
+    - Opening a vault compares the MAC with the stored root, the number of leaves with the number
+      of entries, and every entry_hash with its leaf. Deleted, added or rolled back entries,
+      and a vault file rolled back as a whole, are found without rehashing any entry.
+    - A membership proof checks a single entry against the root in O(log n).
+"""
+import hmac, struct
+from hashlib import blake2b
+
+from pypass.params import *
+
+MERKLE_HASH_SIZE = 32
+MERKLE_SHAPE = struct.Struct('<IQ') # depth, number of leaves
+MERKLE_SEQ = struct.Struct('<Q') # number of a change
+MERKLE_MAC_SIZE = blake2b().digest_size
+
+def leaf_hash(entry_id:int, entry_hash:bytes)->bytes:
+    return blake2b(b'\x00' + entry_id.to_bytes(8, 'little') + entry_hash, digest_size=MERKLE_HASH_SIZE).digest()
+
+def node_hash(left:bytes, right:bytes)->bytes:
+    return blake2b(b'\x01' + left + right, digest_size=MERKLE_HASH_SIZE).digest()
+
+# Hash of an empty subtree of each height
+EMPTY_HASHES = [blake2b(b'\x02', digest_size=MERKLE_HASH_SIZE).digest()]
+for _ in range(MERKLE_MAX_DEPTH):
+    EMPTY_HASHES.append(node_hash(EMPTY_HASHES[-1], EMPTY_HASHES[-1]))
+
+def root_from_proof(entry_id:int, entry_hash:bytes, proof:list)->bytes:
+    """Root of the tree that the proof (sibling hashes, from the leaf up) places the entry in"""
+    h = leaf_hash(entry_id, entry_hash)
+    idx = entry_id
+    for sibling in proof:
+        h = node_hash(sibling, h) if idx & 1 else node_hash(h, sibling)
+        idx >>= 1
+    return h
+
+def tree_levels(leaves:dict, depth:int):
+    """Nodes of each level above the leaves of a tree over {entry_id: entry_hash}, from the bottom up"""
+    level = {entry_id: leaf_hash(entry_id, entry_hash) for entry_id, entry_hash in leaves.items()}
+    for height in range(depth):
+        empty = EMPTY_HASHES[height]
+        parents = {}
+        for idx in level.keys() | {idx ^ 1 for idx in level}:
+            if idx & 1 == 0:
+                parents[idx >> 1] = node_hash(level.get(idx, empty), level.get(idx | 1, empty))
+        level = parents
+        yield level
+
+def compute_root(leaves:dict, depth:int)->bytes:
+    """Root of a tree of the given depth over {entry_id: entry_hash}, computed from scratch"""
+    level = {}
+    for level in tree_levels(leaves, depth):
+        pass
+    return level.get(0, EMPTY_HASHES[depth])
+
+class MerkleTree:
+    """
+    The Merkle tree of a vault, stored in MERKLE_DB_TABLE.
+    Methods take a cursor, so that the tree changes in the same transaction as the entries.
+    """
+    def __init__(self, key:bytes):
+        self.key = key
+
+    def mac(self, depth:int, count:int, root:bytes)->bytes:
+        return blake2b(MERKLE_SHAPE.pack(depth, count) + root, key=self.key).digest()
+
+    def get_shape(self, cur)->tuple[int, int]:
+        cur.execute(f'SELECT hash FROM {MERKLE_DB_TABLE} WHERE level=? AND idx=0', [MERKLE_SHAPE_LEVEL])
+        row = cur.fetchone()
+        return MERKLE_SHAPE.unpack(row[0]) if row else (0, 0)
+
+    def get_node(self, cur, level:int, idx:int)->bytes:
+        cur.execute(f'SELECT hash FROM {MERKLE_DB_TABLE} WHERE level=? AND idx=?', [level, idx])
+        row = cur.fetchone()
+        if row is None:
+            return EMPTY_HASHES[level]
+        # Leaves store the entry_hash
+        return leaf_hash(idx, row[0]) if level == 0 else row[0]
+
+    def set_node(self, cur, level:int, idx:int, value:bytes):
+        """Store a node, or drop it if it is empty"""
+        if value is None or (level > 0 and value == EMPTY_HASHES[level]):
+            cur.execute(f'DELETE FROM {MERKLE_DB_TABLE} WHERE level=? AND idx=?', [level, idx])
+        else:
+            cur.execute(f'INSERT OR REPLACE INTO {MERKLE_DB_TABLE}(level, idx, hash) VALUES(?, ?, ?)', \
+                [level, idx, value])
+
+    def link_mac(self, seq:int, prev_root_mac:bytes, root_mac:bytes)->bytes:
+        return blake2b(b'\x03' + MERKLE_SEQ.pack(seq) + root_mac + prev_root_mac, key=self.key).digest()
+
+    def set_link(self, cur, seq:int, prev_root_mac:bytes, root_mac:bytes):
+        """Record change number seq, from prev_root_mac (None for the first root) to root_mac"""
+        prev_root_mac = prev_root_mac or b''
+        self.set_node(cur, MERKLE_LINK_LEVEL, 0, MERKLE_SEQ.pack(seq) + root_mac + \
+            self.link_mac(seq, prev_root_mac, root_mac) + prev_root_mac)
+
+    def get_link(self, cur)->tuple[int, bytes, bytes]:
+        """(seq, previous root MAC, root MAC) of the last change to the vault, or None if there is no valid link"""
+        cur.execute(f'SELECT hash FROM {MERKLE_DB_TABLE} WHERE level=? AND idx=0', [MERKLE_LINK_LEVEL])
+        row = cur.fetchone()
+        if row is None or len(row[0]) < MERKLE_SEQ.size + 2 * MERKLE_MAC_SIZE:
+            return None
+        (seq,) = MERKLE_SEQ.unpack_from(row[0])
+        pos = MERKLE_SEQ.size
+        root_mac = row[0][pos:pos + MERKLE_MAC_SIZE]
+        mac = row[0][pos + MERKLE_MAC_SIZE:pos + 2 * MERKLE_MAC_SIZE]
+        prev_root_mac = row[0][pos + 2 * MERKLE_MAC_SIZE:]
+        if not hmac.compare_digest(mac, self.link_mac(seq, prev_root_mac, root_mac)):
+            return None
+        return seq, prev_root_mac, root_mac
+
+    def get_root_mac(self, cur)->bytes:
+        depth, count = self.get_shape(cur)
+        return self.mac(depth, count, self.get_node(cur, depth, 0))
+
+    def update(self, cur, entry_id:int, entry_hash:bytes=None)->bytes:
+        """
+        Set the leaf of an entry, or remove it if entry_hash is None, and rehash its path.
+        Returns the MAC of the new root.
+        """
+        depth, count = self.get_shape(cur)
+        if entry_id >> depth:
+            if entry_hash is None:
+                # Not in the tree
+                return self.mac(depth, count, self.get_node(cur, depth, 0))
+            # Grow the tree. The old root becomes the left child of the new root.
+            while entry_id >> depth:
+                root = self.get_node(cur, depth, 0)
+                depth += 1
+                self.set_node(cur, depth, 0, node_hash(root, EMPTY_HASHES[depth - 1]))
+
+        cur.execute(f'SELECT 1 FROM {MERKLE_DB_TABLE} WHERE level=0 AND idx=?', [entry_id])
+        count += (entry_hash is not None) - (cur.fetchone() is not None)
+        self.set_node(cur, 0, entry_id, entry_hash)
+
+        h = leaf_hash(entry_id, entry_hash) if entry_hash is not None else EMPTY_HASHES[0]
+        idx = entry_id
+        for level in range(depth):
+            sibling = self.get_node(cur, level, idx ^ 1)
+            h = node_hash(sibling, h) if idx & 1 else node_hash(h, sibling)
+            idx >>= 1
+            self.set_node(cur, level + 1, idx, h)
+
+        self.set_node(cur, MERKLE_SHAPE_LEVEL, 0, MERKLE_SHAPE.pack(depth, count))
+        return self.mac(depth, count, h)
+
+    def rebuild(self, cur, leaves:dict)->bytes:
+        """Replace the whole tree with one over {entry_id: entry_hash}. Returns the MAC of the root."""
+        leaves = {entry_id: entry_hash for entry_id, entry_hash in leaves.items() if entry_hash is not None}
+        depth = max(leaves, default=0).bit_length()
+        cur.execute(f'DELETE FROM {MERKLE_DB_TABLE}')
+        for entry_id, entry_hash in leaves.items():
+            self.set_node(cur, 0, entry_id, entry_hash)
+        root = EMPTY_HASHES[depth]
+        for height, level in enumerate(tree_levels(leaves, depth), 1):
+            for idx, h in level.items():
+                self.set_node(cur, height, idx, h)
+            root = level.get(0, root)
+        self.set_node(cur, MERKLE_SHAPE_LEVEL, 0, MERKLE_SHAPE.pack(depth, len(leaves)))
+        return self.mac(depth, len(leaves), root)
+
+    def proof(self, cur, entry_id:int)->list:
+        """Sibling hashes on the path from the leaf of an entry to the root"""
+        depth, _ = self.get_shape(cur)
+        proof = []
+        idx = entry_id
+        for level in range(depth):
+            proof.append(self.get_node(cur, level, idx ^ 1))
+            idx >>= 1
+        return proof
+
+    def verify_proof(self, cur, entry_id:int, entry_hash:bytes, proof:list, root_mac:bytes)->bool:
+        """Check that an entry is in the tree whose root MAC is root_mac"""
+        depth, count = self.get_shape(cur)
+        if len(proof) != depth or entry_id >> depth or entry_hash is None:
+            return False
+        return self.mac(depth, count, root_from_proof(entry_id, entry_hash, proof)) == root_mac
+
+    def check(self, cur, root_mac:bytes, *, full:bool=False)->bool:
+        """
+        Check the vault against the root MAC from the master database.
+        Without full, the stored tree is trusted below the root, and only the leaves are compared
+        with the credentials table. With full, the root is recomputed from the credentials table.
+        """
+        depth, count = self.get_shape(cur)
+        if full:
+            cur.execute(f'SELECT entry_id, entry_hash FROM {DB_TABLE}')
+            leaves = dict(cur.fetchall())
+            if len(leaves) != count or max(leaves, default=0) >> depth or None in leaves.values():
+                return False
+            return self.mac(depth, count, compute_root(leaves, depth)) == root_mac
+
+        if self.mac(depth, count, self.get_node(cur, depth, 0)) != root_mac:
+            return False
+        cur.execute(f'SELECT count(*) FROM {DB_TABLE}')
+        if cur.fetchone()[0] != count:
+            return False
+        sql = f'SELECT count(*) FROM {DB_TABLE} c LEFT JOIN {MERKLE_DB_TABLE} m '
+        sql += 'ON m.level = 0 AND m.idx = c.entry_id WHERE m.hash IS NOT c.entry_hash'
+        cur.execute(sql)
+        return cur.fetchone()[0] == 0
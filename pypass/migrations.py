@@ -0,0 +1,135 @@
+"""
+Schema migrations of the vaults and of the master database.
+
+The schema version of a database is PRAGMA user_version: the number of migrations applied to it.
+When a connection is opened (see dbconn.py), every pending migration runs in its own transaction,
+which also records its version, so a database is never left half-migrated. Migrations already
+applied are never changed: every schema or storage change is a new migration at the end of a list.
+
+Migration 1 of each list brings databases of the versions before migrations up to date,
+so it only uses IF NOT EXISTS statements and adds missing columns.
+"""
+import sqlite3
+
+from pypass.params import *
+
+# ######### DDL #########
+
+def db_create_table(cur:sqlite3.Cursor, table_name:str, cols:dict, if_not_exists:bool=True):
+    # Construct SQL query
+    sql = 'CREATE TABLE '
+    if if_not_exists:
+        sql += 'IF NOT EXISTS '
+    sql += table_name
+    sql += '('
+    sql += ', '.join(f"{col_name} {cols[col_name]['type']}" for col_name in cols)
+    sql += ')'
+    # and execute
+    cur.execute(sql)
+
+def db_add_missing_columns(cur:sqlite3.Cursor, table_name:str, cols:dict):
+    """Add the columns that an existing table, created by an older version, does not have yet"""
+    cur.execute(f'PRAGMA table_info({table_name})')
+    existing_cols = [row[1] for row in cur.fetchall()]
+    for col_name in cols:
+        if col_name not in existing_cols:
+            cur.execute(f'ALTER TABLE {table_name} ADD COLUMN {col_name} {cols[col_name]["type"]}')
+
+def db_create_index(cur:sqlite3.Cursor, index_name:str, table_name:str, cols:list, unique:bool=False):
+    sql = 'CREATE UNIQUE INDEX ' if unique else 'CREATE INDEX '
+    sql += f'IF NOT EXISTS {index_name} ON {table_name}({", ".join(cols)})'
+    cur.execute(sql)
+
+def db_create_verify_watermark(cur:sqlite3.Cursor):
+    """Create the verification watermark, and the triggers that invalidate it when an entry changes"""
+    db_create_table(cur, VERIFY_DB_TABLE, VERIFY_DB_COLUMNS)
+    for event in ['UPDATE', 'DELETE']:
+        sql = f'CREATE TRIGGER IF NOT EXISTS {VERIFY_DB_TABLE}_on_{event.lower()} AFTER {event} ON {DB_TABLE} '
+        sql += f'BEGIN DELETE FROM {VERIFY_DB_TABLE} WHERE entry_id = OLD.entry_id; END'
+        cur.execute(sql)
+
+# ######### VAULT #########
+
+def vault_1_base_schema(cur:sqlite3.Cursor):
+    db_create_table(cur, DB_TABLE, DB_COLUMNS)
+    db_add_missing_columns(cur, DB_TABLE, DB_COLUMNS)
+    db_create_table(cur, POLICY_DB_TABLE, POLICY_DB_COLUMNS)
+    db_create_table(cur, FINGERPRINT_DB_TABLE, FINGERPRINT_DB_COLUMNS)
+    db_create_index(cur, FINGERPRINT_DB_INDEX, FINGERPRINT_DB_TABLE, ['fingerprint'])
+    db_create_verify_watermark(cur)
+    db_create_table(cur, MERKLE_DB_TABLE, MERKLE_DB_COLUMNS)
+    db_create_index(cur, MERKLE_DB_INDEX, MERKLE_DB_TABLE, ['level', 'idx'], unique=True)
+    db_create_table(cur, AUDIT_DB_TABLE, AUDIT_DB_COLUMNS)
+
+def vault_2_row_version(cur:sqlite3.Cursor):
+    db_add_missing_columns(cur, DB_TABLE, {'row_version': DB_COLUMNS['row_version']})
+
+def vault_3_entry_indexes(cur:sqlite3.Cursor):
+    db_create_index(cur, DB_NAME_INDEX, DB_TABLE, ['name'])
+    db_create_index(cur, DB_URL_INDEX, DB_TABLE, ['url'])
+    db_create_index(cur, DB_DATE_MODIFIED_INDEX, DB_TABLE, ['date_modified'])
+
+def db_create_search_index(cur:sqlite3.Cursor)->bool:
+    """
+    Create the full-text index of the entries, and the triggers that keep it in sync, if the vault
+    does not have it yet. Returns False if SQLite has no FTS5 or trigram tokenizer.
+    """
+    cur.execute('SELECT 1 FROM main.sqlite_master WHERE type = ? AND name = ?', ['table', SEARCH_DB_TABLE])
+    if cur.fetchone() is not None:
+        return True
+    # External content table: only the index is stored, the text stays in the credentials table
+    cols = ', '.join(SEARCH_DB_COLUMNS)
+    try:
+        cur.execute(f"CREATE VIRTUAL TABLE {SEARCH_DB_TABLE} USING fts5({cols}, \
+            content='{DB_TABLE}', content_rowid='entry_id', tokenize='{SEARCH_DB_TOKENIZER}')")
+    except sqlite3.OperationalError:
+        return False
+    new_values = ', '.join(f'NEW.{col}' for col in SEARCH_DB_COLUMNS)
+    old_values = ', '.join(f'OLD.{col}' for col in SEARCH_DB_COLUMNS)
+    insert = f'INSERT INTO {SEARCH_DB_TABLE}(rowid, {cols}) VALUES (NEW.entry_id, {new_values});'
+    delete = f"INSERT INTO {SEARCH_DB_TABLE}({SEARCH_DB_TABLE}, rowid, {cols}) VALUES ('delete', OLD.entry_id, {old_values});"
+    cur.execute(f'CREATE TRIGGER {SEARCH_DB_TABLE}_on_insert AFTER INSERT ON {DB_TABLE} BEGIN {insert} END')
+    cur.execute(f'CREATE TRIGGER {SEARCH_DB_TABLE}_on_delete AFTER DELETE ON {DB_TABLE} BEGIN {delete} END')
+    cur.execute(f'CREATE TRIGGER {SEARCH_DB_TABLE}_on_update AFTER UPDATE OF {cols} ON {DB_TABLE} \
+        BEGIN {delete} {insert} END')
+    # Index the existing entries
+    cur.execute(f"INSERT INTO {SEARCH_DB_TABLE}({SEARCH_DB_TABLE}) VALUES ('rebuild')")
+    return True
+
+def vault_4_search_index(cur:sqlite3.Cursor):
+    # Without FTS5, searches use LIKE, and the index is created by the first search once SQLite has it.
+    # See helpers.search_index_available().
+    db_create_search_index(cur)
+
+def vault_5_audit_data_id(cur:sqlite3.Cursor):
+    # Cached results without it are scored again
+    db_add_missing_columns(cur, AUDIT_DB_TABLE, {'data_id': AUDIT_DB_COLUMNS['data_id']})
+
+VAULT_MIGRATIONS = [
+    vault_1_base_schema,
+    vault_2_row_version,
+    vault_3_entry_indexes,
+    vault_4_search_index,
+    vault_5_audit_data_id,
+]
+
+# ######### MASTER #########
+
+def master_1_base_schema(cur:sqlite3.Cursor):
+    db_create_table(cur, MASTER_DB_TABLE, MASTER_DB_COLUMNS)
+    db_add_missing_columns(cur, MASTER_DB_TABLE, MASTER_DB_COLUMNS)
+
+def master_2_unique_username(cur:sqlite3.Cursor):
+    # Login has always used the first row of a username, so any later duplicate was never used
+    cur.execute(f'DELETE FROM {MASTER_DB_TABLE} WHERE rowid NOT IN \
+        (SELECT min(rowid) FROM {MASTER_DB_TABLE} GROUP BY username)')
+    db_create_index(cur, MASTER_DB_USERNAME_INDEX, MASTER_DB_TABLE, ['username'], unique=True)
+
+def master_3_merkle_seq(cur:sqlite3.Cursor):
+    db_add_missing_columns(cur, MASTER_DB_TABLE, {'merkle_seq': MASTER_DB_COLUMNS['merkle_seq']})
+
+MASTER_MIGRATIONS = [
+    master_1_base_schema,
+    master_2_unique_username,
+    master_3_merkle_seq,
+]
@@ -6,10 +6,27 @@ SCRYPT_P = 1
 SCRYPT_MAX_MEM = 64 * 2 ** 20
 SCRYPT_DKLEN = 32
 
+# KDF CALIBRATION, see kdf.py
+KDF_PARAMS_FNAME = 'kdf.json'
+KDF_TARGET_TIME = 0.5 # seconds to derive the key when unlocking
+KDF_MAX_MEM = 128 * 2 ** 20 # bytes
+KDF_MIN_N = 2 ** 14 # Never calibrated below this, however slow the machine
+
 HASH_ENCODING = 'utf-8'
 
 # DB
 DB_FILE_EXT = '.db'
+# Connections, see dbconn.py. With WAL, a transaction that writes to both a vault and the attached master
+# database (the Merkle root) is atomic in each file, but not across them. The vault commits first, so a crash
+# during the commit may leave the master database one root behind, which is repaired when the vault is opened.
+DB_JOURNAL_MODE = 'WAL'
+DB_SYNCHRONOUS = 'NORMAL' # With WAL, a power loss may drop the last transactions, but never corrupts the database
+DB_CACHE_SIZE = -8192 # Page cache per database, negative: in KiB
+DB_MMAP_SIZE = 64 * 2 ** 20 # bytes
+DB_CACHED_STATEMENTS = 256 # Compiled statements kept per connection
+DB_BUSY_TIMEOUT = 5.0 # seconds to wait for a lock held by another process
+DB_RETRY_ATTEMPTS = 5 # Write transactions that still find the database locked are retried,
+DB_RETRY_DELAY = 0.05 # after this many seconds, doubled on each attempt, with random jitter
 DB_TABLE = 'credentials'
 DB_COLUMNS = {
     'entry_id': {
@@ -56,9 +73,212 @@ DB_COLUMNS = {
         'index': 8,
         'type': 'BLOB', 
         'encrypted': False
+    },
+    # Incremented by every update, see db_update_entry(). Not signed.
+    'row_version': {
+        'index': 9,
+        'type': 'INTEGER NOT NULL DEFAULT 0',
+        'encrypted': False
     }
 }
 DB_COLUMN_NAMES = list(DB_COLUMNS.keys())
+# Schema changes are migrations, see migrations.py
+DB_NAME_INDEX = 'idx_credentials_name'
+DB_URL_INDEX = 'idx_credentials_url'
+DB_DATE_MODIFIED_INDEX = 'idx_credentials_date_modified'
+# Full-text index of entries (FTS5 with the trigram tokenizer, SQLite 3.34+), for substring search
+SEARCH_DB_TABLE = 'credentials_search'
+SEARCH_DB_COLUMNS = ['name', 'url']
+SEARCH_DB_TOKENIZER = 'trigram'
+SEARCH_INDEX_MIN_QUERY_LEN = 3 # Trigrams: shorter queries, and vaults without the index, are searched with LIKE
+
+# Signature format of entry_hash, given by its first byte
+SIGNATURE_VERSION = 1 # Canonical binary encoding of the row, see helpers.serialize_row()
+SIGNATURE_VERSION_LEGACY = 0 # Hexadecimal digest of the columns as strings, without versioning
+SIGNATURE_VERSION_MAX = 0x30 # Versions stay below ord('0'), so legacy signatures are never mistaken for one
+
+# Password policy of each credentials entry
+POLICY_DB_TABLE = 'pw_policies'
+POLICY_DB_COLUMNS = {
+    'entry_id': {
+        'index': 0,
+        'type': 'INTEGER PRIMARY KEY',
+        'encrypted': False
+    },
+    'policy': {
+        'index': 1,
+        'type': 'TEXT',
+        'encrypted': False
+    }
+}
+
+# Keyed fingerprint of each entry's password, to find reused passwords
+FINGERPRINT_DB_TABLE = 'pw_fingerprints'
+FINGERPRINT_DB_COLUMNS = {
+    'entry_id': {
+        'index': 0,
+        'type': 'INTEGER PRIMARY KEY',
+        'encrypted': False
+    },
+    'fingerprint': {
+        'index': 1,
+        'type': 'BLOB NOT NULL',
+        'encrypted': False
+    }
+}
+FINGERPRINT_DB_INDEX = 'idx_pw_fingerprints_fingerprint'
+FINGERPRINT_KEY_CONTEXT = b'pypass-pw-fingerprint'
+FINGERPRINT_DIGEST_SIZE = 16
+
+# Encryption of values, see envelope.py
+ENVELOPE_KEY_CONTEXT = b'pypass-envelope-key'
+ENVELOPE_CONVERT_BATCH_SIZE = 64 # Entries converted from Fernet tokens per transaction
+
+# Cached audit results, valid while date_modified and entry_hash of the entry are unchanged,
+# and the breached password corpus and strength dictionary are the ones they were scored with
+AUDIT_DB_TABLE = 'audit_cache'
+AUDIT_DB_COLUMNS = {
+    'entry_id': {
+        'index': 0,
+        'type': 'INTEGER PRIMARY KEY',
+        'encrypted': False
+    },
+    'date_modified': {
+        'index': 1,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'entry_hash': {
+        'index': 2,
+        'type': 'BLOB',
+        'encrypted': False
+    },
+    'strong': {
+        'index': 3,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'score': {
+        'index': 4,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'breached': {
+        'index': 5,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'data_id': {
+        # See audit.audit_data_id()
+        'index': 6,
+        'type': 'TEXT',
+        'encrypted': False
+    }
+}
+AUDIT_STALE_DAYS = 365
+AUDIT_WORKERS = 0 # 0: one worker per CPU
+AUDIT_CHUNK_SIZE = 256 # Entries sent to a worker at once
+AUDIT_PARALLEL_MIN_ENTRIES = 512 # Fewer entries are audited without starting workers
+
+# Verification watermark: entries whose signature was verified, and the entry_hash it was verified for.
+# Rows are dropped by triggers whenever the entry is updated or deleted.
+VERIFY_DB_TABLE = 'verify_watermark'
+VERIFY_DB_COLUMNS = {
+    'entry_id': {
+        'index': 0,
+        'type': 'INTEGER PRIMARY KEY',
+        'encrypted': False
+    },
+    'entry_hash': {
+        'index': 1,
+        'type': 'BLOB NOT NULL',
+        'encrypted': False
+    }
+}
+VERIFY_WORKERS = 0 # 0: one thread per CPU
+VERIFY_BATCH_SIZE = 512 # Rows fetched and verified at once
+
+# Merkle tree over the (entry_id, entry_hash) of all entries. See merkle.py.
+MERKLE_DB_TABLE = 'merkle_tree'
+MERKLE_DB_COLUMNS = {
+    'level': {
+        'index': 0,
+        'type': 'INTEGER NOT NULL',
+        'encrypted': False
+    },
+    'idx': {
+        'index': 1,
+        'type': 'INTEGER NOT NULL',
+        'encrypted': False
+    },
+    'hash': {
+        'index': 2,
+        'type': 'BLOB NOT NULL',
+        'encrypted': False
+    }
+}
+MERKLE_DB_INDEX = 'idx_merkle_tree_node'
+MERKLE_KEY_CONTEXT = b'pypass-merkle-root'
+MERKLE_MAX_DEPTH = 64
+MERKLE_SHAPE_LEVEL = -1 # Pseudo-level of the row that holds the depth and number of leaves
+MERKLE_LINK_LEVEL = -2 # Pseudo-level of the row that links the root MAC to the previous one
+
+# Decrypted entry cache of a session, see entrycache.py
+ENTRY_CACHE_SIZE = 0 # Entries kept, 0: disabled
+ENTRY_CACHE_TTL = 300 # seconds
+
+# Batched encryption and decryption, see UserAuth.decrypt_many()
+CRYPTO_WORKERS = 0 # 0: one thread per CPU
+CRYPTO_CHUNK_SIZE = 256 # Tokens per chunk. A single chunk is processed without the thread pool.
+
+# SPLASH
+SPLASH_ENABLED = True
+SPLASH_FONT = 'slant'
+SPLASH_CACHE_FNAME = 'splash-{}.txt' # Rendered splash, per font. Rendering takes longer than the rest of startup.
+
+# SCRIPTED CLI, see cli.py
+CLI_USERNAME_ENV = 'PYPASS_USERNAME'
+CLI_PASSWORD_ENV = 'PYPASS_MASTER_PASSWORD' # Read only if no --password-fd is given
+CLI_EXPORT_BATCH_SIZE = 256 # Entries decrypted at a time by export
+
+# ASYNC VAULT, see asyncvault.py
+ASYNC_VAULT_WORKERS = 4 # Threads, each with its own database connection
+ASYNC_VAULT_MAX_PENDING = 64 # Operations queued on the executor at a time, the rest wait on the event loop
+ASYNC_VAULT_CLOSE_TIMEOUT = 10 # seconds
+
+# UNLOCK AGENT, see agent.py
+AGENT_SOCKET_FNAME = 'agent.sock'
+AGENT_SOCKET_ENV = 'PYPASS_AGENT_SOCK' # Overrides the socket path, like SSH_AUTH_SOCK
+AGENT_IDLE_TIMEOUT = 900 # seconds without a request before the agent locks and exits
+AGENT_CLIENT_TIMEOUT = 5 # seconds a client may take to send a request
+AGENT_MAX_REQUEST_SIZE = 64 * 2 ** 10 # bytes
+
+# CREDENTIAL SERVER, see server.py
+SERVER_SOCKET_FNAME = 'server.sock'
+SERVER_SOCKET_ENV = 'PYPASS_SERVER_SOCK'
+SERVER_KDF_WORKERS = 2 # Processes deriving keys. Each scrypt run takes up to KDF_MAX_MEM of memory.
+SERVER_MAX_PENDING_LOGINS = 8 # Logins waiting for a KDF worker, more are turned away
+SERVER_SESSION_WORKERS = 2 # Threads of each user session
+SERVER_SESSION_IDLE_TIMEOUT = 900 # seconds without a request before a session is closed
+SERVER_REAP_INTERVAL = 30 # seconds between checks for idle sessions
+SERVER_CLIENT_IDLE_TIMEOUT = 300 # seconds a connection may stay open without a request
+
+# PASSPHRASE
+WORDLIST_FNAME = 'wordlist.bin'
+PASSPHRASE_ENTROPY_TARGET = 77 # bits, about 6 words of a 7776-word Diceware list
+PASSPHRASE_SEPARATOR = '-'
+
+# PASSWORD STRENGTH
+STRENGTH_DICT_FNAME = 'strength.bin'
+USER_PW_MIN_STRENGTH_SCORE = 2 # 0 ~ 4, see strength.estimate_strength()
+
+# BREACHED PASSWORDS
+BREACH_DB_FNAME = 'breached.bin'
+BREACH_BLOOM_FNAME = 'breached.bloom'
+BREACH_USE_BLOOM = True
+BREACH_PREFIX_LEN = 8 # bytes of SHA-1 kept per record
+BREACH_BLOOM_BITS_PER_ENTRY = 10 # about 1% false positives
+BREACH_MAX_REGENERATE = 100 # Generated passwords found in the corpus are drawn again, at most this many times
 
 # MASTER AUTH
 KEYFILE_EXT = '.key'
@@ -94,8 +314,42 @@ MASTER_DB_COLUMNS = {
         'type': 'INTEGER',
         'encrypted': False
     },
+    'merkle_root': {
+        'index': 5,
+        'type': 'BLOB',
+        'encrypted': False
+    },
+    'data_key_enc': {
+        'index': 6,
+        'type': 'BLOB',
+        'encrypted': True
+    },
+    # scrypt parameters of the user. NULL for users created before calibration: SCRYPT_N, SCRYPT_R, SCRYPT_P
+    'kdf_n': {
+        'index': 7,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'kdf_r': {
+        'index': 8,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    'kdf_p': {
+        'index': 9,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
+    # Number of the last change to the vault, counted along with merkle_root. See merkle.py.
+    'merkle_seq': {
+        'index': 10,
+        'type': 'INTEGER',
+        'encrypted': False
+    },
 }
 MASTER_DB_TABLE = 'pypass_users'
+MASTER_DB_USERNAME_INDEX = 'idx_pypass_users_username'
+MASTER_DB_ALIAS = 'master' # Schema name of the master database, when attached to a vault connection
 
 SEARCH_QUERY_MIN_LEN = 3
 SEARCH_QUERY_MAX_LEN = 512
@@ -0,0 +1,184 @@
+import re, shlex
+from functools import lru_cache
+
+from pypass.params import *
+from pypass.consts import *
+from pypass.generator import *
+from pypass.wordlist import generate_passphrase
+from pypass.breach import is_password_breached
+
+# Password policy mini-language
+#
+# A policy is a whitespace separated list of key=value clauses, e.g.
+#     length=8-16 upper=1 lower=1 digit=2 special=1 special-chars='!#$%' forbid=0O1l max-run=2
+#
+# length=MIN-MAX
+#     Length range of generated passwords, both ends inclusive
+# upper=N, lower=N, digit=N, special=N
+#     At least N characters of the set. 0 allows the set without requiring it,
+#     'none' disallows the set altogether.
+# upper-chars=..., lower-chars=..., digit-chars=..., special-chars=...
+#     Replace the characters of the set, e.g. the symbols a site accepts.
+# forbid=...
+#     Characters that may never appear
+# max-run=N
+#     The same character may appear at most N times in a row
+#
+# Values containing whitespace or quotes can be quoted the same way as in a shell.
+
+POLICY_CHARSETS = {
+    'upper': ALPHABET_UPPER,
+    'lower': ALPHABET_LOWER,
+    'digit': NUMBERS,
+    'special': SPECIAL_CHARS
+}
+POLICY_CHARSETS_MIN_CNT = {
+    'upper': PARAM_STRONG_PW_ALPHABET_UPPER_MIN_CNT,
+    'lower': PARAM_STRONG_PW_ALPHABET_LOWER_MIN_CNT,
+    'digit': PARAM_STRONG_PW_NUMBER_MIN_CNT,
+    'special': PARAM_STRONG_PW_SPECIAL_CHARS_MIN_CNT
+}
+
+# The policy matching the rules of generate_passwords()
+DEFAULT_PW_POLICY = f'length={PARAM_PWGEN_MIN_LENGTH}-{PARAM_PWGEN_MAX_LENGTH - 1} ' + \
+    ' '.join(f'{name}={cnt}' for name, cnt in POLICY_CHARSETS_MIN_CNT.items()) + \
+    f' max-run={PARAM_STRONG_PW_MAX_CONS - 1}'
+
+POLICY_MAX_LEN = 512
+
+class PasswordPolicy:
+    """
+    A compiled password policy. Holds precomputed sampling tables,
+    so that compliant passwords are generated in one pass.
+    Use compile_policy() to create one from the policy text.
+    """
+    def __init__(self, text:str, min_len:int, max_len:int, charsets:dict, min_cnt:dict, max_run:int):
+        self.text = text
+        self.min_len = min_len
+        self.max_len = max_len
+        self.charsets = list(charsets.values())
+        self.charsets_min_cnt = [min_cnt[name] for name in charsets]
+        self.max_run = max_run
+
+        # Precompute sampling tables
+        self.pool_table = build_sampling_table(''.join(self.charsets).encode())
+        self.charset_tables = [build_sampling_table(charset.encode()) for charset in self.charsets]
+        self.re_run = re.compile(rb'(.)\1{%d}' % max_run, re.DOTALL)
+
+    def generate(self, n:int=1, *, rbuf:RandomBuffer=None)->list[str]:
+        """Generate n passwords that comply with the policy"""
+        # generate_passwords_from_tables() takes an exclusive upper length bound
+        return generate_passwords_from_tables(n, self.min_len, self.max_len + 1, \
+            self.pool_table, self.charsets, self.charset_tables, self.charsets_min_cnt, \
+                rbuf=rbuf, re_run=self.re_run)
+
+    def check(self, pw:str)->bool:
+        """Check if a password complies with the policy"""
+        if not self.min_len <= len(pw) <= self.max_len:
+            return False
+        if self.re_run.search(pw.encode()):
+            return False
+        allowed = ''.join(self.charsets)
+        if any(ch not in allowed for ch in pw):
+            return False
+        for charset, cnt in zip(self.charsets, self.charsets_min_cnt):
+            if sum(ch in charset for ch in pw) < cnt:
+                return False
+        return True
+
+def parse_policy_int(key:str, value:str)->int:
+    if not value.isdigit():
+        raise ValueError(f"'{key}' must be a non-negative integer, got '{value}'")
+    return int(value)
+
+@lru_cache(maxsize=128)
+def compile_policy(text:str)->PasswordPolicy:
+    """
+    Compile a password policy written in the policy mini-language.
+    An empty text compiles to DEFAULT_PW_POLICY.
+    Raises ValueError with a readable message if the policy is invalid.
+    """
+    text = text.strip()
+    if len(text) > POLICY_MAX_LEN:
+        raise ValueError(f"Policy must be shorter than {POLICY_MAX_LEN} characters")
+
+    # Start from the default rules
+    min_len = PARAM_PWGEN_MIN_LENGTH
+    max_len = PARAM_PWGEN_MAX_LENGTH - 1
+    charsets = dict(POLICY_CHARSETS)
+    min_cnt = dict(POLICY_CHARSETS_MIN_CNT)
+    forbidden = ''
+    max_run = PARAM_STRONG_PW_MAX_CONS - 1
+
+    for clause in shlex.split(text or DEFAULT_PW_POLICY):
+        key, sep, value = clause.partition('=')
+        if not sep:
+            raise ValueError(f"Expected key=value, got '{clause}'")
+        if key == 'length':
+            length_match = re.fullmatch(r'(\d+)-(\d+)', value) or re.fullmatch(r'(\d+)', value)
+            if not length_match:
+                raise ValueError(f"'length' must be MIN-MAX or a single number, got '{value}'")
+            min_len = int(length_match.group(1))
+            max_len = int(length_match.groups()[-1])
+        elif key in POLICY_CHARSETS:
+            if value == 'none':
+                charsets.pop(key, None)
+                min_cnt[key] = 0
+            else:
+                min_cnt[key] = parse_policy_int(key, value)
+        elif key.endswith('-chars') and key[:-len('-chars')] in POLICY_CHARSETS:
+            name = key[:-len('-chars')]
+            if any(ch not in PRINTABLE for ch in value):
+                raise ValueError(f"'{key}' contains unsupported characters")
+            charsets[name] = ''.join(dict.fromkeys(value)) # Drop duplicates, keep order
+        elif key == 'forbid':
+            forbidden += value
+        elif key == 'max-run':
+            max_run = parse_policy_int(key, value)
+        else:
+            raise ValueError(f"Unknown policy key '{key}'")
+
+    # Apply forbidden characters and drop empty sets
+    charsets = {name: ''.join(ch for ch in charset if ch not in forbidden) \
+        for name, charset in charsets.items()}
+    for name in list(charsets):
+        if not charsets[name]:
+            if min_cnt[name] > 0:
+                raise ValueError(f"No characters left in '{name}', but {min_cnt[name]} required")
+            charsets.pop(name)
+
+    # Sanity checks
+    if not charsets:
+        raise ValueError("No characters allowed")
+    if min_len > max_len:
+        raise ValueError(f"Invalid length range {min_len}-{max_len}")
+    if max_len - min_len >= 256:
+        raise ValueError("Length range must span fewer than 256 values")
+    if max_len > USER_PW_MAX_LEN:
+        raise ValueError(f"Passwords longer than {USER_PW_MAX_LEN} characters are not supported")
+    required = sum(min_cnt[name] for name in charsets)
+    if required > min_len:
+        raise ValueError(f"Minimum length {min_len} is shorter than the {required} required characters")
+    if max_run < 1:
+        raise ValueError("'max-run' must be at least 1")
+    # A run of a set with a single character cannot be broken up with another character of its set
+    if max_len > max_run and any(len(charset) < 2 for charset in charsets.values()):
+        raise ValueError(f"'max-run={max_run}' needs at least 2 characters in every set, "
+            f"for passwords longer than {max_run} characters")
+
+    return PasswordPolicy(text, min_len, max_len, charsets, min_cnt, max_run)
+
+def generate_new_pw(pw_option:str, policy:str='')->str:
+    """
+    Generate a new password following the policy, or a passphrase.
+    Passwords found in the local breached password corpus are never returned.
+    Raises ValueError if the policy is too weak to avoid them.
+    """
+    for _ in range(BREACH_MAX_REGENERATE):
+        if pw_option == 'passphrase':
+            new_pw = generate_passphrase()
+        else:
+            new_pw = compile_policy(policy).generate()[0]
+        if not is_password_breached(new_pw):
+            return new_pw
+    raise ValueError(ERROR_PWGEN_ALL_BREACHED.format(BREACH_MAX_REGENERATE))
@@ -1,10 +1,5 @@
 # Python standard libraries
-import sys, sqlite3
-from typing import Tuple
-
-# 3rd parties
-from cryptography.fernet import Fernet
-from pyfiglet import Figlet
+import os, sys, sqlite3
 
 # Local
 if __name__ == "__main__":
@@ -13,20 +8,40 @@ if __name__ == "__main__":
     from helpers import *
     import masterauth
     from commands import run_commands
+    from convert import start_envelope_conversion, stop_envelope_conversion
 else:
     from pypass.consts import *
     from pypass.params import *
     from pypass.helpers import *
     from pypass import masterauth
     from pypass.commands import run_commands
+    from pypass.convert import start_envelope_conversion, stop_envelope_conversion
+
+def render_splash()->str:
+    """The Figlet banner, rendered once and then read from the data directory"""
+    cache_path = os.path.join(DATA_DNAME, SPLASH_CACHE_FNAME.format(SPLASH_FONT))
+    try:
+        with open(cache_path) as f:
+            return f.read()
+    except OSError:
+        pass
+    from pyfiglet import Figlet
+    banner = Figlet(font=SPLASH_FONT).renderText("PYPASS")
+    try:
+        with open(cache_path + '.tmp', 'w') as f:
+            f.write(banner)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass
+    return banner
 
 def display_splash(username):
-    f = Figlet(font='slant')
-    print(f.renderText("PYPASS"), end="\n\n")
+    if SPLASH_ENABLED:
+        print(render_splash(), end="\n\n")
     print(SPLASH_WELCOME.format(username))
     print()
 
-def init()->Tuple[Fernet, sqlite3.Connection]:
+def init()->masterauth.UserAuth:
     init_success = False
 
     print("Loading PyPass...")
@@ -42,9 +57,35 @@ def init()->Tuple[Fernet, sqlite3.Connection]:
         if user_auth == None:
             print(ERROR_INIT_FAIL)
             sys.exit(1)
+
+    # Fingerprint passwords of entries saved before reuse checks existed
+    try:
+        n_backfilled = db_backfill_fingerprints(user_auth)
+        if n_backfilled:
+            print(PROMPT_FINGERPRINT_BACKFILL.format(n_backfilled))
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+
+    # Check that no entry was added, deleted or rolled back while PyPass was not running
+    try:
+        if user_auth.get_merkle_root() is None:
+            # Vault created before integrity roots existed
+            user_auth.rebuild_merkle_tree()
+            print(PROMPT_MERKLE_BUILT.format(db_count_entries(user_auth)))
+        elif not user_auth.check_merkle_root():
+            print(WARNING_MERKLE_ROOT_MISMATCH)
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
+
+    # Convert entries encrypted by older versions, while the user works
+    try:
+        start_envelope_conversion(user_auth)
+    except sqlite3.DatabaseError:
+        print(ERROR_DATABASE_ERROR)
     return user_auth
 
 def cleanup(user_auth):
+    stop_envelope_conversion()
     del user_auth
 
 def main():
@@ -0,0 +1,211 @@
+"""
+Local credential server, for many PyPass users at once.
+
+The server listens on a Unix domain socket that only the owner can open, and keeps one session
+(an AsyncVault) per authenticated user, shared by all of their logins. Sessions are closed,
+wiping their keys, after SERVER_SESSION_IDLE_TIMEOUT seconds without a request.
+
+Key derivation runs in a pool of SERVER_KDF_WORKERS processes, so logins neither block the
+event loop nor compete with vault operations for the GIL. At most SERVER_MAX_PENDING_LOGINS
+logins are in progress at a time, and the rest are turned away with an error right away,
+so a burst of logins cannot starve the requests of users that are already logged in.
+
+Protocol: one JSON object per line in each direction, as with the unlock agent (see agent.py).
+    {"op": "login", "username": "alice", "master_pw": "..."}  -> {"ok": true, "result": {"token": "..."}}
+    {"op": "search", "token": "...", "query": "mail"}          -> {"ok": true, "result": [entry, ...]}
+    {"op": "logout", "token": "..."}, {"op": "ping"}
+Vault operations are the ones of the scripted CLI (see vaultops.py), with their arguments.
+
+    python -m pypass.server [--socket PATH] [--kdf-workers N]
+"""
+import os, sys, json, time, signal, socket, asyncio, secrets, argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pypass.params import *
+from pypass.consts import *
+from pypass.helpers import generate_key
+from pypass.agent import AgentError, bind_agent_socket, peer_allowed
+from pypass.asyncvault import AsyncVault
+from pypass.vaultops import VAULT_OPS, VaultError, unlock
+
+def server_socket_path()->str:
+    return os.environ.get(SERVER_SOCKET_ENV) or os.path.join(DATA_DNAME, SERVER_SOCKET_FNAME)
+
+class Session:
+    """The unlocked vault of a user, and the tokens of their logins"""
+    def __init__(self, vault:AsyncVault):
+        self.vault = vault
+        self.tokens = set()
+        self.active = 0 # Requests in progress
+        self.last_used = time.monotonic()
+
+class CredentialServer:
+    def __init__(self, *, kdf_workers:int=SERVER_KDF_WORKERS, max_pending_logins:int=SERVER_MAX_PENDING_LOGINS, \
+        idle_timeout:float=SERVER_SESSION_IDLE_TIMEOUT):
+        # Forking a process that runs threads is unsafe, so workers are started fresh
+        self.kdf_pool = ProcessPoolExecutor(kdf_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.logins = asyncio.Semaphore(max_pending_logins)
+        self.idle_timeout = idle_timeout
+        self.sessions = {} # username: Session
+        self.tokens = {} # token: username
+
+    def derive_key(self, pw:str, salt:bytes=None, kdf_params:tuple=(SCRYPT_N, SCRYPT_R, SCRYPT_P)):
+        """generate_key() in the process pool. Blocks the calling thread, never the event loop."""
+        return self.kdf_pool.submit(generate_key, pw, salt, kdf_params).result()
+
+    # ######### SESSIONS #########
+
+    async def login(self, username:str, master_pw:str)->str:
+        """Check the master password of a user, and return a token for their session"""
+        if self.logins.locked():
+            raise VaultError(ERROR_SERVER_BUSY)
+        async with self.logins:
+            session = self.sessions.get(username)
+            if session is None:
+                vault = await AsyncVault.open(username, master_pw, derive_key=self.derive_key, \
+                    max_workers=SERVER_SESSION_WORKERS)
+                # Another login of the same user may have opened a session in the meantime
+                session = self.sessions.get(username)
+                if session is None:
+                    session = self.sessions[username] = Session(vault)
+                else:
+                    await vault.close()
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, \
+                    lambda: unlock(username, master_pw, derive_key=self.derive_key))
+        token = secrets.token_urlsafe(32)
+        session.tokens.add(token)
+        session.last_used = time.monotonic()
+        self.tokens[token] = username
+        return token
+
+    def get_session(self, token)->Session:
+        username = self.tokens.get(token) if type(token) == str else None
+        if username is None or username not in self.sessions:
+            raise VaultError(ERROR_SERVER_NOT_LOGGED_IN)
+        return self.sessions[username]
+
+    async def close_session(self, username:str):
+        session = self.sessions.pop(username, None)
+        if session is None:
+            return
+        for token in session.tokens:
+            self.tokens.pop(token, None)
+        await session.vault.close()
+
+    async def logout(self, token):
+        session = self.get_session(token)
+        session.tokens.discard(token)
+        self.tokens.pop(token, None)
+        if not session.tokens and not session.active:
+            await self.close_session(session.vault.username)
+
+    async def reap_sessions(self):
+        """Close sessions that are idle for longer than the idle timeout"""
+        while True:
+            await asyncio.sleep(SERVER_REAP_INTERVAL)
+            now = time.monotonic()
+            for username, session in list(self.sessions.items()):
+                if not session.active and now - session.last_used > self.idle_timeout:
+                    await self.close_session(username)
+
+    # ######### REQUESTS #########
+
+    async def handle_request(self, request:dict):
+        op = request.pop('op', None)
+        if op == 'ping':
+            return {'pid': os.getpid(), 'sessions': len(self.sessions)}
+        if op == 'login':
+            username, master_pw = request.get('username'), request.get('master_pw')
+            if type(username) != str or type(master_pw) != str:
+                raise VaultError("'username' and 'master_pw' must be strings.")
+            return {'token': await self.login(username, master_pw)}
+        if op == 'logout':
+            await self.logout(request.get('token'))
+            return None
+        if op not in VAULT_OPS:
+            raise VaultError(f"Unknown op {op!r}.")
+        session = self.get_session(request.pop('token', None))
+        session.active += 1
+        try:
+            return await session.vault.op(op, **request)
+        finally:
+            session.active -= 1
+            session.last_used = time.monotonic()
+
+    async def handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        """Serve the requests of a connection, one at a time"""
+        try:
+            if not peer_allowed(writer.get_extra_info('socket')):
+                return
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), SERVER_CLIENT_IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, OSError):
+                    # Idle, or the request is too large
+                    return
+                if not line:
+                    return
+                try:
+                    request = json.loads(line)
+                    if type(request) != dict:
+                        raise VaultError("A request must be a JSON object.")
+                    response = {'ok': True, 'result': await self.handle_request(request)}
+                except (VaultError, ValueError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                except Exception as e:
+                    # A bad request must not take the server down
+                    response = {'ok': False, 'error': f"Internal error: {type(e).__name__}"}
+                writer.write(json.dumps(response).encode(HASH_ENCODING) + b'\n')
+                await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path:str):
+        """Serve requests until SIGINT or SIGTERM"""
+        server_sock = bind_agent_socket(path)
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(signum, stop.set)
+        reaper = asyncio.create_task(self.reap_sessions())
+        try:
+            server = await asyncio.start_unix_server(self.handle_connection, sock=server_sock, \
+                limit=AGENT_MAX_REQUEST_SIZE)
+            async with server:
+                print(PROMPT_SERVER_STARTED.format(path, os.getpid()), file=sys.stderr)
+                await stop.wait()
+        finally:
+            reaper.cancel()
+            for username in list(self.sessions):
+                await self.close_session(username)
+            self.kdf_pool.shutdown()
+            if os.path.exists(path):
+                os.unlink(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default='', help=f'Socket path, defaults to ${SERVER_SOCKET_ENV} or data/{SERVER_SOCKET_FNAME}')
+    parser.add_argument('--kdf-workers', type=int, default=SERVER_KDF_WORKERS, help='Processes deriving keys')
+    parser.add_argument('--max-pending-logins', type=int, default=SERVER_MAX_PENDING_LOGINS)
+    parser.add_argument('--idle-timeout', type=float, default=SERVER_SESSION_IDLE_TIMEOUT, \
+        help='Idle seconds before a session is closed')
+    args = parser.parse_args()
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print(ERROR_SERVER_UNSUPPORTED, file=sys.stderr)
+        sys.exit(1)
+
+    async def main():
+        server = CredentialServer(kdf_workers=args.kdf_workers, max_pending_logins=args.max_pending_logins, \
+            idle_timeout=args.idle_timeout)
+        await server.serve(args.socket or server_socket_path())
+
+    try:
+        asyncio.run(main())
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,482 @@
+"""
+Password strength estimation in the style of zxcvbn.
+
+A password is split into the most guessable sequence of patterns (dictionary words with
+l33t substitutions, keyboard walks, character sequences, repeats, dates and years) and
+brute-forced remainders, and the number of guesses an attacker needs is estimated from it.
+
+Dictionaries are compiled into a compact binary trie that is memory-mapped on first use.
+Build one from frequency-ranked word lists (most common word first, one per line):
+    python -m pypass.strength <list.txt> [<list.txt> ...]
+Without a compiled dictionary, a small built-in list of common passwords is used.
+"""
+import os, re, sys, math, mmap, struct, datetime
+from collections import deque
+from functools import lru_cache
+
+from pypass.params import *
+from pypass.consts import *
+
+# ######### DICTIONARY TRIE #########
+#
+# File layout (little-endian):
+#     header: magic 'PPTR', format version (u32), node count (u32)
+#     nodes, root first. Each node is:
+#         rank (u32, 0 if no word ends here), number of children n (u8),
+#         n child characters, n child node offsets (u32)
+
+TRIE_MAGIC = b'PPTR'
+TRIE_VERSION = 1
+TRIE_HEADER = struct.Struct('<4sII')
+TRIE_NODE = struct.Struct('<IB')
+TRIE_OFFSET = struct.Struct('<I')
+TRIE_MIN_WORD_LEN = 3
+
+# Fallback dictionary, most common first
+COMMON_PASSWORDS = (
+    'password', '123456', '12345678', 'qwerty', '123456789', '12345', '1234567', 'letmein',
+    'football', 'iloveyou', 'admin', 'welcome', 'monkey', 'login', 'abc123', 'starwars',
+    '123123', 'dragon', 'passw0rd', 'master', 'hello', 'freedom', 'whatever', 'qazwsx',
+    'trustno1', 'sunshine', 'princess', 'baseball', 'shadow', 'superman', 'michael',
+    'batman', 'secret', 'summer', 'winter', 'spring', 'autumn', 'flower', 'computer',
+    'internet', 'pass', 'test', 'guest', 'root', 'love', 'soccer', 'hockey', 'killer',
+    'jordan', 'hunter', 'ranger', 'buster', 'thomas', 'robert', 'charlie', 'daniel',
+    'jessica', 'ashley', 'pepper', 'ginger', 'cheese', 'chocolate', 'banana', 'orange',
+    'purple', 'yellow', 'silver', 'golden', 'diamond', 'angel', 'lovely', 'mustang',
+    'access', 'matrix', 'google', 'apple', 'samsung', 'facebook', 'github', 'pypass',
+    'changeme', 'default', 'oracle', 'mysql', 'server', 'office', 'company', 'money',
+    'family', 'friend', 'happy', 'house', 'world', 'music', 'dog', 'cat',
+)
+
+def trie_from_words(ranked_words)->bytes:
+    """
+    Serialize (word, rank) pairs into the binary trie format.
+    A word that appears more than once keeps its best (lowest) rank.
+    """
+    # Build the trie in memory. Node: [rank, {char: child}]
+    root = [0, {}]
+    for word, rank in ranked_words:
+        node = root
+        for ch in word.encode('ascii'):
+            node = node[1].setdefault(ch, [0, {}])
+        if node[0] == 0 or rank < node[0]:
+            node[0] = rank
+
+    # Assign offsets in breadth-first order
+    order = []
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        queue.extend(node[1][ch] for ch in sorted(node[1]))
+    offsets = {}
+    offset = TRIE_HEADER.size
+    for node in order:
+        offsets[id(node)] = offset
+        offset += TRIE_NODE.size + len(node[1]) * (1 + TRIE_OFFSET.size)
+
+    out = bytearray(TRIE_HEADER.pack(TRIE_MAGIC, TRIE_VERSION, len(order)))
+    for node in order:
+        chars = sorted(node[1])
+        out += TRIE_NODE.pack(node[0], len(chars))
+        out += bytes(chars)
+        for ch in chars:
+            out += TRIE_OFFSET.pack(offsets[id(node[1][ch])])
+    return bytes(out)
+
+def normalize_dict_word(word:str)->str:
+    """Returns the lowercase form of a dictionary word, or an empty string if it is not usable"""
+    word = word.strip().lower()
+    if len(word) < TRIE_MIN_WORD_LEN or not word.isascii() or not word.isprintable():
+        return ''
+    return word
+
+def build_strength_dict(src_paths:list, dst_path:str)->int:
+    """
+    Compile frequency-ranked word lists into a binary trie file.
+    The rank of a word is its line number in its list. Returns the number of words.
+    """
+    def ranked_words():
+        for src_path in src_paths:
+            with open(src_path, 'r', encoding='utf-8', errors='replace') as src:
+                rank = 0
+                for line in src:
+                    # Accept 'word' and 'word<whitespace>count' lines
+                    fields = line.split()
+                    word = normalize_dict_word(fields[0]) if fields else ''
+                    if word:
+                        rank += 1
+                        yield word, rank
+    words = list(ranked_words())
+    tmp_path = dst_path + '.tmp'
+    with open(tmp_path, 'wb') as dst:
+        dst.write(trie_from_words(words))
+    os.replace(tmp_path, dst_path)
+    return len(words)
+
+class DictTrie:
+    """Read-only view over a binary trie held in bytes or a memory map"""
+    def __init__(self, buf):
+        magic, version, _ = TRIE_HEADER.unpack_from(buf, 0)
+        if magic != TRIE_MAGIC or version != TRIE_VERSION:
+            raise ValueError(f"strength.DictTrie: Not a version {TRIE_VERSION} dictionary.")
+        self.buf = buf
+        self.root = TRIE_HEADER.size
+
+    def rank(self, node:int)->int:
+        return TRIE_NODE.unpack_from(self.buf, node)[0]
+
+    def child(self, node:int, ch:bytes)->int:
+        """Returns the offset of the child node for the single byte ch, or 0 if there is none"""
+        n_children = self.buf[node + 4]
+        chars_pos = node + TRIE_NODE.size
+        idx = self.buf.find(ch, chars_pos, chars_pos + n_children)
+        if idx < 0:
+            return 0
+        return TRIE_OFFSET.unpack_from(self.buf, chars_pos + n_children + (idx - chars_pos) * 4)[0]
+
+_dict_trie = None
+
+def strength_dict_path()->str:
+    return os.path.join(DATA_DNAME, STRENGTH_DICT_FNAME)
+
+def load_dict_trie()->DictTrie:
+    """Load the dictionary on first use. Falls back to the built-in list if there is no compiled one."""
+    global _dict_trie
+    if _dict_trie is None:
+        path = strength_dict_path()
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                _dict_trie = DictTrie(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            words = [normalize_dict_word(word) for word in COMMON_PASSWORDS]
+            _dict_trie = DictTrie(trie_from_words((word, rank + 1) \
+                for rank, word in enumerate(words) if word))
+    return _dict_trie
+
+# ######### MATCHERS #########
+# Each match is a tuple (i, j, guesses, pattern) covering password[i:j + 1]
+
+L33T_TABLE = {
+    '4': 'a', '@': 'a', '8': 'b', '(': 'c', '{': 'c', '[': 'c', '<': 'c', '3': 'e',
+    '6': 'g', '9': 'g', '1': 'il', '!': 'i', '|': 'il', '0': 'o', '$': 's', '5': 's',
+    '7': 'lt', '+': 't', '%': 'x', '2': 'z'
+}
+# Trie characters to try for each character of a password
+TRIE_CANDIDATES = {ch: (ch.encode(),) for ch in map(chr, range(128))}
+for l33t_ch, letters in L33T_TABLE.items():
+    TRIE_CANDIDATES[l33t_ch] = (l33t_ch.encode(),) + tuple(letter.encode() for letter in letters)
+
+def n_choose_k(n:int, k:int)->int:
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+def uppercase_variations(word:str)->int:
+    if word.islower() or not any(ch.isalpha() for ch in word):
+        return 1
+    # Common capitalizations: first letter, last letter, all caps
+    if word.isupper() or (word[0].isupper() and word[1:].islower()) or \
+        (word[-1].isupper() and word[:-1].islower()):
+        return 2
+    n_upper = sum(ch.isupper() for ch in word)
+    n_lower = sum(ch.islower() for ch in word)
+    return sum(n_choose_k(n_upper + n_lower, i) for i in range(1, min(n_upper, n_lower) + 1))
+
+def dictionary_matches(pw:str, trie:DictTrie)->list:
+    """Dictionary words in the password, including l33t-substituted ones"""
+    matches = []
+    pw_lower = pw.lower()
+    n = len(pw)
+    root = trie.root
+    for i in range(n):
+        # Depth-first walk, branching on l33t substitutions
+        stack = [(root, i, 0)]
+        while stack:
+            node, j, n_subs = stack.pop()
+            if j > i:
+                rank = trie.rank(node)
+                if rank:
+                    word = pw[i:j]
+                    guesses = rank * uppercase_variations(word) * (2 ** n_subs if n_subs else 1)
+                    matches.append((i, j - 1, guesses, 'l33t' if n_subs else 'dictionary'))
+            if j == n:
+                continue
+            # Characters outside ASCII are never part of a dictionary word
+            candidates = TRIE_CANDIDATES.get(pw_lower[j], ())
+            for k, cand in enumerate(candidates):
+                child = trie.child(node, cand)
+                if child:
+                    # The first candidate is the character itself
+                    stack.append((child, j + 1, n_subs + (k > 0)))
+    return matches
+
+# QWERTY layout: unshifted and shifted rows, and the horizontal offset of each row
+KEYBOARD_ROWS = ["`1234567890-=", "qwertyuiop[]\\", "asdfghjkl;'", "zxcvbnm,./"]
+KEYBOARD_ROWS_SHIFTED = ['~!@#$%^&*()_+', 'QWERTYUIOP{}|', 'ASDFGHJKL:"', 'ZXCVBNM<>?']
+KEYBOARD_ROW_OFFSETS = [0, 1.5, 2, 2.5]
+
+def build_keyboard_graph()->tuple[dict, dict]:
+    """
+    Returns the position of every key, and the neighbor keys of every key position.
+    Shifted characters share the position of their key.
+    """
+    key_pos = {}
+    for row, (keys, keys_shifted) in enumerate(zip(KEYBOARD_ROWS, KEYBOARD_ROWS_SHIFTED)):
+        for col, (key, key_shifted) in enumerate(zip(keys, keys_shifted)):
+            pos = (row, col + KEYBOARD_ROW_OFFSETS[row])
+            key_pos[key] = pos
+            key_pos[key_shifted] = pos
+    positions = set(key_pos.values())
+    neighbors = {}
+    for row, x in positions:
+        candidates = [(row, x - 1), (row, x + 1), (row - 1, x - 0.5), (row - 1, x + 0.5), \
+            (row + 1, x - 0.5), (row + 1, x + 0.5)]
+        neighbors[(row, x)] = [pos for pos in candidates if pos in positions]
+    return key_pos, neighbors
+
+KEYBOARD_POS, KEYBOARD_NEIGHBORS = build_keyboard_graph()
+KEYBOARD_STARTING_POSITIONS = len(KEYBOARD_NEIGHBORS)
+KEYBOARD_AVERAGE_DEGREE = sum(map(len, KEYBOARD_NEIGHBORS.values())) / KEYBOARD_STARTING_POSITIONS
+SHIFTED_KEYS = set(''.join(KEYBOARD_ROWS_SHIFTED))
+
+def spatial_guesses(length:int, turns:int, n_shifted:int)->float:
+    guesses = 0
+    for i in range(2, length + 1):
+        for j in range(1, min(turns, i - 1) + 1):
+            guesses += n_choose_k(i - 1, j - 1) * KEYBOARD_STARTING_POSITIONS * KEYBOARD_AVERAGE_DEGREE ** j
+    if n_shifted:
+        n_unshifted = length - n_shifted
+        if n_unshifted == 0:
+            guesses *= 2
+        else:
+            guesses *= sum(n_choose_k(length, i) for i in range(1, min(n_shifted, n_unshifted) + 1))
+    return guesses
+
+def spatial_matches(pw:str)->list:
+    """Keyboard walks of at least 3 keys, like 'qwerty' or 'zaq1@WSX'"""
+    matches = []
+    i = 0
+    n = len(pw)
+    while i < n - 2:
+        j = i
+        turns = 0
+        last_dir = None
+        while j + 1 < n:
+            prev_pos = KEYBOARD_POS.get(pw[j])
+            next_pos = KEYBOARD_POS.get(pw[j + 1])
+            if prev_pos is None or next_pos not in KEYBOARD_NEIGHBORS[prev_pos]:
+                break
+            direction = (next_pos[0] - prev_pos[0], next_pos[1] - prev_pos[1])
+            if direction != last_dir:
+                turns += 1
+                last_dir = direction
+            j += 1
+        if j - i >= 2:
+            n_shifted = sum(ch in SHIFTED_KEYS for ch in pw[i:j + 1])
+            matches.append((i, j, spatial_guesses(j - i + 1, turns, n_shifted), 'spatial'))
+            i = j
+        else:
+            i += 1
+    return matches
+
+def sequence_matches(pw:str)->list:
+    """Runs with a constant step, like 'abc', '9753' or 'ZYX'"""
+    matches = []
+    n = len(pw)
+    i = 0
+    while i < n - 2:
+        delta = ord(pw[i + 1]) - ord(pw[i])
+        if delta == 0 or abs(delta) > 5 or not same_char_class(pw[i], pw[i + 1]):
+            i += 1
+            continue
+        j = i + 1
+        while j + 1 < n and ord(pw[j + 1]) - ord(pw[j]) == delta and same_char_class(pw[j], pw[j + 1]):
+            j += 1
+        if j - i >= 2:
+            first = pw[i]
+            if first in 'aAzZ019':
+                base = 4
+            elif first.isdigit():
+                base = 10
+            else:
+                base = 26
+            guesses = base * (j - i + 1) * (1 if delta > 0 else 2)
+            matches.append((i, j, guesses, 'sequence'))
+            i = j
+        else:
+            i += 1
+    return matches
+
+def same_char_class(a:str, b:str)->bool:
+    return (a.islower() and b.islower()) or (a.isupper() and b.isupper()) or \
+        (a.isdigit() and b.isdigit())
+
+RE_REPEAT = re.compile(r'(.+?)\1+', re.DOTALL)
+
+def repeat_matches(pw:str)->list:
+    """Repeated characters or chunks, like 'aaa' or 'abcabc'"""
+    matches = []
+    for match in RE_REPEAT.finditer(pw):
+        unit = match.group(1)
+        count = len(match.group()) // len(unit)
+        unit_guesses = estimate_guesses(unit) if len(unit) > 1 else BRUTEFORCE_CARDINALITY
+        matches.append((match.start(), match.end() - 1, unit_guesses * count, 'repeat'))
+    return matches
+
+REFERENCE_YEAR = datetime.date.today().year
+MIN_YEAR_SPACE = 20
+RE_YEAR = re.compile(r'19\d\d|20\d\d')
+RE_DATE_SEPARATED = re.compile(r'(\d{1,4})([\s/\\_.-])(\d{1,2})\2(\d{1,4})')
+RE_DIGITS = re.compile(r'\d{4,8}')
+
+def year_space(year:int)->int:
+    return max(abs(year - REFERENCE_YEAR), MIN_YEAR_SPACE)
+
+def to_date(a:int, b:int, c:int):
+    """
+    Interpret three numbers as a date in any common order.
+    Returns the year, or None if they are not a valid date.
+    """
+    for year, rest in [(c, (a, b)), (a, (b, c))]:
+        if year < 100:
+            year += 1900 if year > 50 else 2000
+        if not 1000 <= year <= 2050:
+            continue
+        day, month = rest
+        if (1 <= month <= 12 and 1 <= day <= 31) or (1 <= day <= 12 and 1 <= month <= 31):
+            return year
+    return None
+
+def date_matches(pw:str)->list:
+    matches = []
+    for match in RE_YEAR.finditer(pw):
+        matches.append((match.start(), match.end() - 1, year_space(int(match.group())), 'year'))
+    for match in RE_DATE_SEPARATED.finditer(pw):
+        year = to_date(int(match.group(1)), int(match.group(3)), int(match.group(4)))
+        if year:
+            matches.append((match.start(), match.end() - 1, 365 * year_space(year) * 4, 'date'))
+    # Dates without separators, e.g. 1391, 220595, 19900415
+    for match in RE_DIGITS.finditer(pw):
+        digits = match.group()
+        for start in range(len(digits) - 3):
+            for end in range(start + 4, min(start + 8, len(digits)) + 1):
+                year = split_date(digits[start:end])
+                if year:
+                    matches.append((match.start() + start, match.start() + end - 1, \
+                        365 * year_space(year), 'date'))
+    return matches
+
+# Ways to split a digit token of each length into three numbers, as zxcvbn does
+DATE_SPLITS = {
+    4: [(1, 2), (2, 3)],
+    5: [(1, 3), (2, 3)],
+    6: [(1, 2), (2, 4), (4, 5)],
+    7: [(1, 3), (2, 3), (4, 5), (4, 6)],
+    8: [(2, 4), (4, 6)]
+}
+
+@lru_cache(maxsize=4096)
+def split_date(token:str):
+    """
+    Try to split a 4 ~ 8 digit token into day, month and year.
+    Returns the year of the first valid split, or None.
+    """
+    for k, l in DATE_SPLITS[len(token)]:
+        year = to_date(int(token[:k]), int(token[k:l]), int(token[l:]))
+        if year:
+            return year
+    return None
+
+# ######### SCORING #########
+
+BRUTEFORCE_CARDINALITY = 10
+MIN_GUESSES_BEFORE_GROWING_SEQUENCE = 10000
+MIN_SUBMATCH_GUESSES_SINGLE_CHAR = 10
+MIN_SUBMATCH_GUESSES_MULTI_CHAR = 50
+# Guesses needed for each score, see estimate_strength()
+SCORE_THRESHOLDS = [1e3, 1e6, 1e8, 1e10]
+
+def estimate_guesses(pw:str, matches:list=None)->float:
+    """
+    Minimum number of guesses over all ways to split pw into matches and brute-forced
+    characters. Like zxcvbn, a sequence of l matches with a product of guesses P costs
+    l! * P + MIN_GUESSES_BEFORE_GROWING_SEQUENCE ** (l - 1).
+    """
+    n = len(pw)
+    if n == 0:
+        return 1
+    if matches is None:
+        matches = find_matches(pw)
+    ends = [[] for _ in range(n)]
+    for match in matches:
+        ends[match[1]].append(match)
+
+    # best[k]: state (number of matches, last match is brute force) -> product of guesses
+    best = [dict() for _ in range(n + 1)]
+    best[0][(0, False)] = 1
+    for k in range(n):
+        states = best[k + 1]
+        # Brute force the character at k, extending a brute-forced run if there is one
+        for (l, last_bf), product in best[k].items():
+            if last_bf:
+                key, new_product = (l, True), product * BRUTEFORCE_CARDINALITY
+            else:
+                key, new_product = (l + 1, True), product * MIN_SUBMATCH_GUESSES_SINGLE_CHAR
+            if new_product < states.get(key, math.inf):
+                states[key] = new_product
+        # Patterns ending at k
+        for i, _, guesses, _ in ends[k]:
+            min_guesses = MIN_SUBMATCH_GUESSES_SINGLE_CHAR if i == k else MIN_SUBMATCH_GUESSES_MULTI_CHAR
+            guesses = max(guesses, min_guesses)
+            for (l, _), product in best[i].items():
+                key = (l + 1, False)
+                new_product = product * guesses
+                if new_product < states.get(key, math.inf):
+                    states[key] = new_product
+        best[k + 1] = prune_states(states)
+
+    return min(math.factorial(l) * product + MIN_GUESSES_BEFORE_GROWING_SEQUENCE ** (l - 1) \
+        for (l, _), product in best[n].items())
+
+def prune_states(states:dict)->dict:
+    """
+    Drop states that use more matches than another state with the same last match type,
+    without a smaller product of guesses. They can never lead to fewer guesses.
+    """
+    pruned = {}
+    for last_bf in [False, True]:
+        min_product = math.inf
+        for l in sorted(l for l, bf in states if bf == last_bf):
+            product = states[(l, last_bf)]
+            if product < min_product:
+                pruned[(l, last_bf)] = product
+                min_product = product
+    return pruned
+
+def find_matches(pw:str)->list:
+    return dictionary_matches(pw, load_dict_trie()) + spatial_matches(pw) + \
+        sequence_matches(pw) + repeat_matches(pw) + date_matches(pw)
+
+def estimate_strength(pw:str)->dict:
+    """
+    Estimate how hard a password is to guess.
+
+    (Returns)
+        A dictionary with
+        'guesses': estimated number of guesses to crack the password
+        'entropy': log2 of guesses, in bits
+        'score': 0 (too guessable) ~ 4 (very unguessable), using SCORE_THRESHOLDS
+    """
+    guesses = estimate_guesses(pw)
+    score = sum(guesses >= threshold for threshold in SCORE_THRESHOLDS)
+    return {
+        'guesses': guesses,
+        'entropy': math.log2(guesses),
+        'score': score
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    n_written = build_strength_dict(sys.argv[1:], strength_dict_path())
+    print(f"Wrote {n_written} words to '{strength_dict_path()}'.")
@@ -2,6 +2,9 @@ import re
 
 from pypass.params import *
 from pypass.consts import *
+from pypass.policy import compile_policy
+from pypass.strength import estimate_strength
+from pypass.breach import is_password_breached
 
 # ######### GLOBALS #########
 globals_user_pw = ''
@@ -51,9 +54,24 @@ def validate_user_pw(user_pw, verbose=True, strict=False):
             if verbose:
                 return ERROR_PW_UNSUPPORTED_CHARS.format(ch)
             return False
+    # Too easy to guess
+    if strict:
+        strength = estimate_strength(user_pw)
+        if strength['score'] < USER_PW_MIN_STRENGTH_SCORE:
+            if verbose:
+                return ERROR_PW_TOO_WEAK.format(strength['entropy'])
+            return False
+        # Known to attackers
+        if is_password_breached(user_pw):
+            if verbose:
+                return ERROR_PW_BREACHED
+            return False
     globals_user_pw = user_pw
     return True
 
+def validate_user_pw_strict(user_pw, verbose=True):
+    return validate_user_pw(user_pw, verbose, strict=True)
+
 def validate_user_pw_confirm(user_pw_confirm, verbose=True):
     if globals_user_pw != user_pw_confirm:
         if verbose:
@@ -61,6 +79,15 @@ def validate_user_pw_confirm(user_pw_confirm, verbose=True):
         return False
     return True
 
+def validate_pw_policy(policy:str, verbose=True):
+    try:
+        compile_policy(policy)
+    except ValueError as ve:
+        if verbose:
+            return ERROR_PW_POLICY_INVALID.format(ve)
+        return False
+    return True
+
 def validate_entry_url(entry_url:str, verbose=True):
     # Too long
     if len(entry_url) > 256:
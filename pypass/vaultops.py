@@ -0,0 +1,178 @@
+"""
+Prompt-free operations on a vault, shared by the scripted CLI (cli.py) and AsyncVault (asyncvault.py).
+
+Each operation takes a UserAuth object and its arguments as a dictionary, and returns a
+JSON-serializable result, or an iterator of them for results with one item per entry.
+Invalid arguments, missing entries and entries that fail their checks raise VaultError.
+"""
+import sqlite3
+
+from pypass.params import *
+from pypass.consts import *
+from pypass.helpers import *
+from pypass import masterauth
+from pypass.policy import generate_new_pw
+from pypass.validators import *
+
+class VaultError(Exception):
+    pass
+
+def unlock(username:str, master_pw:str, *, derive_key=generate_key)->bytes:
+    """Check the master password of a user without prompting. Returns their data key."""
+    conn = masterauth.master_db_connect()
+    user = masterauth.get_user_if_exists(username, conn)
+    if not user:
+        raise VaultError(ERROR_MASTER_USERNAME_DOES_NOT_EXIST.format(username))
+    data_key = masterauth.unlock_user_key(conn, row_to_dict(row=user, cols=MASTER_DB_COLUMNS), master_pw, \
+        derive_key=derive_key)
+    if not data_key:
+        raise VaultError(ERROR_VAULT_WRONG_MASTER_PASSWORD)
+    return data_key
+
+def open_session(username:str, master_pw:str, *, derive_key=generate_key):
+    """Authenticate without prompting. Returns a UserAuth object."""
+    user_auth = masterauth.UserAuth(username, unlock(username, master_pw, derive_key=derive_key))
+    # Vault created before integrity roots existed
+    if user_auth.get_merkle_root() is None:
+        user_auth.rebuild_merkle_tree()
+    return user_auth
+
+def get_arg(args:dict, key:str, arg_type:type, default=None):
+    value = args.get(key, default)
+    if value is None:
+        raise VaultError(f"'{key}' is required.")
+    if type(value) != arg_type:
+        raise VaultError(f"'{key}' must be of type {arg_type.__name__}.")
+    return value
+
+def check(result):
+    """Validators return True, or an error message"""
+    if result is not True:
+        raise VaultError(result or "Invalid value.")
+
+def op_get(user_auth, args:dict):
+    row = get_verified_entry(user_auth, get_arg(args, 'entry_id', int))
+    decrypt_pw = get_arg(args, 'password', bool, True)
+    entry = decrypt_row(row, user_auth, decrypt_pw=decrypt_pw, to_dict=True)
+    return entry_to_json(entry, [] if decrypt_pw else ['user_pw'])
+
+def op_search(user_auth, args:dict):
+    query = get_arg(args, 'query', str)
+    check(SEARCH_QUERY_MIN_LEN <= len(query) <= SEARCH_QUERY_MAX_LEN or ERROR_VIEW_QUERY_TOO_SHORT.format(SEARCH_QUERY_MIN_LEN))
+    rows = get_multiple_entries(user_auth, query)
+    return iter([entry_to_json(entry, ['user_pw']) for entry in decrypt_rows(rows, user_auth, to_dict=True)])
+
+def new_pw_from_args(args:dict)->str:
+    """The password given in the arguments, or a newly generated one"""
+    if get_arg(args, 'generate', bool, False):
+        policy = get_arg(args, 'policy', str, '')
+        check(validate_pw_policy(policy))
+        return generate_new_pw('generate', policy)
+    if get_arg(args, 'passphrase', bool, False):
+        return generate_new_pw('passphrase')
+    user_pw = get_arg(args, 'user_pw', str)
+    check(validate_user_pw(user_pw, strict=not get_arg(args, 'allow_weak', bool, False)))
+    return user_pw
+
+def op_add(user_auth, args:dict):
+    name = get_arg(args, 'name', str)
+    user_id = get_arg(args, 'user_id', str, '')
+    url = get_arg(args, 'url', str, '')
+    check(validate_entry_name(name))
+    check(validate_user_id(user_id))
+    if url:
+        check(validate_entry_url(url))
+    user_pw = new_pw_from_args(args)
+    policy = get_arg(args, 'policy', str, '') if get_arg(args, 'generate', bool, False) else ''
+    reused_by = [name for _, name in db_find_pw_reuse(user_auth, user_pw)]
+    entry_id = db_add_entry(user_auth, name, user_id, user_pw, url, policy=policy)
+    if not entry_id:
+        raise VaultError(ERROR_DATABASE_ERROR)
+    result = {'entry_id': entry_id, 'reused_by': reused_by}
+    if 'user_pw' not in args:
+        result['user_pw'] = user_pw
+    return result
+
+def expected_version(row, args:dict)->int:
+    """
+    row_version the entry must still have to be changed: the one given in the arguments, as read
+    by the client, or else the one of the row that was just verified
+    """
+    version = row[DB_COLUMNS['row_version']['index']]
+    if get_arg(args, 'row_version', int, version) != version:
+        raise EntryConflictError(row[DB_COLUMNS['entry_id']['index']])
+    return version
+
+def op_update(user_auth, args:dict):
+    entry_id = get_arg(args, 'entry_id', int)
+    # A tampered entry is never signed again
+    row = get_verified_entry(user_auth, entry_id)
+    version = expected_version(row, args)
+    name = get_arg(args, 'name', str, '')
+    user_id = get_arg(args, 'user_id', str, '')
+    url = get_arg(args, 'url', str, '')
+    if name:
+        check(validate_entry_name(name))
+    if user_id:
+        check(validate_user_id(user_id))
+    if url:
+        check(validate_entry_url(url))
+    user_pw = ''
+    if any(key in args for key in ['user_pw', 'generate', 'passphrase']):
+        user_pw = new_pw_from_args(args)
+    policy = get_arg(args, 'policy', str, '') if get_arg(args, 'generate', bool, False) else None
+    if not (name or user_id or user_pw or url):
+        raise VaultError("Nothing to update.")
+    if not db_update_entry(user_auth, entry_id, name, user_id, user_pw, url, policy=policy, expected_version=version):
+        raise VaultError(ERROR_DATABASE_ERROR)
+    result = {'entry_id': entry_id, 'row_version': version + 1}
+    if user_pw and 'user_pw' not in args:
+        result['user_pw'] = user_pw
+    return result
+
+def op_delete(user_auth, args:dict):
+    entry_id = get_arg(args, 'entry_id', int)
+    row = get_entry_by_id(user_auth, entry_id)
+    if not row:
+        raise VaultError(f"No entry with ID {entry_id}.")
+    db_delete_entry(user_auth, entry_id, expected_version=expected_version(row, args))
+    return {'entry_id': entry_id}
+
+def op_export(user_auth, args:dict):
+    """All entries with their passwords, decrypted in batches. 'valid' is False for entries with an invalid signature."""
+    cur = user_auth.conn.cursor()
+    cur.execute(f'SELECT * FROM {DB_TABLE} ORDER BY entry_id')
+    try:
+        while True:
+            rows = cur.fetchmany(CLI_EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            invalid_ids = set(user_auth.verify_rows(rows))
+            for entry in decrypt_rows(rows, user_auth, decrypt_pw=True, to_dict=True):
+                yield {**entry_to_json(entry), 'valid': entry['entry_id'] not in invalid_ids}
+    finally:
+        cur.close()
+
+def op_verify(user_auth, args:dict):
+    full = get_arg(args, 'full', bool, False)
+    return {'invalid': user_auth.verify_all(full=full), 'root_valid': user_auth.check_merkle_root(full=full)}
+
+VAULT_OPS = {
+    'get': op_get,
+    'search': op_search,
+    'add': op_add,
+    'update': op_update,
+    'delete': op_delete,
+    'export': op_export,
+    'verify': op_verify,
+}
+
+def run_op(user_auth, op:str, args:dict):
+    if op not in VAULT_OPS:
+        raise VaultError(f"Unknown op {op!r}.")
+    try:
+        return VAULT_OPS[op](user_auth, args)
+    except (ValueError, EntryConflictError) as e:
+        raise VaultError(str(e))
+    except sqlite3.DatabaseError:
+        raise VaultError(ERROR_DATABASE_ERROR)
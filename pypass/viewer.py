@@ -1,10 +1,10 @@
-import rich
-from rich.panel import Panel
-from rich.text import Text
-
+# rich is imported by each function, so it is not loaded on startup
 from pypass.helpers import *
 
 def print_credential(user_auth, credential, show_pw=False, verbose=False):
+    import rich
+    from rich.panel import Panel
+    from rich.text import Text
     credential = decrypt_row(credential, user_auth, decrypt_pw=True, to_dict=True)
     text = Text()
     text.append("NAME: ", style="bold")
@@ -25,4 +25,49 @@ def print_credential(user_auth, credential, show_pw=False, verbose=False):
         text.append(format_date_from_ts(credential["date_modified"]))
     
     panel = Panel(text, title=credential["name"])
-    rich.print(panel)
\ No newline at end of file
+    rich.print(panel)
+
+def print_audit_report(report:dict):
+    import rich
+    from rich.panel import Panel
+    from rich.text import Text
+    names = report['names']
+    def entry_names(entry_ids):
+        return ', '.join(names.get(entry_id, str(entry_id)) for entry_id in entry_ids)
+
+    text = Text()
+    text.append(f"Audited {len(names)} entries ({report['n_audited']} changed since the last audit)\n")
+    text.append("\nWeak passwords: ", style="bold")
+    text.append(entry_names(report['weak']) or 'None')
+    text.append("\nBreached passwords: ", style="bold")
+    text.append(entry_names(report['breached']) or 'None')
+    text.append("\nReused passwords: ", style="bold")
+    if report['reused']:
+        for group in report['reused']:
+            text.append("\n  " + entry_names(group))
+    else:
+        text.append('None')
+    text.append("\nNot changed for a long time: ", style="bold")
+    text.append(entry_names(report['stale']) or 'None')
+
+    panel = Panel(text, title="Vault audit")
+    rich.print(panel)
+
+def print_verify_report(invalid_rows:list, root_valid:bool=True):
+    import rich
+    from rich.panel import Panel
+    from rich.text import Text
+    text = Text()
+    if invalid_rows:
+        text.append(f"{len(invalid_rows)} entries have invalid signatures:\n", style="bold red")
+        for row in invalid_rows:
+            text.append(f"\n  {row['name']} (ID {row['entry_id']})")
+        text.append("\n\nOpen an entry to delete it or mark it as valid.")
+    else:
+        text.append("All entries have valid signatures.")
+    if root_valid:
+        text.append("\nThe vault matches its integrity root.")
+    else:
+        text.append("\nThe vault does not match its integrity root. ", style="bold red")
+        text.append("Entries were added or deleted outside of PyPass, or the vault was rolled back.")
+    rich.print(Panel(text, title="Vault verification"))
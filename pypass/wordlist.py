@@ -0,0 +1,128 @@
+"""
+Compact binary wordlists for passphrase generation.
+
+File layout (all integers are little-endian, unsigned 32-bit):
+    magic 'PPWL', format version, word count N,
+    N + 1 offsets into the word data, word data (ASCII, no separators)
+
+The file is memory-mapped, so opening a wordlist does not depend on its size.
+
+Build a wordlist from a text file with one word per line
+(Diceware lines like '11111<TAB>word' are accepted too):
+    python -m pypass.wordlist <wordlist.txt> [output.bin]
+"""
+import os, sys, mmap, math, struct, secrets
+
+from pypass.params import *
+from pypass.consts import *
+
+WORDLIST_MAGIC = b'PPWL'
+WORDLIST_VERSION = 1
+WORDLIST_HEADER = struct.Struct('<4sII') # magic, version, word count
+WORDLIST_OFFSET = struct.Struct('<II') # start and end offset of one word
+
+class Wordlist:
+    """A read-only, memory-mapped wordlist"""
+    def __init__(self, path:str):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count = WORDLIST_HEADER.unpack_from(self.mm, 0)
+            if magic != WORDLIST_MAGIC or version != WORDLIST_VERSION:
+                raise ValueError(f"wordlist.Wordlist: '{path}' is not a version {WORDLIST_VERSION} wordlist.")
+            self.offsets_pos = WORDLIST_HEADER.size
+            self.data_pos = self.offsets_pos + 4 * (self.count + 1)
+            if self.count == 0 or len(self.mm) < self.data_pos:
+                raise ValueError(f"wordlist.Wordlist: '{path}' is truncated or empty.")
+        except (ValueError, struct.error):
+            self.mm.close()
+            raise
+
+    def __len__(self)->int:
+        return self.count
+
+    def __getitem__(self, idx:int)->str:
+        if not 0 <= idx < self.count:
+            raise IndexError("wordlist.Wordlist: Index out of range.")
+        start, end = WORDLIST_OFFSET.unpack_from(self.mm, self.offsets_pos + 4 * idx)
+        return self.mm[self.data_pos + start:self.data_pos + end].decode('ascii')
+
+    def bits_per_word(self)->float:
+        return math.log2(self.count)
+
+    def close(self):
+        self.mm.close()
+
+def build_wordlist(src_path:str, dst_path:str)->int:
+    """
+    Convert a text wordlist into the binary format. Duplicates, empty lines and words with
+    unsupported characters are dropped. Returns the number of words written.
+    """
+    words = {} # Ordered set
+    with open(src_path, 'r', encoding='utf-8', errors='replace') as src:
+        for line in src:
+            # Drop Diceware dice numbers
+            word = line.strip().split('\t')[-1].strip()
+            if not word or PASSPHRASE_SEPARATOR in word:
+                continue
+            if not word.isascii() or not word.isprintable() or ' ' in word:
+                continue
+            words[word] = None
+    if len(words) < 2:
+        raise ValueError("wordlist.build_wordlist(): At least 2 unique words are required.")
+
+    # Write to a temporary file first, so that a running PyPass never maps a half-written file
+    tmp_path = dst_path + '.tmp'
+    with open(tmp_path, 'wb') as dst:
+        dst.write(WORDLIST_HEADER.pack(WORDLIST_MAGIC, WORDLIST_VERSION, len(words)))
+        offset = 0
+        offsets = bytearray(struct.pack('<I', 0))
+        for word in words:
+            offset += len(word)
+            offsets += struct.pack('<I', offset)
+        dst.write(offsets)
+        for word in words:
+            dst.write(word.encode('ascii'))
+    os.replace(tmp_path, dst_path)
+    return len(words)
+
+# Opened on first use and kept open
+_wordlist = None
+
+def wordlist_path()->str:
+    return os.path.join(DATA_DNAME, WORDLIST_FNAME)
+
+def wordlist_available()->bool:
+    return os.path.isfile(wordlist_path())
+
+def load_wordlist()->Wordlist:
+    global _wordlist
+    if _wordlist is None:
+        _wordlist = Wordlist(wordlist_path())
+    return _wordlist
+
+def generate_passphrase(entropy_target:float=PASSPHRASE_ENTROPY_TARGET, *, \
+    wordlist:Wordlist=None, separator:str=PASSPHRASE_SEPARATOR)->str:
+    """
+    Generate a passphrase of randomly chosen words with at least entropy_target bits of entropy.
+    Uses the default wordlist in the data directory if no wordlist is given.
+    """
+    if wordlist is None:
+        wordlist = load_wordlist()
+    n_words = max(1, math.ceil(entropy_target / wordlist.bits_per_word()))
+    passphrase = ''
+    # Passphrases that do not fit in a password field are drawn again.
+    # This costs a negligible amount of entropy with common wordlists.
+    for _ in range(100):
+        passphrase = separator.join(wordlist[secrets.randbelow(len(wordlist))] for _ in range(n_words))
+        if len(passphrase) <= USER_PW_MAX_LEN:
+            return passphrase
+    raise ValueError(ERROR_PASSPHRASE_TOO_LONG.format(entropy_target, USER_PW_MAX_LEN))
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [2, 3]:
+        print(__doc__)
+        sys.exit(1)
+    dst = sys.argv[2] if len(sys.argv) == 3 else wordlist_path()
+    n_written = build_wordlist(sys.argv[1], dst)
+    print(f"Wrote {n_written} words ({math.log2(n_written):.2f} bits/word) to '{dst}'.")
@@ -1,26 +1,36 @@
-import sys
-import pypass_setup
+import os, sys
 from pypass.params import DATA_DNAME
 
+REQUIRED_MODULES = ['cryptography', 'pyfiglet', 'rich', 'PyInquirer']
+# Written once the checks pass for an interpreter, so later starts skip them
+SETUP_STAMP_FNAME = '.setup-ok'
+
 def need_setup():
-    # deps installed?
+    stamp_path = os.path.join(DATA_DNAME, SETUP_STAMP_FNAME)
     try:
-        import cryptography.fernet
-        import pyfiglet
-        import rich
-        import PyInquirer
-    except ModuleNotFoundError:
-        return True
+        with open(stamp_path) as f:
+            if f.read() == sys.executable:
+                return False
+    except OSError:
+        pass
+
+    # deps installed? Checked without importing them, which would take longer than the rest of startup
+    from importlib.util import find_spec
+    for module_name in REQUIRED_MODULES:
+        if find_spec(module_name) is None:
+            return True
     
     # Data dir present?
-    import os
-    if DATA_DNAME not in os.listdir("."):
+    if not os.path.isdir(DATA_DNAME):
         os.mkdir(DATA_DNAME)
     
+    with open(stamp_path, 'w') as f:
+        f.write(sys.executable)
     return False
 
 def run():
     if need_setup():
+        import pypass_setup
         pypass_setup.run_setup()
     try:
         from pypass.pypass import main as pypass_main
@@ -30,4 +40,4 @@ def run():
         sys.exit(1)
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()